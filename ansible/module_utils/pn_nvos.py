@@ -1,5 +1,61 @@
 #!/usr/bin/python
 
+import atexit
+import bisect
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+
+# Directory on the switch holding the command journals of failed module runs.
+JOURNAL_DIR = os.path.join(tempfile.gettempdir(), 'pn-journal')
+JOURNAL = None
+# Seconds after which the journal of a failed module run is not resumed.
+JOURNAL_TTL = 3600
+
+# Directory on the switch holding the input fingerprints of converged stages.
+FINGERPRINT_DIR = os.path.join(tempfile.gettempdir(), 'pn-fingerprint')
+# Fabric transaction ids move with every configuration change of the fabric.
+CONFIG_COUNTER_CLI = ' switch-local fabric-node-show format fab-tid '
+CONFIG_COUNTER_CLI += ' no-show-headers '
+# Switch-local objects are not fabric transactions, so the fingerprint of a
+# module writing them is also keyed on what these fabric-wide shows print.
+TRUNK_STATE_CLI = ' trunk-show format switch,name,ports parsable-delim , '
+VLAN_STATE_CLI = ' vlan-show format switch,id parsable-delim , '
+STP_STATE_CLI = ' stp-show format switch,enable parsable-delim , '
+PORT_STATE_CLI = ' port-config-show format switch,port,enable '
+PORT_STATE_CLI += ' parsable-delim , '
+
+# Errors after which a show command is retried instead of failing the module,
+# as the cli prints them, without the leading command name.
+TRANSIENT_ERRORS = ('switch is busy', 'transaction in progress',
+                    'connection timed out', 'try again later',
+                    'resource temporarily unavailable')
+# Errors a write command is rejected with before it gets applied, the only
+# ones a write is retried on.
+REJECTED_ERRORS = ('transaction in progress',)
+CLI_RETRIES = 4
+CLI_RETRY_DELAY = 1
+CLI_STATS = {'retries': 0}
+
+# Seconds after which a single cli command gets killed.
+CLI_TIMEOUT = 300
+TIMEOUT_RC = -9
+# Return code of a command not started as the module ran out of time.
+BUDGET_RC = -1
+DEADLINE = {'expires': None}
+
+# Serializes the journal and the statistics across worker threads.
+CLI_LOCK = threading.RLock()
+
+
 def pn_cli(module, switch=None, username=None, password=None, switch_local=None):
     """
     Method to generate the cli portion to launch the Netvisor cli.
@@ -19,6 +75,1137 @@ def pn_cli(module, switch=None, username=None, password=None, switch_local=None)
     return cli
 
 
+def cli_command_name(cli):
+    """
+    Method to find the nvOS command name in a cli.
+    :param cli: The cli command split into a list of arguments.
+    :return: The command name (e.g. vlan-create) or None.
+    """
+    args = iter(cli[1:])
+    for arg in args:
+        if arg == '--user' or arg == 'switch':
+            next(args, None)
+        elif arg.startswith('-') or arg == 'switch-local':
+            continue
+        else:
+            return arg
+
+    return None
+
+
+def is_transient_error(err, write=False):
+    """
+    Method to check whether a cli error is worth retrying. The error has to
+    be one of the known errors exactly, so that a write which might have been
+    applied is never issued twice.
+    :param err: Error returned by the cli command.
+    :param write: Whether the command changes the configuration.
+    :return: True if the error is transient, False otherwise.
+    """
+    err = err.strip().lower()
+    name, colon, message = err.partition(':')
+    if colon and ' ' not in name:
+        # Drop the leading command name, e.g. 'vlan-show: '.
+        err = message.strip()
+
+    return err in (REJECTED_ERRORS if write else TRANSIENT_ERRORS)
+
+
+def cli_retries():
+    """
+    Method to find how many cli commands got retried during the module run.
+    :return: The number of retries.
+    """
+    return CLI_STATS['retries']
+
+
+def set_deadline(seconds):
+    """
+    Method to bound the time the module run may spend executing commands.
+    :param seconds: The time budget of the module run, None for no budget.
+    """
+    if seconds:
+        DEADLINE['expires'] = time.time() + int(seconds)
+    else:
+        DEADLINE['expires'] = None
+
+
+def time_left():
+    """
+    Method to find the time left before the deadline of the module run.
+    :return: Seconds left or None if the module run has no deadline.
+    """
+    if DEADLINE['expires'] is None:
+        return None
+
+    return max(DEADLINE['expires'] - time.time(), 0)
+
+
+def run_command_timeout(cli, timeout=None):
+    """
+    Method to execute a command, killing it once it runs out of time.
+    :param cli: The command split into a list of arguments.
+    :param timeout: Seconds the command may run, defaults to CLI_TIMEOUT.
+    It never exceeds the time left before the deadline of the module run.
+    :return: Tuple of return code, output and error of the command.
+    """
+    timeout = timeout or CLI_TIMEOUT
+    remaining = time_left()
+    if remaining is not None:
+        if remaining <= 0:
+            return BUDGET_RC, '', 'Time budget of the module exhausted'
+        timeout = min(timeout, remaining)
+
+    try:
+        process = subprocess.Popen(cli, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True, close_fds=True)
+    except OSError as error:
+        return 127, '', str(error)
+    killed = []
+
+    def kill():
+        killed.append(True)
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        out, err = process.communicate()
+    finally:
+        timer.cancel()
+
+    if killed:
+        return TIMEOUT_RC, out, 'Command timed out after %d seconds' % timeout
+
+    return process.returncode, out, err
+
+
+def timed_out(rc):
+    """
+    Method to check whether a command got killed for hanging or was not run
+    as the time budget of the module run was exhausted.
+    :param rc: Return code of the command.
+    :return: True if the command ran out of time, False otherwise.
+    """
+    return rc in (TIMEOUT_RC, BUDGET_RC)
+
+
+def is_write_command(cli):
+    """
+    Method to check whether a cli changes the configuration of a switch.
+    :param cli: The cli command split into a list of arguments.
+    :return: False for show/info commands, True otherwise.
+    """
+    name = cli_command_name(cli)
+    if name is None:
+        return False
+
+    return not (name.endswith('-show') or name.endswith('-info'))
+
+
+class CommandJournal(object):
+    """
+    Per-host journal of the cli commands executed by a module run.
+    A run which fails leaves its journal behind, stamped with the
+    configuration change counter of the fabric, and a re-run with the same
+    input replays the recorded outputs, up to the last write command which
+    went through, instead of executing them again. The journal is dropped
+    once the fabric changed since or it got older than JOURNAL_TTL.
+    """
+
+    def __init__(self, path, counter=None):
+        self.path = path
+        self.replay = []
+        self.replayed = 0
+        self.resumable = False
+
+        previous = []
+        stamp = None
+        if os.path.exists(path):
+            with open(path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if 'cli' in entry:
+                        previous.append(entry)
+                    else:
+                        stamp = entry
+
+        if (stamp is None or counter is None or
+                stamp.get('counter') != counter or
+                time.time() - stamp.get('time', 0) > JOURNAL_TTL):
+            previous = []
+
+        # Reads issued after the last confirmed write are executed again.
+        confirmed = 0
+        for index, entry in enumerate(previous):
+            if entry['write'] and not entry['err']:
+                confirmed = index + 1
+        self.replay = previous[:confirmed]
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.handle = os.fdopen(fd, 'w')
+        for entry in self.replay:
+            self.handle.write(json.dumps(entry) + '\n')
+        self.handle.flush()
+        self.replay.reverse()
+
+    def lookup(self, command):
+        """
+        Method to fetch the recorded outcome of the next command to replay.
+        :param command: The cli command as recorded in the journal.
+        :return: The journal entry or None once the run diverges from it.
+        """
+        if self.replay and self.replay[-1]['cli'] == command:
+            self.replayed += 1
+            return self.replay.pop()
+
+        self.replay = []
+        return None
+
+    def record(self, command, write, rc, out, err):
+        """
+        Method to append the outcome of an executed command to the journal.
+        :param command: The cli command as recorded in the journal.
+        :param write: Flag indicating whether the command is a write.
+        :param rc: Return code of the command.
+        :param out: Output of the command.
+        :param err: Error of the command.
+        """
+        self.handle.write(json.dumps({
+            'cli': command,
+            'write': write,
+            'rc': rc,
+            'out': out,
+            'err': err
+        }) + '\n')
+        self.handle.flush()
+
+    def close(self, module):
+        """
+        Method to close the journal, removing it unless the run failed.
+        :param module: The Ansible module to fetch input parameters.
+        """
+        if self.resumable:
+            self.handle.write(json.dumps({
+                'counter': config_counter(module),
+                'time': time.time()
+            }) + '\n')
+        self.handle.close()
+        if not self.resumable and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def watch(self, module):
+        """
+        Method to mark the journal resumable once the module run exits with a
+        failure.
+        :param module: The Ansible module to fetch input parameters.
+        """
+        journal = self
+
+        def watched(method, failed):
+            def exit_module(*args, **kwargs):
+                if failed or kwargs.get('failed'):
+                    journal.resumable = True
+                return method(*args, **kwargs)
+            return exit_module
+
+        module.exit_json = watched(module.exit_json, False)
+        module.fail_json = watched(module.fail_json, True)
+
+
+def input_digest(module):
+    """
+    Method to identify the module run by the module name and its input.
+    :param module: The Ansible module to fetch input parameters.
+    :return: String made of the module name and a hash of its parameters.
+    """
+    name = getattr(module, '_name', None) or os.path.basename(sys.argv[0])
+    params = json.dumps(module.params, sort_keys=True, default=str)
+    digest = hashlib.sha1((name + params).encode('utf-8')).hexdigest()
+    return '%s-%s' % (os.path.splitext(name)[0], digest[:16])
+
+
+def get_journal(module):
+    """
+    Method to open the command journal of the current module run.
+    :param module: The Ansible module to fetch input parameters.
+    :return: The CommandJournal or None if journaling is not possible.
+    """
+    global JOURNAL
+    if JOURNAL is None:
+        # Worker threads exit through the module of the main thread.
+        if isinstance(module, WorkerModule):
+            module = module.module
+        path = os.path.join(JOURNAL_DIR, input_digest(module) + '.journal')
+        try:
+            if not os.path.isdir(JOURNAL_DIR):
+                os.makedirs(JOURNAL_DIR, 0o700)
+            counter = None
+            if os.path.exists(path):
+                counter = config_counter(module)
+            JOURNAL = CommandJournal(path, counter)
+            JOURNAL.watch(module)
+            atexit.register(JOURNAL.close, module)
+        except (IOError, OSError):
+            JOURNAL = False
+
+    return JOURNAL or None
+
+
+def execute_cli(module, cli, timeout=None):
+    """
+    Method to execute the cli command on the target node(s), retrying it on
+    transient errors and recording its outcome in the command journal of the
+    module run.
+    :param module: The Ansible module to fetch input parameters.
+    :param cli: The cli command split into a list of arguments.
+    :param timeout: Seconds the command may run, defaults to CLI_TIMEOUT.
+    :return: Tuple of return code, output and error of the command.
+    """
+    with CLI_LOCK:
+        journal = get_journal(module)
+    # Never write the cli credentials into the journal.
+    args = list(cli)
+    if '--user' in args:
+        index = args.index('--user')
+        del args[index:index + 2]
+    command = ' '.join(args)
+    # The vrouter map no longer holds once a vrouter comes or goes.
+    invalidates_vrouters = cli_command_name(cli) in ('vrouter-create',
+                                                     'vrouter-delete')
+
+    if journal is not None:
+        with CLI_LOCK:
+            entry = journal.lookup(command)
+        if entry is not None:
+            if invalidates_vrouters:
+                VROUTERS.invalidate()
+            return entry['rc'], entry['out'], entry['err']
+
+    rc, out, err = run_command_timeout(cli, timeout)
+    attempt = 0
+    write = is_write_command(cli)
+    # A command which ran out of time is reported rather than run again.
+    while (err and not timed_out(rc) and attempt < CLI_RETRIES and
+           is_transient_error(err, write)):
+        # Back off exponentially: 1, 2, 4, 8 seconds.
+        delay = CLI_RETRY_DELAY * (2 ** attempt)
+        remaining = time_left()
+        if remaining is not None and remaining <= delay:
+            break
+        time.sleep(delay)
+        attempt += 1
+        with CLI_LOCK:
+            CLI_STATS['retries'] += 1
+        rc, out, err = run_command_timeout(cli, timeout)
+
+    if journal is not None:
+        with CLI_LOCK:
+            journal.record(command, write, rc, out, err)
+
+    if invalidates_vrouters:
+        VROUTERS.invalidate()
+
+    return rc, out, err
+
+
+def config_counter(module, local_state=()):
+    """
+    Method to read the configuration change counter of the fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :param local_state: Show commands of the switch-local objects the module
+    writes, whose output gets folded into the counter.
+    :return: The counter or None if it could not be read.
+    """
+    cli = shlex.split(pn_cli(module) + CONFIG_COUNTER_CLI)
+    rc, out, err = run_command_timeout(cli)
+    if err or not out.strip():
+        return None
+
+    counter = ' '.join(sorted(out.split()))
+    if local_state:
+        digest = hashlib.sha1()
+        for show in local_state:
+            cli = shlex.split(pn_cli(module) + show)
+            rc, out, err = run_command_timeout(cli)
+            if err:
+                return None
+            # Fabric-wide shows list the switches in no fixed order.
+            lines = sorted(out.splitlines())
+            digest.update('\n'.join(lines).encode('utf-8'))
+        counter += ' ' + digest.hexdigest()[:16]
+
+    return counter
+
+
+def fingerprint_path(module):
+    """
+    Method to find the file holding the fingerprint of the module input.
+    :param module: The Ansible module to fetch input parameters.
+    :return: Path of the fingerprint file.
+    """
+    return os.path.join(FINGERPRINT_DIR, input_digest(module) + '.fingerprint')
+
+
+def exit_if_converged(module, switch, task, local_state=()):
+    """
+    Method to end the module run right away when the last run with the same
+    input succeeded and the fabric configuration did not change since.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of the switch to report in the summary.
+    :param task: Name of the task to report.
+    :param local_state: Show commands of the switch-local objects the module
+    writes, see config_counter().
+    """
+    path = fingerprint_path(module)
+    if not os.path.exists(path):
+        return
+
+    try:
+        with open(path) as fingerprint:
+            stored = json.load(fingerprint)
+    except (IOError, ValueError):
+        return
+
+    counter = config_counter(module, local_state)
+    if counter is not None and stored.get('counter') == counter:
+        module.exit_json(
+            unreachable=False,
+            msg='Configuration already up to date',
+            summary=[{
+                'switch': switch,
+                'output': 'No changes since the last run with the same input'
+            }],
+            exception='',
+            failed=False,
+            changed=False,
+            task=task,
+            retries=cli_retries()
+        )
+
+
+def save_fingerprint(module, local_state=()):
+    """
+    Method to remember the input of a successful module run together with
+    the configuration change counter of the fabric after the run.
+    :param module: The Ansible module to fetch input parameters.
+    :param local_state: Show commands of the switch-local objects the module
+    writes, as given to exit_if_converged().
+    """
+    counter = config_counter(module, local_state)
+    if counter is None:
+        return
+
+    try:
+        if not os.path.isdir(FINGERPRINT_DIR):
+            os.makedirs(FINGERPRINT_DIR, 0o700)
+        with open(fingerprint_path(module), 'w') as fingerprint:
+            json.dump({'counter': counter}, fingerprint)
+    except (IOError, OSError):
+        pass
+
+
+class ResultCollector(object):
+    """
+    Collector of the change records reported in the summary of a module run.
+    Every record holds the switch, the action taken, the object it was taken
+    on, whether it changed the switch, the seconds spent since the previous
+    record and a human readable output line.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.mark = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, switch, action, obj, output, changed=True):
+        """
+        Method to append a record to the summary.
+        :param switch: Name of the switch the record belongs to.
+        :param action: The action taken, usually the cli command name.
+        :param obj: The object the action was taken on.
+        :param output: Human readable description of the record.
+        :param changed: Flag indicating whether the switch got changed.
+        """
+        with self.lock:
+            now = time.time()
+            self.records.append({
+                'switch': switch,
+                'action': action,
+                'object': obj,
+                'changed': changed,
+                'duration': round(now - self.mark, 3),
+                'output': output
+            })
+            self.mark = now
+
+    @property
+    def changed(self):
+        """
+        Flag indicating whether any record changed a switch.
+        """
+        for record in self.records:
+            if record['changed']:
+                return True
+
+        return False
+
+    def summary(self):
+        """
+        Method to fetch the records for the summary of the module run.
+        :return: List of records.
+        """
+        return list(self.records)
+
+
+class WorkerExit(Exception):
+    """
+    Raised in place of exiting the module from a worker thread, carrying the
+    result the module run has to exit with.
+    """
+
+    def __init__(self, result):
+        Exception.__init__(self, result.get('msg', ''))
+        self.result = result
+
+
+class WorkerModule(object):
+    """
+    View of the Ansible module handed to worker threads. Exiting the module is
+    deferred to the main thread so that exactly one result gets reported.
+    """
+
+    def __init__(self, module):
+        self.module = module
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def exit_json(self, **kwargs):
+        raise WorkerExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise WorkerExit(kwargs)
+
+
+def run_parallel(module, function, items, workers):
+    """
+    Method to call function(module, item) for every item from a bounded pool
+    of worker threads. The first worker which exits the module ends the module
+    run once all workers are done.
+    :param module: The Ansible module to fetch input parameters.
+    :param function: Function to call for every item.
+    :param items: List of items to process.
+    :param workers: Maximum number of items processed at a time.
+    :return: List of the return values of function in the order of items.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    pending = list(range(len(items)))
+    lock = threading.Lock()
+    worker_module = WorkerModule(module)
+
+    def worker():
+        while True:
+            with lock:
+                if not pending or errors:
+                    return
+                position = pending.pop(0)
+            try:
+                results[position] = function(worker_module, items[position])
+            except Exception as error:
+                with lock:
+                    errors.append((position, error))
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        position, error = sorted(errors, key=lambda entry: entry[0])[0]
+        if isinstance(error, WorkerExit):
+            module.exit_json(**error.result)
+        raise error
+
+    return results
+
+
+def expand_ports(ports):
+    """
+    Method to expand a port list like '1-4,9' into the individual ports.
+    :param ports: Comma separated list of ports and port ranges.
+    :return: Set of port numbers, names which are not numbers are kept as is.
+    """
+    expanded = set()
+    for port in ports.split(','):
+        port = port.strip()
+        if not port:
+            continue
+        first, _, last = port.partition('-')
+        if first.isdigit() and last.isdigit():
+            expanded.update(range(int(first), int(last) + 1))
+        elif port.isdigit():
+            expanded.add(int(port))
+        else:
+            expanded.add(port)
+
+    return expanded
+
+
+def compress_ports(ports):
+    """
+    Method to compress ports into the range syntax of the cli, like '1-4,9'.
+    :param ports: Iterable of port numbers.
+    :return: Comma separated list of ports and port ranges.
+    """
+    ranges = []
+    for port in sorted(set(int(port) for port in ports)):
+        if ranges and ranges[-1][1] == port - 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+
+    return ','.join('%d' % first if first == last else '%d-%d' % (first, last)
+                    for first, last in ranges)
+
+
+def maximum_matching(nodes, neighbors):
+    """
+    Method to find a maximum matching of an undirected graph using Edmonds'
+    blossom algorithm. Nodes and neighbors are visited in the given order so
+    the same graph always yields the same matching.
+    :param nodes: List of the nodes of the graph.
+    :param neighbors: Dictionary of node to the ordered list of its neighbors.
+    :return: List of matched (node, peer) tuples, node preceding peer in nodes.
+    """
+    count = len(nodes)
+    position = dict((node, index) for index, node in enumerate(nodes))
+    adjacency = [[position[peer] for peer in neighbors.get(node, [])]
+                 for node in nodes]
+    match = [-1] * count
+
+    def lowest_common_ancestor(first, second, base, parent):
+        visited = [False] * count
+        while True:
+            first = base[first]
+            visited[first] = True
+            if match[first] == -1:
+                break
+            first = parent[match[first]]
+        while True:
+            second = base[second]
+            if visited[second]:
+                return second
+            second = parent[match[second]]
+
+    def mark_path(node, stem, child, blossom, base, parent):
+        while base[node] != stem:
+            blossom[base[node]] = blossom[base[match[node]]] = True
+            parent[node] = child
+            child = match[node]
+            node = parent[match[node]]
+
+    def find_augmenting_path(root):
+        used = [False] * count
+        parent = [-1] * count
+        base = list(range(count))
+        used[root] = True
+        queue = [root]
+        while queue:
+            node = queue.pop(0)
+            for peer in adjacency[node]:
+                if base[node] == base[peer] or match[node] == peer:
+                    continue
+                if peer == root or (match[peer] != -1 and
+                                    parent[match[peer]] != -1):
+                    stem = lowest_common_ancestor(node, peer, base, parent)
+                    blossom = [False] * count
+                    mark_path(node, stem, peer, blossom, base, parent)
+                    mark_path(peer, stem, node, blossom, base, parent)
+                    for index in range(count):
+                        if blossom[base[index]]:
+                            base[index] = stem
+                            if not used[index]:
+                                used[index] = True
+                                queue.append(index)
+                elif parent[peer] == -1:
+                    parent[peer] = node
+                    if match[peer] == -1:
+                        return peer, parent
+                    used[match[peer]] = True
+                    queue.append(match[peer])
+
+        return -1, parent
+
+    for root in range(count):
+        if match[root] != -1:
+            continue
+        node, parent = find_augmenting_path(root)
+        while node != -1:
+            previous = match[parent[node]]
+            match[node] = parent[node]
+            match[parent[node]] = node
+            node = previous
+
+    return [(nodes[index], nodes[match[index]]) for index in range(count)
+            if match[index] > index]
+
+
+def plan_leaf_clusters(module, run_cli, leaf_list, cluster_nodes=None):
+    """
+    Method to plan the clusters of the leaf switches from the lldp adjacency
+    of the whole fabric, pairing as many unclustered leafs as possible.
+    :param module: The Ansible module to fetch input parameters.
+    :param run_cli: The run_cli method of the calling module.
+    :param leaf_list: The list of leaf switches.
+    :param cluster_nodes: List of the (cluster-node-1, cluster-node-2) pairs
+    of the existing clusters, read from the fabric when None.
+    :return: Tuple of the list of (node1, node2) pairs already clustered and
+    the list of pairs to be clustered, node1 preceding node2 in leaf_list.
+    """
+    order = dict((leaf, index) for index, leaf in enumerate(leaf_list))
+    clustered = set()
+    clustered_pairs = []
+
+    if cluster_nodes is None:
+        cluster_nodes = []
+        cli = pn_cli(module)
+        cli += ' cluster-show format cluster-node-1,cluster-node-2 '
+        cli += ' parsable-delim , '
+        for line in (run_cli(module, cli) or '').splitlines():
+            nodes = line.strip().split(',')
+            if len(nodes) >= 2:
+                cluster_nodes.append(nodes[-2:])
+
+    for nodes in cluster_nodes:
+        nodes = list(nodes)
+        clustered.update(nodes)
+        if nodes[0] in order and nodes[1] in order:
+            clustered_pairs.append(tuple(sorted(nodes, key=order.get)))
+
+    unclustered = [leaf for leaf in leaf_list if leaf not in clustered]
+    adjacency = dict((leaf, set()) for leaf in unclustered)
+
+    cli = pn_cli(module)
+    cli += ' lldp-show format switch,sys-name parsable-delim , '
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        switch, neighbor = fields[-2:]
+        if switch != neighbor and switch in adjacency and \
+                neighbor in adjacency:
+            adjacency[switch].add(neighbor)
+            adjacency[neighbor].add(switch)
+
+    neighbors = dict((leaf, sorted(adjacency[leaf], key=order.get))
+                     for leaf in unclustered)
+    return (sorted(clustered_pairs, key=lambda pair: order[pair[0]]),
+            maximum_matching(unclustered, neighbors))
+
+
+def get_port_links(module, run_cli, switch):
+    """
+    Method to read the lldp neighbor and the trunk of every port of a switch
+    with a single port-show.
+    :param module: The Ansible module to fetch input parameters.
+    :param run_cli: The run_cli method of the calling module.
+    :param switch: Name of the switch.
+    :return: OrderedDict of port to (hostname, rport, trunk) in cli order,
+    trunk being empty for the ports which are not part of a trunk.
+    """
+    links = OrderedDict()
+    cli = pn_cli(module)
+    cli += ' switch %s port-show format port,hostname,rport,trunk ' % switch
+    cli += ' parsable-delim , '
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 4:
+            continue
+        port, hostname, rport, trunk = fields[-4:]
+        if port not in links or (trunk and not links[port][2]):
+            links[port] = (hostname, rport, trunk)
+
+    return links
+
+
+def ipv4_to_int(address):
+    """
+    Method to convert a dotted ipv4 address into an integer.
+    :param address: The ipv4 address without prefix length.
+    :return: The address as an integer.
+    """
+    value = 0
+    for octet in address.split('.'):
+        value = (value << 8) + int(octet)
+
+    return value
+
+
+def int_to_ipv4(value):
+    """
+    Method to convert an integer into a dotted ipv4 address.
+    :param value: The address as an integer.
+    :return: The dotted ipv4 address.
+    """
+    return '.'.join(str((value >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
+
+def ipv6_to_int(address):
+    """
+    Method to convert an ipv6 address, possibly abbreviated with '::', into
+    an integer.
+    :param address: The ipv6 address without prefix length.
+    :return: The address as an integer, ValueError is raised for an invalid
+    address.
+    """
+    head, abbreviated, tail = address.partition('::')
+    head = head.split(':') if head else []
+    tail = tail.split(':') if tail else []
+    missing = 8 - len(head) - len(tail)
+    # '::' stands for at least one group and every group has 1-4 digits.
+    if (missing < 0 or (missing > 0) != bool(abbreviated) or
+            any(not 1 <= len(group) <= 4 for group in head + tail)):
+        raise ValueError('Invalid ipv6 address %s' % address)
+
+    value = 0
+    for group in head + ['0'] * missing + tail:
+        value = (value << 16) + int(group, 16)
+
+    return value
+
+
+def ipv4_prefix_mask(prefix):
+    """
+    Method to compute the netmask of an ipv4 prefix length.
+    :param prefix: The prefix length.
+    :return: The netmask as an integer.
+    """
+    return (0xffffffff << (32 - prefix)) & 0xffffffff
+
+
+def ipv4_network(address):
+    """
+    Method to find the network of an ipv4 address in CIDR notation.
+    :param address: Address along with its prefix length.
+    :return: Network address along with its prefix length.
+    """
+    if '/' not in address:
+        return address
+
+    address, prefix = address.split('/')
+    value = ipv4_to_int(address) & ipv4_prefix_mask(int(prefix))
+    return '%s/%s' % (int_to_ipv4(value), prefix)
+
+
+class PrefixIndex(object):
+    """
+    Index of ipv4 networks in CIDR notation. Networks are kept sorted by
+    their start address so that looking up a network, or the networks
+    overlapping it, costs a binary search plus one probe per prefix length
+    in use instead of a scan of all networks.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.starts = []
+        self.prefixes = set()
+
+    @staticmethod
+    def key(network):
+        """
+        Method to compute the index key of a network.
+        :param network: Network or address along with its prefix length.
+        :return: Tuple of the network start address and prefix length.
+        """
+        address, prefix = network.split('/')
+        prefix = int(prefix)
+        return ipv4_to_int(address) & ipv4_prefix_mask(prefix), prefix
+
+    def add(self, network, value):
+        """
+        Method to add a network to the index.
+        :param network: Network or address along with its prefix length.
+        :param value: Value to keep along with the network.
+        """
+        key = self.key(network)
+        if key not in self.values:
+            bisect.insort(self.starts, key)
+            self.prefixes.add(key[1])
+        self.values[key] = value
+
+    def get(self, network, default=None):
+        """
+        Method to fetch the value of a network.
+        :param network: Network or address along with its prefix length.
+        :param default: Value returned when the network is not indexed.
+        :return: The value of the network.
+        """
+        return self.values.get(self.key(network), default)
+
+    def overlapping(self, network):
+        """
+        Method to find the indexed networks overlapping a network.
+        :param network: Network or address along with its prefix length.
+        :return: List of (network, value) tuples.
+        """
+        start, prefix = self.key(network)
+        end = start | (~ipv4_prefix_mask(prefix) & 0xffffffff)
+        keys = set()
+
+        # Networks containing the given one.
+        for length in self.prefixes:
+            if length <= prefix:
+                key = (start & ipv4_prefix_mask(length), length)
+                if key in self.values:
+                    keys.add(key)
+
+        # Networks contained in the given one.
+        position = bisect.bisect_left(self.starts, (start, 0))
+        while position < len(self.starts) and \
+                self.starts[position][0] <= end:
+            keys.add(self.starts[position])
+            position += 1
+
+        return [('%s/%s' % (int_to_ipv4(key[0]), key[1]), self.values[key])
+                for key in sorted(keys)]
+
+
+class VrouterMap(object):
+    """
+    Map between the switches and the vrouters they host, read with a single
+    vrouter-show and kept for the rest of the module run. Creating or
+    deleting a vrouter through execute_cli invalidates it.
+    """
+
+    def __init__(self):
+        self.names = None
+        self.locations = None
+        self.lock = threading.RLock()
+
+    def invalidate(self):
+        """
+        Method to drop the map so that the next lookup reads it again.
+        """
+        with self.lock:
+            self.names = None
+            self.locations = None
+
+    def load(self, module, run_cli):
+        """
+        Method to read the map unless it is loaded already.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :return: Tuple of the dictionaries of switch to vrouter name and of
+        vrouter name to switch.
+        """
+        with self.lock:
+            if self.names is None:
+                names = OrderedDict()
+                locations = {}
+                cli = pn_cli(module)
+                cli += ' vrouter-show format name,location parsable-delim , '
+                for line in (run_cli(module, cli) or '').splitlines():
+                    fields = line.strip().split(',')
+                    if len(fields) < 2:
+                        continue
+                    name, location = fields[-2:]
+                    names[location] = name
+                    locations[name] = location
+                self.names, self.locations = names, locations
+
+            return self.names, self.locations
+
+    def vrouter(self, module, run_cli, switch):
+        """
+        Method to find the vrouter hosted by a switch.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :param switch: Name of the switch.
+        :return: Name of the vrouter or None.
+        """
+        return self.load(module, run_cli)[0].get(switch)
+
+    def switch(self, module, run_cli, vrouter):
+        """
+        Method to find the switch hosting a vrouter.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :param vrouter: Name of the vrouter.
+        :return: Name of the switch or None.
+        """
+        return self.load(module, run_cli)[1].get(vrouter)
+
+    def vrouters(self, module, run_cli):
+        """
+        Method to list the vrouters of the fabric.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :return: List of vrouter names.
+        """
+        return list(self.load(module, run_cli)[0].values())
+
+
+VROUTERS = VrouterMap()
+
+
+class OspfBfdConfig(object):
+    """
+    Snapshot of the vrouter interfaces of the fabric and their ospf-bfd
+    configuration. The fabric is read once, with two cli calls, so that
+    ospf-bfd gets enabled only on the nics where it is not enabled yet
+    instead of looking every interface up one call at a time.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.nics = {}
+        self.status = {}
+        self.lock = threading.RLock()
+
+    def load_interfaces(self, module, run_cli, vrouter=None):
+        """
+        Method to read the nics of the vrouter interfaces along with their
+        addresses.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :param vrouter: Name of the vrouter to read, all when None.
+        """
+        cli = pn_cli(module)
+        cli += ' vrouter-interface-show '
+        if vrouter:
+            cli += ' vrouter-name %s ' % vrouter
+        cli += ' format vrouter-name,nic,ip,ip2 parsable-delim , '
+        for line in run_cli(module, cli).splitlines():
+            fields = line.strip().split(',')
+            if len(fields) < 4:
+                continue
+            name, nic, ip, ip2 = fields[-4:]
+            for address in (ip, ip2):
+                if address:
+                    self.nics[(name, address.split('/')[0])] = nic
+
+    def load(self, module, run_cli):
+        """
+        Method to read the vrouter interfaces and the ospf-bfd configuration
+        of the interfaces.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        """
+        self.load_interfaces(module, run_cli)
+
+        cli = pn_cli(module)
+        cli += ' vrouter-interface-config-show '
+        cli += ' format vrouter-name,nic,ospf-bfd parsable-delim , '
+        for line in run_cli(module, cli).splitlines():
+            fields = line.strip().split(',')
+            if len(fields) < 3:
+                continue
+            self.status[tuple(fields[-3:-1])] = fields[-1]
+
+        self.loaded = True
+
+    def enable(self, module, run_cli, vrouter, ip):
+        """
+        Method to enable ospf-bfd on the vrouter interface owning an address.
+        :param module: The Ansible module to fetch input parameters.
+        :param run_cli: Method executing a cli string on the fabric.
+        :param vrouter: Name of the vrouter.
+        :param ip: Address of the interface, with or without prefix length.
+        :return: Tuple of the switch, the cli command issued and the nic, or
+        None when ospf-bfd is already enabled.
+        """
+        ip = ip.split('/')[0]
+        with self.lock:
+            if not self.loaded:
+                self.load(module, run_cli)
+
+            if (vrouter, ip) not in self.nics:
+                # The interface got created after the snapshot was taken.
+                self.load_interfaces(module, run_cli, vrouter)
+
+            nic = self.nics.get((vrouter, ip))
+            if nic is None:
+                return None
+
+            status = self.status.get((vrouter, nic))
+            if status == 'enable':
+                return None
+
+            if status is None:
+                command = 'vrouter-interface-config-add'
+            else:
+                command = 'vrouter-interface-config-modify'
+
+            cli = pn_cli(module)
+            cli += ' %s vrouter-name %s' % (command, vrouter)
+            cli += ' nic %s ospf-bfd enable' % nic
+            if 'Success' not in run_cli(module, cli):
+                return None
+
+            self.status[(vrouter, nic)] = 'enable'
+            switch = VROUTERS.switch(module, run_cli, vrouter)
+            return switch or vrouter, command, nic
+
+
+def hold_auto_trunk(module, run_cli, switches, held):
+    """
+    Method to disable auto-trunk on those of the switches where it is
+    enabled, keeping the links a stage converts to l3 from getting trunked.
+    :param module: The Ansible module to fetch input parameters.
+    :param run_cli: Method executing a cli string on the fabric.
+    :param switches: List of the switch names.
+    :param held: List the switches get appended to as soon as auto-trunk got
+    disabled on them, so that a run failing half way still knows what to hand
+    to release_auto_trunk().
+    :return: The held list.
+    """
+    for switch in switches:
+        cli = pn_cli(module)
+        cli += ' switch %s system-settings-show ' % switch
+        cli += ' format auto-trunk no-show-headers '
+        if 'on' in (run_cli(module, cli) or '').split():
+            cli = pn_cli(module)
+            cli += ' switch %s system-settings-modify no-auto-trunk ' % switch
+            run_cli(module, cli)
+            held.append(switch)
+
+    return held
+
+
+def release_auto_trunk(module, held):
+    """
+    Method to enable auto-trunk again on the switches hold_auto_trunk()
+    disabled it on. It never exits the module, so that it can run while a
+    failed module run is exiting.
+    :param module: The Ansible module to fetch input parameters.
+    :param held: List of the switches filled by hold_auto_trunk().
+    :return: List of the switches auto-trunk could not be enabled on.
+    """
+    failed = []
+    for switch in held:
+        cli = pn_cli(module)
+        cli += ' switch %s system-settings-modify auto-trunk ' % switch
+        rc, out, err = execute_cli(module, shlex.split(cli))
+        if err:
+            failed.append(switch)
+
+    return failed
+
+
 def calculate_link_ip_addresses_ipv4(address_str, cidr_str, supernet_str):
     """
     Method to calculate link IPs for layer 3 fabric.
@@ -22,7 +22,10 @@ import shlex
 import time
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import set_deadline, run_command_timeout
+from ansible.module_utils.pn_nvos import timed_out
+from ansible.module_utils.pn_nvos import expand_ports, compress_ports
 
 DOCUMENTATION = """
 ---
@@ -76,6 +79,12 @@ options:
         - Flag to enable/disable auto-neg for T2+ platforms.
       required: False
       type: bool
+    pn_timeout_budget:
+      description:
+        - Seconds the module may spend in total before pending cli commands
+          get killed and the task fails. No budget by default.
+      required: False
+      type: int
 """
 
 EXAMPLES = """
@@ -116,6 +125,10 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
@@ -130,7 +143,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -147,7 +160,8 @@ def run_cli(module, cli):
             summary=results,
             task='Fabric creation',
             msg='Fabric creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
@@ -442,36 +456,47 @@ def ports_modify_jumbo(module, modify_flag):
     Method to enable/disable Jumbo flag on a switch ports.
     :param module: The Ansible module to fetch input parameters.
     :param modify_flag: Enable/disable flag to set.
-    :return: The output of run_cli() method.
+    :return: The output of run_cli() method or an empty string if no port
+    needed a change.
     """
     cli = pn_cli(module)
     clicopy = cli
-    trunk_ports = []
-    cli += ' switch-local port-show format port,trunk status trunk no-show-headers'
-    cli_out = run_cli(module, cli)
-    if cli_out is None:
-        pass
-    else:
-        cli_out = cli_out.strip().split('\n')
-        for output in cli_out:
-            output = output.strip().split()
-            port, trunk_name = output[0], output[1]
-            trunk_ports.append(port)
+    jumbo = modify_flag == 'jumbo'
+    trunk_ports = set()
+    output = ''
+
+    # One row per trunk, along with its member ports and jumbo state.
+    cli += ' switch-local trunk-show format name,ports,jumbo parsable-delim ; '
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 3:
+            continue
+        trunk_name, ports, trunk_jumbo = fields[-3:]
+        trunk_ports.update(expand_ports(ports))
+        if (trunk_jumbo == 'on') != jumbo:
             cli = clicopy
-            cli += 'trunk-modify name %s jumbo ' % trunk_name
-            run_cli(module, cli)
+            cli += 'trunk-modify name %s %s ' % (trunk_name, modify_flag)
+            output = run_cli(module, cli)
 
     cli = clicopy
-    cli += ' switch-local port-config-show format port no-show-headers'
-    ports = run_cli(module, cli).split()
-    ports_to_modify = list(set(ports) - set(trunk_ports))
-    ports_to_modify = ','.join(ports_to_modify)
-    cli = clicopy
-    cli += ' switch-local port-config-modify port %s %s' \
-           % (ports_to_modify, modify_flag)
+    cli += ' switch-local port-config-show format port,jumbo '
+    cli += ' parsable-delim , '
+    ports_to_modify = set()
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2 or not fields[-2].isdigit():
+            continue
+        port, port_jumbo = int(fields[-2]), fields[-1]
+        if port not in trunk_ports and (port_jumbo == 'on') != jumbo:
+            ports_to_modify.add(port)
 
-    return run_cli(module, cli)
+    if ports_to_modify:
+        cli = clicopy
+        cli += ' switch-local port-config-modify port %s %s' \
+               % (compress_ports(ports_to_modify), modify_flag)
+        output = run_cli(module, cli)
 
+    return output
 
 def configure_control_network(module):
     """
@@ -555,7 +580,7 @@ def modify_auto_neg(module):
     cli = pn_cli(module)
     cli += ' switch-local bezel-portmap-show format port no-show-headers '
     cli = shlex.split(cli)
-    out = module.run_command(cli)[1]
+    out = run_command_timeout(cli)[1]
     all_ports = out.splitlines()
     all_ports = [port.strip() for port in all_ports]
     time.sleep(1)
@@ -563,7 +588,7 @@ def modify_auto_neg(module):
     cli = pn_cli(module)
     cli += ' switch-local lldp-show format local-port no-show-headers '
     cli = shlex.split(cli)
-    out = module.run_command(cli)[1]
+    out = run_command_timeout(cli)[1]
     lldp_ports = out.splitlines()
     lldp_ports = [port.strip() for port in lldp_ports]
     time.sleep(1)
@@ -573,13 +598,13 @@ def modify_auto_neg(module):
     cli += ' switch-local port-config-modify port ' + ','.join(idle_ports)
     cli += ' autoneg '
     cli = shlex.split(cli)
-    module.run_command(cli)
+    run_command_timeout(cli)
     time.sleep(1)
 
     cli = pn_cli(module)
     cli += ' switch-local lldp-show format local-port no-show-headers '
     cli = shlex.split(cli)
-    out = module.run_command(cli)[1]
+    out = run_command_timeout(cli)[1]
     lldp_ports = out.splitlines()
     lldp_ports = [port.strip() for port in lldp_ports]
     time.sleep(1)
@@ -588,7 +613,8 @@ def modify_auto_neg(module):
     cli = pn_cli(module)
     cli += ' switch-local port-config-modify port ' + ','.join(idle_ports)
     cli += ' no-autoneg '
-    module.run_command(cli)
+    cli = shlex.split(cli)
+    run_command_timeout(cli)
     time.sleep(1)
 
     return "Auto-neg Configured"
@@ -645,7 +671,23 @@ def configure_fabric(module):
     cli = pn_cli(module)
     cli += ' fabric-info format name no-show-headers '
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = run_command_timeout(cli)
+
+    # A hanging fabric-info says nothing about the fabric of the switch.
+    if timed_out(rc):
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception=err.strip(),
+            summary=[{
+                'switch': switch,
+                'output': u'Operation Failed: {}'.format(' '.join(cli))
+            }],
+            task='Fabric creation',
+            msg='Fabric creation failed',
+            changed=False,
+            retries=cli_retries()
+        )
 
     # Above fabric-info cli command will throw an error, if switch is not part
     # of any fabric. So if err, we need to create/join the fabric.
@@ -664,7 +706,8 @@ def configure_fabric(module):
                     summary=results,
                     task='Fabric creation',
                     msg='Fabric creation failed',
-                    changed=False
+                    changed=False,
+                    retries=cli_retries()
                 )
 
             new_fabric = False
@@ -703,9 +746,12 @@ def main():
         pn_ntp_server=dict(required=False, type='str', default=''),
         pn_autotrunk=dict(required=False, type='str',
                           choices=['enable', 'disable'], default='disable'),
-        pn_autoneg=dict(required=False, type='bool', default=False), )
+        pn_autoneg=dict(required=False, type='bool', default=False),
+        pn_timeout_budget=dict(required=False, type='int'), )
     )
 
+    set_deadline(module.params['pn_timeout_budget'])
+
     global CHANGED_FLAG
     results = []
     switch = module.params['pn_switch']
@@ -791,7 +837,8 @@ def main():
         exception='',
         task='Fabric creation',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=True if True in CHANGED_FLAG else False,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+""" PN Auto-trunk Bracket """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import shlex
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import ResultCollector
+from ansible.module_utils.pn_nvos import hold_auto_trunk, release_auto_trunk
+
+DOCUMENTATION = """
+---
+module: pn_auto_trunk_bracket
+author: 'Pluribus Networks (devops@pluribusnetworks.com)'
+description:
+    Module to keep auto-trunk disabled on the switches of the fabric for the
+    whole of a stage converting links to l3. Run it once with run_once
+    before the stage to hold the switches, and once from the always section
+    of the block holding the stage to release the switches the hold
+    returned, also when the hold or the stage failed.
+options:
+    pn_action:
+      description:
+        - hold disables auto-trunk on the switches where it is enabled,
+          release enables it again.
+      required: True
+      type: str
+      choices: ['hold', 'release']
+    pn_switch_list:
+      description:
+        - Switches to hold, or the switches returned by the hold to release.
+      required: False
+      type: list
+      default: []
+"""
+
+EXAMPLES = """
+- block:
+    - name: Disable auto-trunk for the stage
+      pn_auto_trunk_bracket:
+        pn_action: hold
+        pn_switch_list: "{{ groups['spine'] + groups['leaf'] }}"
+      register: auto_trunk_out
+      run_once: true
+
+    - name: Auto configure link IPs
+      pn_ztp_l3_links:
+        pn_current_switch: "{{ inventory_hostname }}"
+  always:
+    - name: Restore auto-trunk after the stage
+      pn_auto_trunk_bracket:
+        pn_action: release
+        pn_switch_list: "{{ auto_trunk_out.held | default([]) }}"
+      run_once: true
+"""
+
+RETURN = """
+held:
+  description: Switches auto-trunk got disabled on by a hold, also when the
+    hold failed half way.
+  returned: always
+  type: list
+summary:
+  description: It contains output of each configuration along with switch name.
+  returned: always
+  type: list
+changed:
+  description: Indicates whether the CLI caused changes on the target.
+  returned: always
+  type: bool
+unreachable:
+  description: Indicates whether switch was unreachable to connect.
+  returned: always
+  type: bool
+failed:
+  description: Indicates whether or not the execution failed on the target.
+  returned: always
+  type: bool
+exception:
+  description: Describes error/exception occurred while executing CLI command.
+  returned: always
+  type: str
+task:
+  description: Name of the task getting executed on switch.
+  returned: always
+  type: str
+msg:
+  description: Indicates whether configuration made was successful or failed.
+  returned: always
+  type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
+"""
+
+RESULTS = ResultCollector()
+HELD = []
+
+
+def run_cli(module, cli):
+    """
+    Execute the cli command on the target node(s) and returns the output.
+    :param module: The Ansible module to fetch input parameters.
+    :param cli: The complete cli string to be executed on the target node(s).
+    :return: Output or Error msg depending upon the response from cli else None.
+    """
+    results = []
+    cli = shlex.split(cli)
+    rc, out, err = execute_cli(module, cli)
+
+    if out:
+        return out
+    if err:
+        json_msg = {
+            'switch': '',
+            'output': u'Operation Failed: {}'.format(' '.join(cli))
+        }
+        results.append(json_msg)
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception=err.strip(),
+            summary=results,
+            task='Auto-trunk bracket',
+            msg='Auto-trunk bracket failed',
+            changed=bool(HELD),
+            held=HELD,
+            retries=cli_retries()
+        )
+    else:
+        return 'Success'
+
+
+def main():
+    """ This section is for arguments parsing """
+    module = AnsibleModule(
+        argument_spec=dict(
+            pn_action=dict(required=True, type='str',
+                           choices=['hold', 'release']),
+            pn_switch_list=dict(required=False, type='list', default=[]),
+        )
+    )
+
+    switch_list = module.params['pn_switch_list']
+
+    if module.params['pn_action'] == 'hold':
+        hold_auto_trunk(module, run_cli, switch_list, HELD)
+        for switch in HELD:
+            RESULTS.add(switch, 'system-settings-modify', 'auto-trunk',
+                        'Auto-trunk disabled')
+    else:
+        unrestored = release_auto_trunk(module, switch_list)
+        for switch in switch_list:
+            if switch not in unrestored:
+                RESULTS.add(switch, 'system-settings-modify', 'auto-trunk',
+                            'Auto-trunk enabled')
+        if unrestored:
+            module.exit_json(
+                unreachable=False,
+                failed=True,
+                exception='Could not enable auto-trunk again',
+                summary=[{
+                    'switch': switch,
+                    'output': 'Auto-trunk left disabled, enable it manually'
+                } for switch in unrestored],
+                task='Auto-trunk bracket',
+                msg='Auto-trunk bracket failed',
+                changed=RESULTS.changed,
+                held=[],
+                retries=cli_retries()
+            )
+
+    # Exit the module and return the required JSON.
+    module.exit_json(
+        unreachable=False,
+        msg='Auto-trunk bracket succeeded',
+        summary=RESULTS.summary(),
+        exception='',
+        failed=False,
+        changed=RESULTS.changed,
+        held=HELD,
+        task='Auto-trunk bracket',
+        retries=cli_retries()
+    )
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,8 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
 
 DOCUMENTATION = """
 ---
@@ -72,6 +73,10 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
@@ -86,7 +91,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -103,7 +108,8 @@ def run_cli(module, cli):
             summary=results,
             task='Create cluster',
             msg='Cluster creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
@@ -153,6 +159,9 @@ def main():
         )
     )
 
+    exit_if_converged(module, (module.params['pn_switch_list'] or [''])[0],
+                      'Create clusters')
+
     global CHANGED_FLAG
     results = []
     message = ''
@@ -171,6 +180,8 @@ def main():
                     'output': (line.replace(replace_string, '')).strip()
                 })
 
+    save_fingerprint(module)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -179,7 +190,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Create clusters'
+        task='Create clusters',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -20,8 +20,14 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import TRUNK_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector, expand_ports
+from ansible.module_utils.pn_nvos import hold_auto_trunk, release_auto_trunk
 
 DOCUMENTATION = """
 ---
@@ -60,7 +66,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -85,9 +91,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -99,7 +111,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -116,120 +128,158 @@ def run_cli(module, cli):
             summary=results,
             task='Configure eBGP',
             msg='eBGP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def vrouter_interface_bgp_add(module, switch_name, l3_port, interface_ip,
-                              vrouter, neighbor_ip, remote_as):
+def get_switch_snapshot(module, switch):
     """
-    Method to create interfaces and add bgp neighbors.
+    Method to read the vrouter, trunks, interfaces and bgp neighbors of a
+    switch.
     :param module: The Ansible module to fetch input parameters.
-    :param switch_name: The name of the switch to run interface.
-    :param l3_port: The l3-port number to be used to create interface.
-    :param interface_ip: Interface ip to create a vrouter interface.
-    :param neighbor_ip: Neighbor_ip for the ibgp neighbor.
-    :param remote_as: Bgp-as for remote switch.
-    :return: String describing if ibgp neighbours got added or already exists.
+    :param switch: Name of the switch.
+    :return: Dictionary holding the vrouter name and bgp-as, a dictionary of
+    port to the trunk containing it, the set of (ip, l3-port) interfaces and
+    the set of (neighbor, remote-as) bgp neighbors.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
+    cli += ' vrouter-show location %s ' % switch
+    cli += ' format name,bgp-as parsable-delim , '
+    fields = run_cli(module, cli).split()[0].split(',')
+    snapshot = {
+        'vrouter': fields[0],
+        'bgp-as': fields[1] if len(fields) > 1 else '',
+        'trunks': {},
+        'interfaces': set(),
+        'neighbors': set()
+    }
 
     cli = clicopy
-    cli += ' vrouter-interface-show ip %s l3-port %s' % (interface_ip, l3_port)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
-
-    if vrouter not in existing_vrouter_interface:
-        cli = clicopy
-        cli += ' vrouter-interface-add vrouter-name %s ip %s l3-port %s ' % (
-            vrouter, interface_ip, l3_port
-        )
-        run_cli(module, cli)
-
-        output += '%s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
+    cli += ' switch %s trunk-show format name,ports ' % switch
+    cli += ' parsable-delim ; '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 2:
+            continue
+        for port in expand_ports(fields[-1]):
+            snapshot['trunks'][str(port)] = fields[-2]
 
     cli = clicopy
-    cli += ' vrouter-bgp-show remote-as ' + remote_as
-    cli += ' neighbor %s format switch no-show-headers' % neighbor_ip
-    already_added = run_cli(module, cli).split()
+    cli += ' vrouter-interface-show vrouter-name %s ' % snapshot['vrouter']
+    cli += ' format ip,l3-port parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        ip, l3_port = fields[-2:]
+        snapshot['interfaces'].add((ip.split('/')[0], l3_port))
 
-    if vrouter not in already_added:
-        cli = clicopy
-        cli += ' vrouter-bgp-add vrouter-name %s' % vrouter
-        cli += ' neighbor %s remote-as %s' % (neighbor_ip,
-                                              remote_as)
-
-        if 'Success' in run_cli(module, cli):
-            output += '%s: Added BGP neighbor %s for %s \n' % (switch_name,
-                                                               neighbor_ip, vrouter)
-            CHANGED_FLAG.append(True)
+    cli = clicopy
+    cli += ' vrouter-bgp-show vrouter-name %s ' % snapshot['vrouter']
+    cli += ' format neighbor,remote-as parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        snapshot['neighbors'].add(tuple(fields[-2:]))
 
-    return output
+    return snapshot
 
 
-def modify_auto_trunk_setting(module, switch, flag):
+def delete_trunk(module, switch, snapshot, switch_port):
     """
-    Method to enable/disable auto trunk setting of a switch.
+    Method to delete a conflicting trunk on a switch.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the local switch.
-    :param flag: Enable/disable flag for the cli command.
-    :return: The output of run_cli() method.
+    :param snapshot: Snapshot of the configuration of the switch.
+    :param switch_port: The l3-port which is part of conflicting trunk for l3.
     """
+    trunk = snapshot['trunks'].get(switch_port)
+    if trunk is None:
+        return
+
     cli = pn_cli(module)
-    if flag.lower() == 'enable':
-        cli += ' switch %s system-settings-modify auto-trunk ' % switch
-        return run_cli(module, cli)
-    elif flag.lower() == 'disable':
-        cli += ' switch %s system-settings-modify no-auto-trunk ' % switch
-        return run_cli(module, cli)
+    cli += ' switch %s trunk-delete name %s ' % (switch, trunk)
+    run_cli(module, cli)
+    for port, name in list(snapshot['trunks'].items()):
+        if name == trunk:
+            del snapshot['trunks'][port]
+    RESULTS.add(switch, 'trunk-delete', trunk,
+                'Deleted %s trunk successfully' % trunk)
 
 
-def delete_trunk(module, switch, switch_port):
+def bgp_configuration(module, switch, rows, held):
     """
-    Method to delete a conflicting trunk on a switch.
+    Method to create interfaces and configure eBGP on a switch.
     :param module: The Ansible module to fetch input parameters.
-    :param switch: Name of the local switch.
-    :param switch_port: The l3-port which is part of conflicting trunk for l3.
-    :param peer_switch: Name of the peer switch.
-    :return: String describing if trunk got deleted or not.
+    :param switch: Name of the switch.
+    :param rows: List of (l3_port, interface_ip, bgp_as, neighbor_ip,
+    remote_as) tuples for the switch.
+    :param held: List of the switches auto-trunk got disabled on.
     """
-    cli = pn_cli(module)
-    clicopy = cli
+    snapshot = get_switch_snapshot(module, switch)
+    vrouter = snapshot['vrouter']
+
+    # The last row of the switch decides its bgp-as.
+    bgp_as = rows[-1][2]
+    if snapshot['bgp-as'] != bgp_as:
+        cli = pn_cli(module)
+        cli += ' vrouter-modify name %s ' % vrouter
+        cli += ' bgp-as %s ' % bgp_as
+        run_cli(module, cli)
+        snapshot['bgp-as'] = bgp_as
+        RESULTS.add(switch, 'vrouter-modify', vrouter,
+                    'Added bgp_as %s' % bgp_as)
+
+    new_interfaces = [row for row in rows
+                      if (row[1].split('/')[0], row[0])
+                      not in snapshot['interfaces']]
+    if new_interfaces:
+        # Keep the l3 ports from getting trunked again.
+        hold_auto_trunk(module, run_cli, [switch], held)
+
+    for l3_port, interface_ip, bgp_as, neighbor_ip, remote_as in rows:
+        interface = (interface_ip.split('/')[0], l3_port)
+        if interface not in snapshot['interfaces']:
+            delete_trunk(module, switch, snapshot, l3_port)
+
+            cli = pn_cli(module)
+            cli += ' vrouter-interface-add vrouter-name %s ' % vrouter
+            cli += ' ip %s l3-port %s ' % (interface_ip, l3_port)
+            run_cli(module, cli)
+            snapshot['interfaces'].add(interface)
+            RESULTS.add(switch, 'vrouter-interface-add', interface_ip,
+                        'Added vrouter interface with ip %s on %s' % (
+                            interface_ip, vrouter))
+
+        if (neighbor_ip, remote_as) not in snapshot['neighbors']:
+            cli = pn_cli(module)
+            cli += ' vrouter-bgp-add vrouter-name %s' % vrouter
+            cli += ' neighbor %s remote-as %s' % (neighbor_ip,
+                                                  remote_as)
+            run_cli(module, cli)
+            snapshot['neighbors'].add((neighbor_ip, remote_as))
+            RESULTS.add(switch, 'vrouter-bgp-add', neighbor_ip,
+                        'Added BGP neighbor %s for %s' % (neighbor_ip,
+                                                          vrouter))
 
-    cli += ' switch %s trunk-show ports %s ' % (switch, switch_port)
-    cli += ' format name no-show-headers '
-    trunk = run_cli(module, cli).split()
-    trunk = list(set(trunk))
-    if 'Success' not in trunk and len(trunk) > 0:
-        cli = clicopy
-        cli += ' switch %s trunk-delete name %s ' % (switch, trunk[0])
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' Deleted %s trunk successfully \n' % (trunk[0])
 
+def main():
+    """ This section is for arguments parsing """
+    module = AnsibleModule(
+        argument_spec=dict(
+            pn_switch_list=dict(required=True, type='list'),
+            pn_bgp_data=dict(required=False, type='str', default=''),
+        )
+    )
 
-def bgp_configuration(module):
-    """
-    Method to configure create interfaces and configure eBGP.
-    :param module: The Ansible module to fetch input parameters.
-    :return: String containing output of all the commands.
-    """
-    output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-    switch_list = module.params['pn_switch_list']
+    exit_if_converged(module, '', 'Configure eBGP', LOCAL_STATE)
 
-    # Disable auto trunk on all switches.
-    for switch in switch_list:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    switch_rows = OrderedDict()
 
     bgp_data = module.params['pn_bgp_data']
     bgp_data = bgp_data.strip()
@@ -243,60 +293,45 @@ def bgp_configuration(module):
             else:
                 elements = row.split(',')
                 switch = elements.pop(0).strip()
-                l3_port = elements.pop(0).strip()
-                interface_ip = elements.pop(0).strip()
-                bgp_as = elements.pop(0).strip()
-                neighbor_ip = elements.pop(0).strip()
-                remote_as = elements.pop(0).strip()
-
-                cli = clicopy
-                cli += ' vrouter-show location %s ' % switch
-                cli += ' format name no-show-headers '
-                vrouter_name = run_cli(module, cli).split()[0]
-
-                cli = clicopy
-                cli += ' vrouter-modify name %s ' % vrouter_name
-                cli += ' bgp-as %s ' % bgp_as
-                if 'Success' in run_cli(module, cli):
-                    output += '%s: Added bgp_as %s \n' % (switch, bgp_as)
-
-                delete_trunk(module, switch, l3_port)
-                output += vrouter_interface_bgp_add(module, switch, l3_port, interface_ip,
-                                                    vrouter_name, neighbor_ip, remote_as)
-
-    return output
-
-
-def main():
-    """ This section is for arguments parsing """
-    module = AnsibleModule(
-        argument_spec=dict(
-            pn_switch_list=dict(required=True, type='list'),
-            pn_bgp_data=dict(required=False, type='str', default=''),
+                switch_rows.setdefault(switch, []).append(
+                    tuple(element.strip() for element in elements[:5]))
+
+    held = []
+    try:
+        for switch, rows in switch_rows.items():
+            bgp_configuration(module, switch, rows, held)
+    finally:
+        # Restore auto trunk on the switches the stage disabled it on, also
+        # when a switch failed half way.
+        unrestored = release_auto_trunk(module, held)
+
+    if unrestored:
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception='Could not enable auto-trunk again',
+            summary=[{
+                'switch': switch,
+                'output': 'Auto-trunk left disabled, enable it manually'
+            } for switch in unrestored],
+            task='Configure eBGP',
+            msg='eBGP configuration failed',
+            changed=RESULTS.changed,
+            retries=cli_retries()
         )
-    )
-
-    global CHANGED_FLAG
-    results = []
-    message = ''
-
-    message += bgp_configuration(module)
 
-    for line in message.splitlines():
-        if ': ' in line:
-            return_msg = line.split(':')
-            json_msg = {'switch' : return_msg[0].strip(), 'output' : return_msg[1].strip()}
-            results.append(json_msg)
+    save_fingerprint(module, LOCAL_STATE)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         msg='eBGP configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Configure eBGP'
+        changed=RESULTS.changed,
+        task='Configure eBGP',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
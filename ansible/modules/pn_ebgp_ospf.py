@@ -20,8 +20,14 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import VLAN_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector, plan_leaf_clusters
+from ansible.module_utils.pn_nvos import OspfBfdConfig, VROUTERS
 
 DOCUMENTATION = """
 ---
@@ -113,9 +119,10 @@ EXAMPLES = """
 
 RETURN = """
 summary:
-  description: It contains output of each configuration along with switch name.
+  description: Change records with switch, action, object, changed flag,
+    duration and output of each configuration.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -140,9 +147,16 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+OSPF_BFD = OspfBfdConfig()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -154,7 +168,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -173,46 +187,87 @@ def run_cli(module, cli):
             task='Configure eBGP/OSPF',
             stderr=err.strip(),
             msg='eBGP/OSPF configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def find_bgp_as_dict(module):
+def get_cluster_index(module):
+    """
+    Method to read the clusters of the fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :return: Dictionary holding the clusters, an ordered dictionary of the
+    cluster names to their (cluster-node-1, cluster-node-2) in the order of
+    pn_leaf_list, and the nodes, a dictionary of the clustered switches to the
+    name of their cluster.
+    """
+    cluster_index = {'clusters': OrderedDict(), 'nodes': {}}
+    cli = pn_cli(module)
+    cli += ' cluster-show format name,cluster-node-1,cluster-node-2 '
+    cli += ' parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 3:
+            continue
+        add_cluster_to_index(module, cluster_index, *fields[-3:])
+
+    return cluster_index
+
+
+def add_cluster_to_index(module, cluster_index, name, node1, node2):
+    """
+    Method to record a cluster in the cluster index. The clusters are kept
+    sorted by the first of their nodes in pn_leaf_list, so that the bgp-as
+    and area ids derived from them do not depend on when a cluster got
+    created.
+    :param module: The Ansible module to fetch input parameters.
+    :param cluster_index: The index returned by get_cluster_index().
+    :param name: The name of the cluster.
+    :param node1: First node of the cluster.
+    :param node2: Second node of the cluster.
+    """
+    leaf_list = module.params['pn_leaf_list'] or []
+    order = dict((leaf, index) for index, leaf in enumerate(leaf_list))
+
+    def position(cluster):
+        nodes = cluster_index['clusters'][cluster]
+        return (min(order.get(node, len(order)) for node in nodes), cluster)
+
+    cluster_index['clusters'][name] = (node1, node2)
+    cluster_index['nodes'][node1] = name
+    cluster_index['nodes'][node2] = name
+    for cluster in sorted(cluster_index['clusters'], key=position):
+        cluster_index['clusters'][cluster] = \
+            cluster_index['clusters'].pop(cluster)
+
+
+def find_bgp_as_dict(module, cluster_index):
     """
     Method to find bgp-as for all switches and store it in a dictionary.
     :param module: The Ansible module to fetch input parameters.
+    :param cluster_index: The index returned by get_cluster_index().
     :return: Dictionary containing switch: bgp_as key value pairs.
     """
     leaf_list = module.params['pn_leaf_list']
     bgp_as = int(module.params['pn_bgp_as_range'])
     cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
     dict_bgp_as = {}
 
     for spine in module.params['pn_spine_list']:
         dict_bgp_as[spine] = str(bgp_as)
 
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
+    for cluster_nodes in cluster_index['clusters'].values():
+        if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
+            bgp_as += 1
+            dict_bgp_as[cluster_nodes[0]] = str(bgp_as)
+            dict_bgp_as[cluster_nodes[1]] = str(bgp_as)
+            cluster_leaf_list.append(cluster_nodes[0])
+            cluster_leaf_list.append(cluster_nodes[1])
 
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
-
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                bgp_as += 1
-                dict_bgp_as[cluster_nodes[0]] = str(bgp_as)
-                dict_bgp_as[cluster_nodes[1]] = str(bgp_as)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
-
-    non_clustered_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
+    non_clustered_leaf_list = [leaf for leaf in leaf_list
+                               if leaf not in cluster_leaf_list]
     for leaf in non_clustered_leaf_list:
         bgp_as += 1
         dict_bgp_as[leaf] = str(bgp_as)
@@ -229,10 +284,7 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
     :param interface_ip: Interface ip to create a vrouter interface.
     :param neighbor_ip: Neighbor_ip for the ibgp neighbor.
     :param remote_as: Bgp-as for remote switch.
-    :return: String describing if ibgp neighbours got added or already exists.
     """
-    global CHANGED_FLAG
-    output = ''
     vlan_id = module.params['pn_ibgp_vlan']
 
     cli = pn_cli(module)
@@ -245,14 +297,10 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
         cli += ' switch %s vlan-create id %s scope local ' % (switch_name,
                                                               vlan_id)
         run_cli(module, cli)
+        RESULTS.add(switch_name, 'vlan-create', vlan_id,
+                    'Created vlan with id %s' % vlan_id)
 
-        output += ' %s: Created vlan with id %s \n' % (switch_name, vlan_id)
-        CHANGED_FLAG.append(True)
-
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
@@ -265,11 +313,9 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
             vrouter, interface_ip, vlan_id
         )
         run_cli(module, cli)
-
-        output += ' %s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
+        RESULTS.add(switch_name, 'vrouter-interface-add', interface_ip,
+                    'Added vrouter interface with ip %s on %s' % (
+                        interface_ip, vrouter))
 
     neighbor_ip = neighbor_ip.split('/')[0]
     cli = clicopy
@@ -286,85 +332,55 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
             cli += ' bfd '
 
         if 'Success' in run_cli(module, cli):
-            output += ' %s: Added iBGP neighbor %s for %s \n' % (switch_name,
-                                                                 neighbor_ip,
-                                                                 vrouter)
-            CHANGED_FLAG.append(True)
-
-    return output
+            RESULTS.add(switch_name, 'vrouter-bgp-add', neighbor_ip,
+                        'Added iBGP neighbor %s for %s' % (neighbor_ip,
+                                                          vrouter))
 
 
-def assign_ibgp_interface(module, dict_bgp_as):
+def assign_ibgp_interface(module, dict_bgp_as, cluster_index):
     """
     Method to create interfaces and add ibgp neighbors.
     :param module: The Ansible module to fetch input parameters.
     :param dict_bgp_as: The dictionary containing bgp-as of all switches.
-    :return: The output of vrouter_interface_ibgp_add() method.
+    :param cluster_index: The index returned by get_cluster_index().
     """
-    output = ''
     ibgp_ip_range = module.params['pn_ibgp_ip_range']
     spine_list = module.params['pn_spine_list']
     leaf_list = module.params['pn_leaf_list']
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = ibgp_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
-
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
-
-            if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
-                ip_count = subnet_count * 4
-                ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
-                ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
-
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
-                remote_as = dict_bgp_as[cluster_node_1]
-                output += vrouter_interface_ibgp_add(module, cluster_node_1,
-                                                     ip1, ip2, remote_as)
-                output += vrouter_interface_ibgp_add(module, cluster_node_2,
-                                                     ip2, ip1, remote_as)
+    for cluster_node_1, cluster_node_2 in cluster_index['clusters'].values():
+        if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
+            ip_count = subnet_count * 4
+            ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
+            ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
 
-                subnet_count += 1
-    else:
-        output += ' No leaf clusters present to add iBGP \n'
+            remote_as = dict_bgp_as[cluster_node_1]
+            vrouter_interface_ibgp_add(module, cluster_node_1, ip1, ip2,
+                                       remote_as)
+            vrouter_interface_ibgp_add(module, cluster_node_2, ip2, ip1,
+                                       remote_as)
 
-    return output
+            subnet_count += 1
 
 
-def add_bgp_neighbor(module, dict_bgp_as):
+def add_bgp_neighbor(module, dict_bgp_as, cluster_index):
     """
     Method to add bgp_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
     :param dict_bgp_as: Dictionary containing bgp-as of all switches.
-    :return: String describing if bgp neighbors got added or not.
+    :param cluster_index: The index returned by get_cluster_index().
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
 
     for spine in module.params['pn_spine_list']:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+        vrouter_spine = VROUTERS.vrouter(module, run_cli, spine)
 
         cli = clicopy
         cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
@@ -379,10 +395,7 @@ def add_bgp_neighbor(module, dict_bgp_as):
             cli += ' format hostname no-show-headers '
             leaf = run_cli(module, cli).split()[0]
 
-            cli = clicopy
-            cli += ' vrouter-show location %s' % leaf
-            cli += ' format name no-show-headers'
-            vrouter_leaf = run_cli(module, cli).split()[0]
+            vrouter_leaf = VROUTERS.vrouter(module, run_cli, leaf)
 
             bgp_leaf = dict_bgp_as[leaf]
             bgp_spine = dict_bgp_as[spine]
@@ -409,9 +422,7 @@ def add_bgp_neighbor(module, dict_bgp_as):
             cli += ' neighbor %s format switch no-show-headers ' % ip_leaf
             already_added = run_cli(module, cli).split()
 
-            if vrouter_spine in already_added:
-                output += ''
-            else:
+            if vrouter_spine not in already_added:
                 cli = clicopy
                 cli += ' vrouter-bgp-add vrouter-name ' + vrouter_spine
                 cli += ' neighbor %s remote-as %s ' % (ip_leaf,
@@ -420,10 +431,9 @@ def add_bgp_neighbor(module, dict_bgp_as):
                     cli += ' bfd '
 
                 if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        spine, ip_leaf, vrouter_spine
-                    )
-                    CHANGED_FLAG.append(True)
+                    RESULTS.add(spine, 'vrouter-bgp-add', ip_leaf,
+                                'Added BGP Neighbor %s for %s' % (
+                                    ip_leaf, vrouter_spine))
 
             cli = clicopy
             cli += ' vrouter-bgp-show remote-as ' + bgp_spine
@@ -431,9 +441,7 @@ def add_bgp_neighbor(module, dict_bgp_as):
                 ip_spine)
             already_added = run_cli(module, cli).split()
 
-            if vrouter_leaf in already_added:
-                output += ''
-            else:
+            if vrouter_leaf not in already_added:
                 cli = clicopy
                 cli += ' vrouter-bgp-add vrouter-name ' + vrouter_leaf
                 cli += ' neighbor %s remote-as %s ' % (ip_spine,
@@ -441,21 +449,13 @@ def add_bgp_neighbor(module, dict_bgp_as):
                 if module.params['pn_bfd']:
                     cli += ' bfd '
 
-                temp_cli = clicopy
-                temp_cli += ' cluster-show format name no-show-headers'
-                cluster_list = run_cli(module, temp_cli).split()
-                for cluster in cluster_list:
-                    if leaf in cluster:
-                        cli += ' weight 100 allowas-in '
-                        break
+                if leaf in cluster_index['nodes']:
+                    cli += ' weight 100 allowas-in '
 
                 if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        leaf, ip_spine, vrouter_leaf
-                    )
-                    CHANGED_FLAG.append(True)
-
-    return output
+                    RESULTS.add(leaf, 'vrouter-bgp-add', ip_spine,
+                                'Added BGP Neighbor %s for %s' % (
+                                    ip_spine, vrouter_leaf))
 
 
 def assign_router_id(module, vrouter_names):
@@ -463,10 +463,7 @@ def assign_router_id(module, vrouter_names):
     Method to assign router-id to vrouters which is same as loopback ip.
     :param module: The Ansible module to fetch input parameters.
     :param vrouter_names: List of vrouter names.
-    :return: String describing if router id got assigned or not.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
 
@@ -484,17 +481,10 @@ def assign_router_id(module, vrouter_names):
                     vrouter, loopback_ip[0])
 
                 if 'Success' in run_cli(module, cli):
-                    cli = clicopy
-                    cli += ' vrouter-show name ' + vrouter
-                    cli += ' format location no-show-headers '
-                    switch = run_cli(module, cli).split()[0]
-
-                    output += ' %s: Added router id %s to %s \n' % (
-                        switch, loopback_ip[0], vrouter)
-
-                    CHANGED_FLAG.append(True)
-
-    return output
+                    switch = VROUTERS.switch(module, run_cli, vrouter)
+                    RESULTS.add(switch, 'vrouter-modify', vrouter,
+                                'Added router id %s to %s' % (loopback_ip[0],
+                                                              vrouter))
 
 
 def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
@@ -505,18 +495,12 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     :param vrouter_names: List of vrouter names.
     :param bgp_max: Maxpath for bgp.
     :param bgp_redis: Bgp redistribute for bgp.
-    :return: String describing if bgp config got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter
-        cli += ' format location no-show-headers '
-        switch = run_cli(module, cli).split()[0]
+        switch = VROUTERS.switch(module, run_cli, vrouter)
 
         cli = clicopy
         cli += ' vrouter-modify name %s ' % vrouter
@@ -524,108 +508,43 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
         cli += ' bgp-max-paths %s ' % bgp_max
         cli += ' bgp-redistribute %s ' % bgp_redis
         if 'Success' in run_cli(module, cli):
-            output += ' %s: Added bgp_redistribute %s ' % (switch, bgp_redis)
-            output += 'bgp_as %s bgp_maxpath %s to %s\n' % (dict_bgp_as[switch],
-                                                            bgp_max, vrouter)
-            CHANGED_FLAG.append(True)
-
-    return output
+            output = 'Added bgp_redistribute %s ' % bgp_redis
+            output += 'bgp_as %s bgp_maxpath %s to %s' % (dict_bgp_as[switch],
+                                                          bgp_max, vrouter)
+            RESULTS.add(switch, 'vrouter-modify', vrouter, output)
 
 
-def find_non_clustered_leafs(module):
-    """
-    Method to find leafs which are not part of any cluster.
-    :param module: The Ansible module to fetch input parameters.
-    :return: List of non clustered leaf switches.
-    """
-    non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
-
-    for leaf in module.params['pn_leaf_list']:
-        if leaf not in clustered_nodes:
-            non_clustered_leafs.append(leaf)
-
-    return non_clustered_leafs
-
-
-def create_cluster(module, name, node1, node2):
+def create_cluster(module, name, node1, node2, cluster_index):
     """
     Method to create a cluster between two switches.
     :param module: The Ansible module to fetch input parameters.
     :param name: The name of the cluster to create.
     :param node1: First node of the cluster.
     :param node2: Second node of the cluster.
-    :return: String describing if cluster got created or not.
+    :param cluster_index: The index returned by get_cluster_index().
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
+    if name not in cluster_index['clusters']:
+        cli = pn_cli(module)
         cli += ' switch %s cluster-create name %s ' % (node1, name)
         cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
         if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Created %s \n' % (node1, name)
-    else:
-        return ''
+            add_cluster_to_index(module, cluster_index, name, node1, node2)
+            RESULTS.add(node1, 'cluster-create', name, 'Created %s' % name)
 
 
-def create_leaf_clusters(module):
+def create_leaf_clusters(module, cluster_index):
     """
     Method to create cluster between two physically connected leaf switches.
     :param module: The Ansible module to fetch input parameters.
-    :return: Output of create_cluster() method.
+    :param cluster_index: The index returned by get_cluster_index().
     """
-    output = ''
-    non_clustered_leafs = find_non_clustered_leafs(module)
-    non_clustered_leafs_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
-
-    while non_clustered_leafs_count == 0:
-        if len(non_clustered_leafs) == 0:
-            non_clustered_leafs_count += 1
-        else:
-            node1 = non_clustered_leafs[0]
-            non_clustered_leafs.remove(node1)
-
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
-                if node2 in non_clustered_leafs:
-                    # Cluster creation
-                    cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    output += create_cluster(module, cluster_name, node1, node2)
-
-                    non_clustered_leafs.remove(node2)
-                    terminate_flag += 1
-
-                node_count += 1
+    _, new_pairs = plan_leaf_clusters(
+        module, run_cli, module.params['pn_leaf_list'],
+        cluster_index['clusters'].values())
 
-    return output
+    for node1, node2 in new_pairs:
+        cluster_name = node1 + '-to-' + node2 + '-cluster'
+        create_cluster(module, cluster_name, node1, node2, cluster_index)
 
 
 def configure_ospf_bfd(module, vrouter, ip):
@@ -634,45 +553,17 @@ def configure_ospf_bfd(module, vrouter, ip):
     :param module: The Ansible module to fetch input parameters.
     :param vrouter: The vrouter name to add ospf bfd.
     :param ip: The interface ip to associate the ospf bfd.
-    :return: String describing if OSPF BFD got added or if it already exists.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vrouter-name %s' % vrouter
-    cli += ' ip %s format nic no-show-headers ' % ip
-    nic_interface = run_cli(module, cli).split()
-    nic_interface = list(set(nic_interface))
-    nic_interface.remove(vrouter)
-
-    cli = clicopy
-    cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface[0]
-    ospf_status = run_cli(module, cli).split()
-    ospf_status = list(set(ospf_status))
+    change = OSPF_BFD.enable(module, run_cli, vrouter, ip)
+    if change is None:
+        return
 
-    cli = clicopy
-    cli += ' vrouter-show name ' + vrouter
-    cli += ' format location no-show-headers '
-    switch = run_cli(module, cli).split()[0]
-
-    if 'Success' in ospf_status:
-        cli = clicopy
-        cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Added OSPF BFD config to %s \n' % (switch, vrouter)
-    elif 'enable' not in ospf_status:
-        ospf_status.remove(vrouter)
-        cli = clicopy
-        cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Enabled OSPF BFD for %s \n' % (switch, vrouter)
+    switch, command, nic = change
+    if command == 'vrouter-interface-config-add':
+        RESULTS.add(switch, command, nic,
+                    'Added OSPF BFD config to %s' % vrouter)
     else:
-        return ''
+        RESULTS.add(switch, command, nic, 'Enabled OSPF BFD for %s' % vrouter)
 
 
 def add_ospf_loopback_spine(module, switch, vrouter, ospf_network,
@@ -684,10 +575,7 @@ def add_ospf_loopback_spine(module, switch, vrouter, ospf_network,
     :param vrouter: The vrouter name to add ospf bfd.
     :param ospf_network: The network for adding the ospf neighbor.
     :param ospf_area_id: The area_id for the spines loopback neighbor.
-    :return: String describing if OSPF Neighbor got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
 
@@ -695,54 +583,40 @@ def add_ospf_loopback_spine(module, switch, vrouter, ospf_network,
     cli += ' network %s format switch no-show-headers ' % ospf_network
     already_added = run_cli(module, cli).split()
 
-    if vrouter in already_added:
-        pass
-    else:
+    if vrouter not in already_added:
         cli = clicopy
         cli += ' vrouter-ospf-add vrouter-name ' + vrouter
         cli += ' network %s ospf-area %s' % (ospf_network,
                                              ospf_area_id)
 
         if 'Success' in run_cli(module, cli):
-            output += ' %s: Added OSPF neighbor %s to %s \n' % (switch,
-                                                                ospf_network,
-                                                                vrouter)
-            CHANGED_FLAG.append(True)
-
-    return output
+            RESULTS.add(switch, 'vrouter-ospf-add', ospf_network,
+                        'Added OSPF neighbor %s to %s' % (ospf_network,
+                                                          vrouter))
 
 
-def find_area_id_leaf_switches(module):
+def find_area_id_leaf_switches(module, cluster_index):
     """
     Method to find area_id for all leaf switches and store it in a dictionary.
     :param module: The Ansible module to fetch input parameters.
+    :param cluster_index: The index returned by get_cluster_index().
     :return: Dictionary containing area_id of all leaf switches.
     """
     leaf_list = module.params['pn_leaf_list']
     ospf_area_id = int(module.params['pn_ospf_area_id'])
     cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
     dict_area_id = {}
 
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
+    for cluster_nodes in cluster_index['clusters'].values():
+        if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
+            ospf_area_id += 1
+            dict_area_id[cluster_nodes[0]] = str(ospf_area_id)
+            dict_area_id[cluster_nodes[1]] = str(ospf_area_id)
+            cluster_leaf_list.append(cluster_nodes[0])
+            cluster_leaf_list.append(cluster_nodes[1])
 
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
-
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                ospf_area_id += 1
-                dict_area_id[cluster_nodes[0]] = str(ospf_area_id)
-                dict_area_id[cluster_nodes[1]] = str(ospf_area_id)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
-
-    non_clustered_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
+    non_clustered_leaf_list = [leaf for leaf in leaf_list
+                               if leaf not in cluster_leaf_list]
     for leaf in non_clustered_leaf_list:
         ospf_area_id += 1
         dict_area_id[leaf] = str(ospf_area_id)
@@ -755,20 +629,14 @@ def add_ospf_neighbor(module, dict_area_id):
     Method to add ospf_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
     :param dict_area_id: Dictionary containing area_id of leafs.
-    :return: String describing if ospf neighbors got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
     loopback_network = ''
     cli = pn_cli(module)
     clicopy = cli
     spine_list = module.params['pn_spine_list']
 
     for spine in spine_list:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+        vrouter_spine = VROUTERS.vrouter(module, run_cli, spine)
 
         if spine_list.index(spine) == 0:
             cli = clicopy
@@ -781,8 +649,8 @@ def add_ospf_neighbor(module, dict_area_id):
             loopback_network = loopback_ip[0] + '.' + loopback_ip[1] + '.'
             loopback_network += loopback_ip[2] + '.' + '0/24'
 
-        output += add_ospf_loopback_spine(module, spine, vrouter_spine,
-                                          loopback_network, '0')
+        add_ospf_loopback_spine(module, spine, vrouter_spine,
+                                loopback_network, '0')
 
         cli = clicopy
         cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
@@ -799,10 +667,7 @@ def add_ospf_neighbor(module, dict_area_id):
 
             ospf_area_id = dict_area_id[hostname]
 
-            cli = clicopy
-            cli += ' vrouter-show location %s' % hostname
-            cli += ' format name no-show-headers'
-            vrouter_hostname = run_cli(module, cli).split()[0]
+            vrouter_hostname = VROUTERS.vrouter(module, run_cli, hostname)
 
             cli = clicopy
             cli += ' vrouter-interface-show vrouter-name %s l3-port %s' % (
@@ -833,12 +698,9 @@ def add_ospf_neighbor(module, dict_area_id):
             cli += ' network %s format switch no-show-headers ' % ospf_network
             already_added = run_cli(module, cli).split()
 
-            if vrouter_spine in already_added:
-                pass
-            else:
+            if vrouter_spine not in already_added:
                 if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_spine,
-                                                 ip_spine)
+                    configure_ospf_bfd(module, vrouter_spine, ip_spine)
 
                 cli = clicopy
                 cli += ' vrouter-ospf-add vrouter-name ' + vrouter_spine
@@ -846,17 +708,13 @@ def add_ospf_neighbor(module, dict_area_id):
                                                      ospf_area_id)
 
                 if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                        spine, ospf_network, vrouter_spine
-                    )
-                    CHANGED_FLAG.append(True)
-
-            if vrouter_hostname in already_added:
-                pass
-            else:
+                    RESULTS.add(spine, 'vrouter-ospf-add', ospf_network,
+                                'Added OSPF neighbor %s to %s' % (
+                                    ospf_network, vrouter_spine))
+
+            if vrouter_hostname not in already_added:
                 if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_hostname,
-                                                 ip_leaf)
+                    configure_ospf_bfd(module, vrouter_hostname, ip_leaf)
 
                 cli = clicopy
                 cli += ' vrouter-ospf-add vrouter-name ' + vrouter_hostname
@@ -864,12 +722,9 @@ def add_ospf_neighbor(module, dict_area_id):
                                                      ospf_area_id)
 
                 if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                        hostname, ospf_network, vrouter_hostname
-                    )
-                    CHANGED_FLAG.append(True)
-
-    return output
+                    RESULTS.add(hostname, 'vrouter-ospf-add', ospf_network,
+                                'Added OSPF neighbor %s to %s' % (
+                                    ospf_network, vrouter_hostname))
 
 
 def add_ospf_redistribute(module, vrouter_names):
@@ -877,10 +732,7 @@ def add_ospf_redistribute(module, vrouter_names):
     Method to add ospf_redistribute to the vrouters.
     :param module: The Ansible module to fetch input parameters.
     :param vrouter_names: List of vrouter names.
-    :return: String describing if ospf-redistribute got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
 
@@ -889,16 +741,9 @@ def add_ospf_redistribute(module, vrouter_names):
         cli += ' vrouter-modify name %s' % vrouter
         cli += ' ospf-redistribute static,connected'
         if 'Success' in run_cli(module, cli):
-            cli = clicopy
-            cli += ' vrouter-show name ' + vrouter
-            cli += ' format location no-show-headers '
-            switch = run_cli(module, cli).split()[0]
-
-            output += ' %s: Added ospf_redistribute to %s \n' % (switch,
-                                                                 vrouter)
-            CHANGED_FLAG.append(True)
-
-    return output
+            switch = VROUTERS.switch(module, run_cli, vrouter)
+            RESULTS.add(switch, 'vrouter-modify', vrouter,
+                        'Added ospf_redistribute to %s' % vrouter)
 
 
 def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
@@ -910,10 +755,7 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
     :param interface_ip: Interface ip to create a vrouter interface.
     :param ospf_network: Ospf network for the ospf neighbor.
     :param ospf_area_id: The area_id for ospf neighborship.
-    :return: String describing if ospf neighbors got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
     vlan_id = module.params['pn_iospf_vlan']
 
     cli = pn_cli(module)
@@ -926,13 +768,10 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
         cli += ' switch %s vlan-create id %s scope local ' % (switch_name,
                                                               vlan_id)
         run_cli(module, cli)
-        output = ' %s: Created vlan with id %s \n' % (switch_name, vlan_id)
-        CHANGED_FLAG.append(True)
+        RESULTS.add(switch_name, 'vlan-create', vlan_id,
+                    'Created vlan with id %s' % vlan_id)
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
@@ -945,91 +784,60 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
             vrouter, interface_ip, vlan_id
         )
         run_cli(module, cli)
-        output += ' %s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
+        RESULTS.add(switch_name, 'vrouter-interface-add', interface_ip,
+                    'Added vrouter interface with ip %s on %s' % (
+                        interface_ip, vrouter))
 
     cli = clicopy
     cli += ' vrouter-ospf-show'
     cli += ' network %s format switch no-show-headers ' % ospf_network
     already_added = run_cli(module, cli).split()
 
-    if vrouter in already_added:
-        pass
-    else:
+    if vrouter not in already_added:
         interface_ip_without_supernet = interface_ip.split('/')[0]
         if module.params['pn_bfd']:
-            output += configure_ospf_bfd(module, vrouter,
-                                         interface_ip_without_supernet)
+            configure_ospf_bfd(module, vrouter, interface_ip_without_supernet)
         cli = clicopy
         cli += ' vrouter-ospf-add vrouter-name ' + vrouter
         cli += ' network %s ospf-area %s' % (ospf_network, ospf_area_id)
 
         if 'Success' in run_cli(module, cli):
-            output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                switch_name, ospf_network, vrouter
-            )
-            CHANGED_FLAG.append(True)
-
-    return output
+            RESULTS.add(switch_name, 'vrouter-ospf-add', ospf_network,
+                        'Added OSPF neighbor %s to %s' % (ospf_network,
+                                                          vrouter))
 
 
-def assign_leafcluster_ospf_interface(module, dict_area_id):
+def assign_leafcluster_ospf_interface(module, dict_area_id, cluster_index):
     """
     Method to create interfaces and add ospf neighbor for leaf cluster.
     :param module: The Ansible module to fetch input parameters.
     :param dict_area_id: Dictionary containing area_id of leafs.
-    :return: The output of vrouter_interface_ibgp_add() method.
+    :param cluster_index: The index returned by get_cluster_index().
     """
-    output = ''
     iospf_ip_range = module.params['pn_iospf_ip_range']
     spine_list = module.params['pn_spine_list']
     leaf_list = module.params['pn_leaf_list']
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = iospf_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
+    for cluster_node_1, cluster_node_2 in cluster_index['clusters'].values():
+        if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
+            ip_count = subnet_count * 4
+            ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
+            ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
+            ospf_network = static_part + str(ip_count) + '/' + str(supernet)
 
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
+            ospf_area_id = dict_area_id[cluster_node_1]
+            vrouter_leafcluster_ospf_add(module, cluster_node_1, ip1,
+                                         ospf_network, ospf_area_id)
+            vrouter_leafcluster_ospf_add(module, cluster_node_2, ip2,
+                                         ospf_network, ospf_area_id)
 
-            if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
-                ip_count = subnet_count * 4
-                ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
-                ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
-                ospf_network = static_part + str(ip_count) + '/' + str(supernet)
-
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
-                ospf_area_id = dict_area_id[cluster_node_1]
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_1,
-                                                       ip1, ospf_network,
-                                                       ospf_area_id)
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_2,
-                                                       ip2, ospf_network,
-                                                       ospf_area_id)
-
-                subnet_count += 1
-    else:
-        output += ' No leaf clusters present to add iOSPF \n'
-
-    return output
+            subnet_count += 1
 
 
 def main():
@@ -1057,53 +865,43 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
+    exit_if_converged(module, '', 'Configure eBGP/OSPF', LOCAL_STATE)
+
     routing_protocol = module.params['pn_routing_protocol']
 
     # Get the list of vrouter names.
-    cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    vrouter_names = VROUTERS.vrouters(module, run_cli)
 
-    #message = assign_router_id(module, vrouter_names)
-    message = create_leaf_clusters(module)
+    #assign_router_id(module, vrouter_names)
+    cluster_index = get_cluster_index(module)
+    create_leaf_clusters(module, cluster_index)
 
     if routing_protocol == 'ebgp':
-        dict_bgp_as = find_bgp_as_dict(module)
-        message += configure_bgp(module, vrouter_names, dict_bgp_as,
-                                 module.params['pn_bgp_maxpath'],
-                                 module.params['pn_bgp_redistribute'])
-        message += add_bgp_neighbor(module, dict_bgp_as)
-        message += assign_ibgp_interface(module, dict_bgp_as)
+        dict_bgp_as = find_bgp_as_dict(module, cluster_index)
+        configure_bgp(module, vrouter_names, dict_bgp_as,
+                      module.params['pn_bgp_maxpath'],
+                      module.params['pn_bgp_redistribute'])
+        add_bgp_neighbor(module, dict_bgp_as, cluster_index)
+        assign_ibgp_interface(module, dict_bgp_as, cluster_index)
     elif routing_protocol == 'ospf':
-        dict_area_id = find_area_id_leaf_switches(module)
-        message += add_ospf_neighbor(module, dict_area_id)
-        message += add_ospf_redistribute(module, vrouter_names)
-        message += assign_leafcluster_ospf_interface(module, dict_area_id)
+        dict_area_id = find_area_id_leaf_switches(module, cluster_index)
+        add_ospf_neighbor(module, dict_area_id)
+        add_ospf_redistribute(module, vrouter_names)
+        assign_leafcluster_ospf_interface(module, dict_area_id,
+                                          cluster_index)
 
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + module.params['pn_leaf_list']
-    for switch in switch_list:
-        replace_string = switch + ': '
-
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {
-                    'switch': switch,
-                    'output': (line.replace(replace_string, '')).strip()
-                }
-                results.append(json_msg)
+    save_fingerprint(module, LOCAL_STATE)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         msg='eBGP/OSPF configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Configure eBGP/OSPF'
+        changed=RESULTS.changed,
+        task='Configure eBGP/OSPF',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -21,7 +21,9 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import TRUNK_STATE_CLI, STP_STATE_CLI
 
 DOCUMENTATION = """
 ---
@@ -94,10 +96,16 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 
 CHANGED_FLAG = []
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI, STP_STATE_CLI)
 
 def run_cli(module, cli):
     """
@@ -108,7 +116,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -126,7 +134,8 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L2 (Auto vLags) with existing spine switches',
             msg='L2 configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -459,6 +468,10 @@ def main():
         )
     )
 
+    exit_if_converged(module, '',
+                      'Configure L2 (Auto vLags) with existing spine switches',
+                      LOCAL_STATE)
+
     global CHANGED_FLAG
 
     # L2 setup (auto vLags).
@@ -483,6 +496,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -491,7 +506,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure L2 (Auto vLags) with existing spine switches'
+        task='Configure L2 (Auto vLags) with existing spine switches',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -21,7 +21,10 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import TRUNK_STATE_CLI, STP_STATE_CLI
+from ansible.module_utils.pn_nvos import plan_leaf_clusters
 
 DOCUMENTATION = """
 ---
@@ -104,9 +107,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI, STP_STATE_CLI)
 
 
 def run_cli(module, cli):
@@ -118,7 +127,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -136,7 +145,8 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L2 ZTP (Auto vLags)',
             msg='L2 ZTP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -236,26 +246,6 @@ def create_trunk(module, switch, name, ports):
     return ' %s: Created trunk %s \n' % (switch, name)
 
 
-def find_non_clustered_leafs(module, leaf_list):
-    """
-    Method to find leafs which are not part of any cluster.
-    :param module: The Ansible module to fetch input parameters.
-    :param leaf_list: The list of leaf switches.
-    :return: List of non clustered leaf switches.
-    """
-    non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
-
-    for leaf in leaf_list:
-        if leaf not in clustered_nodes:
-            non_clustered_leafs.append(leaf)
-
-    return non_clustered_leafs
-
-
 def create_vlag(module, switch, name, peer_switch, port, peer_port):
     """
     Method to create virtual link aggregation groups.
@@ -308,100 +298,65 @@ def configure_trunk(module, cluster_node, switch_list):
     return output + name
 
 
-def configure_trunk_vlag_for_clustered_leafs(module, non_clustered_leafs,
+def configure_trunk_vlag_for_clustered_leafs(module, leaf_pairs, new_pairs,
                                              spine_list):
     """
     Method to create clusters, trunks and vlag for the switches having
     physical links (clustered leafs).
     :param module: The Ansible module to fetch input parameters.
-    :param non_clustered_leafs: The list of non clustered leaf switches.
+    :param leaf_pairs: The list of (node1, node2) pairs of clustered leafs.
+    :param new_pairs: The pairs among leaf_pairs which are not clustered yet.
     :param spine_list: The list of spine switches.
     :return: Output of create_cluster() and create_vlag() methods.
     """
-    cli = pn_cli(module)
-    clicopy = cli
     output = ''
-    non_clustered_leafs_count = 0
-    while non_clustered_leafs_count == 0:
-        if len(non_clustered_leafs) == 0:
-            non_clustered_leafs_count += 1
-        else:
-            node1 = non_clustered_leafs[0]
-            non_clustered_leafs.remove(node1)
+    for node1, node2 in leaf_pairs:
+        if (node1, node2) in new_pairs:
+            # Cluster creation
+            cluster_name = node1 + '-to-' + node2 + '-cluster'
+            if len(cluster_name) > 59:
+                cluster_name = cluster_name[:59]
 
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
+            output += create_cluster(module, node2, cluster_name, node1,
+                                     node2)
+
+        # Trunk creation (leaf to spines)
+        trunk_message1 = configure_trunk(module, node1, spine_list).split('\n')
+        trunk_message2 = configure_trunk(module, node2, spine_list).split('\n')
+        trunk_name1 = trunk_message1[1]
+        trunk_name2 = trunk_message2[1]
+        output += trunk_message1[0] + '\n'
+        output += trunk_message2[0] + '\n'
+        # Vlag creation (leaf to spines)
+        vlag_name = node1 + '-' + node2 + '-to-' + 'spine'
+        if len(vlag_name) > 59:
+            vlag_name = vlag_name[:59]
+
+        output += create_vlag(module, node1, vlag_name, node2, trunk_name1,
+                              trunk_name2)
+
+        leafs_list = [node1, node2]
+        spine1 = str(spine_list[0])
+        spine2 = str(spine_list[1])
+
+        # Trunk creation (spine to leafs)
+        trunk_message1 = configure_trunk(module, spine1,
+                                         leafs_list).split('\n')
+        trunk_message2 = configure_trunk(module, spine2,
+                                         leafs_list).split('\n')
+        trunk_name1 = trunk_message1[1]
+        trunk_name2 = trunk_message2[1]
+        output += trunk_message1[0] + '\n'
+        output += trunk_message2[0] + '\n'
+
+        # Vlag creation (spine to leafs)
+        name = 'spine-to-' + node1 + '-' + node2
+        if len(name) > 59:
+            name = name[:59]
+
+        output += create_vlag(module, spine1, name, spine2, trunk_name1,
+                              trunk_name2)
 
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
-                if node2 in non_clustered_leafs:
-                    # Cluster creation
-                    cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    if len(cluster_name) > 59:
-                        cluster_name = cluster_name[:59]
-
-                    output += create_cluster(module, node2, cluster_name,
-                                             node1, node2)
-
-                    non_clustered_leafs.remove(node2)
-
-                    # Trunk creation (leaf to spines)
-                    trunk_message1 = configure_trunk(module, node1,
-                                                     spine_list).split('\n')
-                    trunk_message2 = configure_trunk(module, node2,
-                                                     spine_list).split('\n')
-                    trunk_name1 = trunk_message1[1]
-                    trunk_name2 = trunk_message2[1]
-                    output += trunk_message1[0] + '\n'
-                    output += trunk_message2[0] + '\n'
-                    # Vlag creation (leaf to spines)
-                    vlag_name = node1 + '-' + node2 + '-to-' + 'spine'
-                    if len(vlag_name) > 59:
-                        vlag_name = vlag_name[:59]
-
-                    output += create_vlag(module, node1, vlag_name, node2,
-                                          trunk_name1, trunk_name2)
-
-                    leafs_list = [node1, node2]
-                    spine1 = str(spine_list[0])
-                    spine2 = str(spine_list[1])
-
-                    # Trunk creation (spine to leafs)
-                    trunk_message1 = configure_trunk(module, spine1,
-                                                     leafs_list).split('\n')
-                    trunk_message2 = configure_trunk(module, spine2,
-                                                     leafs_list).split('\n')
-                    trunk_name1 = trunk_message1[1]
-                    trunk_name2 = trunk_message2[1]
-                    output += trunk_message1[0] + '\n'
-                    output += trunk_message2[0] + '\n'
-
-                    # Vlag creation (spine to leafs)
-                    name = 'spine-to-' + node1 + '-' + node2
-                    if len(name) > 59:
-                        name = name[:59]
-
-                    output += create_vlag(module, spine1, name, spine2,
-                                          trunk_name1, trunk_name2)
-
-                    terminate_flag += 1
-
-                node_count += 1
     return output
 
 
@@ -457,12 +412,17 @@ def configure_auto_vlag(module):
     output = create_cluster(module, spine1, 'spine-cluster', spine1, spine2)
 
     # Configure trunk, vlag for clustered leaf switches.
-    output += configure_trunk_vlag_for_clustered_leafs(module,
-                                                       list(leaf_list),
-                                                       spine_list)
+    clustered_pairs, new_pairs = plan_leaf_clusters(module, run_cli,
+                                                    leaf_list)
+    leaf_pairs = sorted(clustered_pairs + new_pairs,
+                        key=lambda pair: leaf_list.index(pair[0]))
+    output += configure_trunk_vlag_for_clustered_leafs(module, leaf_pairs,
+                                                       new_pairs, spine_list)
 
     # Configure trunk, vlag for non clustered leaf switches.
-    non_clustered_leafs = find_non_clustered_leafs(module, leaf_list)
+    paired_leafs = set(leaf for pair in leaf_pairs for leaf in pair)
+    non_clustered_leafs = [leaf for leaf in leaf_list
+                           if leaf not in paired_leafs]
     output += configure_trunk_non_clustered_leafs(module, non_clustered_leafs,
                                                   spine_list)
     return output
@@ -508,6 +468,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure L2 ZTP (Auto vLags)', LOCAL_STATE)
+
     global CHANGED_FLAG
 
     # L2 setup (auto vLags).
@@ -534,6 +496,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -542,7 +506,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure L2 ZTP (Auto vLags)'
+        task='Configure L2 ZTP (Auto vLags)',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -20,8 +20,15 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import TRUNK_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector, PrefixIndex
+from ansible.module_utils.pn_nvos import expand_ports, ipv4_network, VROUTERS
+from ansible.module_utils.pn_nvos import hold_auto_trunk, release_auto_trunk
 
 DOCUMENTATION = """
 ---
@@ -60,7 +67,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -85,9 +92,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -99,7 +112,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -116,124 +129,170 @@ def run_cli(module, cli):
             summary=results,
             task='Configure OSPF',
             msg='OSPF configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def vrouter_interface_ospf_add(module, switch_name, l3_port, interface_ip, vrouter,
-                               ospf_network, area_id):
+def get_switch_snapshot(module, switch):
     """
-    Method to create interfaces and add ibgp neighbors.
+    Method to read the vrouter, trunks, interfaces and ospf networks of a
+    switch.
     :param module: The Ansible module to fetch input parameters.
-    :param switch_name: The name of the switch to run interface.
-    :param l3_port: The l3_port number to create the vrouter interface.
-    :param interface_ip: Interface ip to create a vrouter interface.
-    :param neighbor_ip: Neighbor_ip for the ibgp neighbor.
-    :param remote_as: Bgp-as for remote switch.
-    :return: String describing if ibgp neighbours got added or already exists.
+    :param switch: Name of the switch.
+    :return: Dictionary holding the vrouter name, a dictionary of port to the
+    trunk containing it, the set of (ip, l3-port) interfaces and a
+    PrefixIndex of the ospf networks to their area.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
     clicopy = cli
+    snapshot = {
+        'vrouter': VROUTERS.vrouter(module, run_cli, switch),
+        'trunks': {},
+        'interfaces': set(),
+        'networks': PrefixIndex()
+    }
 
     cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    cli += ' switch %s trunk-show format name,ports ' % switch
+    cli += ' parsable-delim ; '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 2:
+            continue
+        for port in expand_ports(fields[-1]):
+            snapshot['trunks'][str(port)] = fields[-2]
 
     cli = clicopy
-    cli += ' vrouter-interface-show ip %s l3-port %s' % (interface_ip, l3_port)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
-
-    if vrouter not in existing_vrouter_interface:
-        cli = clicopy
-        cli += ' vrouter-interface-add vrouter-name %s ip %s l3-port %s ' % (
-            vrouter, interface_ip, l3_port
-        )
-        run_cli(module, cli)
-
-        output += '%s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
+    cli += ' vrouter-interface-show vrouter-name %s ' % snapshot['vrouter']
+    cli += ' format ip,l3-port parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        ip, l3_port = fields[-2:]
+        snapshot['interfaces'].add((ip.split('/')[0], l3_port))
 
     cli = clicopy
-    cli += ' vrouter-ospf-show '
-    cli += ' network %s format switch no-show-headers' % ospf_network
-    already_added = run_cli(module, cli).split()
-
-    if vrouter not in already_added:
-        cli = clicopy
-        cli += ' vrouter-ospf-add vrouter-name ' + vrouter
-        cli += ' network %s ospf-area %s' % (ospf_network, area_id)
+    cli += ' vrouter-ospf-show vrouter-name %s ' % snapshot['vrouter']
+    cli += ' format network,ospf-area parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2 or '/' not in fields[-2]:
+            continue
+        snapshot['networks'].add(fields[-2], fields[-1])
 
-        if 'Success' in run_cli(module, cli):
-            output += '%s: Added ospf neighbor %s for %s \n' % (switch_name, ospf_network,
-                                                                vrouter)
-            CHANGED_FLAG.append(True)
+    return snapshot
 
-    return output
 
-
-def modify_auto_trunk_setting(module, switch, flag):
+def find_conflicts(switch, snapshot, rows):
     """
-    Method to enable/disable auto trunk setting of a switch.
-    :param module: The Ansible module to fetch input parameters.
-    :param switch: Name of the local switch.
-    :param flag: Enable/disable flag for the cli command.
-    :return: The output of run_cli() method.
+    Method to find the ospf networks of the rows overlapping a network which
+    is configured, or requested, in a different area.
+    :param switch: Name of the switch.
+    :param snapshot: Snapshot of the configuration of the switch.
+    :param rows: List of (l3_port, interface_ip, area_id) tuples.
+    :return: List of summary entries describing the conflicts.
     """
-    cli = pn_cli(module)
-    if flag.lower() == 'enable':
-        cli += ' switch %s system-settings-modify auto-trunk ' % switch
-        return run_cli(module, cli)
-    elif flag.lower() == 'disable':
-        cli += ' switch %s system-settings-modify no-auto-trunk ' % switch
-        return run_cli(module, cli)
-
-
-def delete_trunk(module, switch, switch_port):
+    conflicts = []
+    requested = PrefixIndex()
+    for l3_port, interface_ip, area_id in rows:
+        ospf_network = ipv4_network(interface_ip)
+        overlaps = snapshot['networks'].overlapping(ospf_network)
+        overlaps += requested.overlapping(ospf_network)
+        for network, area in overlaps:
+            if area != area_id:
+                conflicts.append({
+                    'switch': switch,
+                    'output': 'Network %s of area %s overlaps %s of '
+                              'area %s' % (ospf_network, area_id, network,
+                                           area)
+                })
+        requested.add(ospf_network, area_id)
+
+    return conflicts
+
+
+def delete_trunk(module, switch, snapshot, switch_port):
     """
     Method to delete a conflicting trunk on a switch.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the local switch.
+    :param snapshot: Snapshot of the configuration of the switch.
     :param switch_port: The l3-port which is part of conflicting trunk for l3.
-    :param peer_switch: Name of the peer switch.
-    :return: String describing if trunk got deleted or not.
     """
-    cli = pn_cli(module)
-    clicopy = cli
+    trunk = snapshot['trunks'].get(switch_port)
+    if trunk is None:
+        return
 
-    cli += ' switch %s trunk-show ports %s ' % (switch, switch_port)
-    cli += ' format name no-show-headers '
-    trunk = run_cli(module, cli).split()
-    trunk = list(set(trunk))
-    if 'Success' not in trunk and len(trunk) > 0:
-        cli = clicopy
-        cli += ' switch %s trunk-delete name %s ' % (switch, trunk[0])
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' Deleted %s trunk successfully \n' % (trunk[0])
+    cli = pn_cli(module)
+    cli += ' switch %s trunk-delete name %s ' % (switch, trunk)
+    run_cli(module, cli)
+    for port, name in list(snapshot['trunks'].items()):
+        if name == trunk:
+            del snapshot['trunks'][port]
+    RESULTS.add(switch, 'trunk-delete', trunk,
+                'Deleted %s trunk successfully' % trunk)
 
 
-def ospf_configuration(module):
+def ospf_configuration(module, switch, snapshot, rows, held):
     """
-    Method to configure create interfaces and configure OSPF.
+    Method to create interfaces and configure OSPF on a switch.
     :param module: The Ansible module to fetch input parameters.
-    :return: String containing output of all the commands.
+    :param switch: Name of the switch.
+    :param snapshot: Snapshot of the configuration of the switch.
+    :param rows: List of (l3_port, interface_ip, area_id) tuples.
+    :param held: List of the switches auto-trunk got disabled on.
     """
-    output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-    switch_list = module.params['pn_switch_list']
+    vrouter = snapshot['vrouter']
+
+    new_interfaces = [row for row in rows
+                      if (row[1].split('/')[0], row[0])
+                      not in snapshot['interfaces']]
+    if new_interfaces:
+        # Keep the l3 ports from getting trunked again.
+        hold_auto_trunk(module, run_cli, [switch], held)
+
+    for l3_port, interface_ip, area_id in rows:
+        interface = (interface_ip.split('/')[0], l3_port)
+        if interface not in snapshot['interfaces']:
+            delete_trunk(module, switch, snapshot, l3_port)
+
+            cli = pn_cli(module)
+            cli += ' vrouter-interface-add vrouter-name %s ' % vrouter
+            cli += ' ip %s l3-port %s ' % (interface_ip, l3_port)
+            run_cli(module, cli)
+            snapshot['interfaces'].add(interface)
+            RESULTS.add(switch, 'vrouter-interface-add', interface_ip,
+                        'Added vrouter interface with ip %s on %s' % (
+                            interface_ip, vrouter))
+
+        ospf_network = ipv4_network(interface_ip)
+        if snapshot['networks'].get(ospf_network) is None:
+            cli = pn_cli(module)
+            cli += ' vrouter-ospf-add vrouter-name ' + vrouter
+            cli += ' network %s ospf-area %s' % (ospf_network, area_id)
+            run_cli(module, cli)
+            snapshot['networks'].add(ospf_network, area_id)
+            RESULTS.add(switch, 'vrouter-ospf-add', ospf_network,
+                        'Added ospf neighbor %s for %s' % (ospf_network,
+                                                           vrouter))
+
+
+def main():
+    """ This section is for arguments parsing """
+    module = AnsibleModule(
+        argument_spec=dict(
+            pn_switch_list=dict(required=True, type='list'),
+            pn_ospf_data=dict(required=False, type='str', default=''),
+        )
+    )
 
-    # Disable auto trunk on all switches.
-    for switch in switch_list:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    exit_if_converged(module, '', 'Configure OSPF', LOCAL_STATE)
+
+    switch_rows = OrderedDict()
 
     ospf_data = module.params['pn_ospf_data']
     ospf_data = ospf_data.strip()
@@ -247,67 +306,65 @@ def ospf_configuration(module):
             else:
                 elements = row.split(',')
                 switch = elements.pop(0).strip()
-                l3_port = elements.pop(0).strip()
-                interface_ip = elements.pop(0).strip()
-                area_id = elements.pop(0).strip()
-
-                address = interface_ip.split('/')
-                cidr = int(address[1])
-                address = address[0].split('.')
-
-                mask = [0, 0, 0, 0]
-                for i in range(cidr):
-                    mask[i / 8] += (1 << (7 - i % 8))
-
-                # Initialize net and binary and netmask with addr to get network
-                network = []
-                for i in range(4):
-                    network.append(int(address[i]) & mask[i])
-
-                ospf_network = '.'.join(map(str, network)) + '/' + str(cidr)
-
-                cli = clicopy
-                cli += ' vrouter-show location %s ' % switch
-                cli += ' format name no-show-headers '
-                vrouter_name = run_cli(module, cli).split()[0]
-
-                delete_trunk(module, switch, l3_port)
-                output += vrouter_interface_ospf_add(module, switch, l3_port, interface_ip,
-                                                     vrouter_name, ospf_network, area_id)
+                switch_rows.setdefault(switch, []).append(
+                    tuple(element.strip() for element in elements[:3]))
 
-    return output
+    # Validate every switch before configuring anything.
+    snapshots = OrderedDict()
+    conflicts = []
+    for switch, rows in switch_rows.items():
+        snapshots[switch] = get_switch_snapshot(module, switch)
+        conflicts += find_conflicts(switch, snapshots[switch], rows)
 
-
-def main():
-    """ This section is for arguments parsing """
-    module = AnsibleModule(
-        argument_spec=dict(
-            pn_switch_list=dict(required=True, type='list'),
-            pn_ospf_data=dict(required=False, type='str', default=''),
+    if conflicts:
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception='Overlapping OSPF networks found, nothing configured',
+            summary=conflicts,
+            task='Configure OSPF',
+            msg='OSPF configuration failed',
+            changed=False,
+            retries=cli_retries()
         )
-    )
-
-    global CHANGED_FLAG
-    results = []
-    message = ''
 
-    message += ospf_configuration(module)
+    held = []
+    try:
+        for switch, rows in switch_rows.items():
+            ospf_configuration(module, switch, snapshots[switch], rows,
+                               held)
+    finally:
+        # Restore auto trunk on the switches the stage disabled it on, also
+        # when a switch failed half way.
+        unrestored = release_auto_trunk(module, held)
+
+    if unrestored:
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception='Could not enable auto-trunk again',
+            summary=[{
+                'switch': switch,
+                'output': 'Auto-trunk left disabled, enable it manually'
+            } for switch in unrestored],
+            task='Configure OSPF',
+            msg='OSPF configuration failed',
+            changed=RESULTS.changed,
+            retries=cli_retries()
+        )
 
-    for line in message.splitlines():
-        if ': ' in line:
-            return_msg = line.split(':')
-            json_msg = {'switch' : return_msg[0].strip(), 'output' : return_msg[1].strip()}
-            results.append(json_msg)
+    save_fingerprint(module, LOCAL_STATE)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         msg='OSPF configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Configure OSPF'
+        changed=RESULTS.changed,
+        task='Configure OSPF',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -21,7 +21,9 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import ResultCollector, VROUTERS
 
 DOCUMENTATION = """
 ---
@@ -54,7 +56,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -79,9 +81,13 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
 
 
 def run_cli(module, cli):
@@ -93,7 +99,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -110,48 +116,70 @@ def run_cli(module, cli):
             summary=results,
             task='Configure SVI',
             msg='SVI configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def svi_configuration(module, ip_gateway, switch, vlan_id):
+def get_vrouter_name(module, switch):
     """
-    Method to configure SVI inerface in the switch..
+    Method to fetch the name of the vrouter located on a switch.
     :param module: The Ansible module to fetch input parameters.
-    :param ip_gateway: IP address for the default gateway
     :param switch: Name of switch.
-    :param vlan_id: The vlan id to be assigned.
-    :return: String describing whether interface got added or not.
+    :return: Name of the vrouter.
     """
-    global CHANGED_FLAG
+    return VROUTERS.vrouter(module, run_cli, switch)
 
+
+def get_existing_interfaces(module, vrouter_name):
+    """
+    Method to fetch the vlan and address of every interface of a vrouter.
+    :param module: The Ansible module to fetch input parameters.
+    :param vrouter_name: Name of the vrouter.
+    :return: Set of (vlan id, ip address) tuples.
+    """
     cli = pn_cli(module)
-    clicopy = cli
+    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
+    cli += ' format vlan,ip parsable-delim , '
+    output = run_cli(module, cli)
+
+    existing_interfaces = set()
+    for line in output.splitlines():
+        # run_cli returns 'Success' when the vrouter has no interfaces.
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        vlan_id, ip = fields[-2], fields[-1]
+        existing_interfaces.add((vlan_id, ip.split('/')[0]))
+
+    return existing_interfaces
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch
-    cli += ' no-show-headers'
-    vrouter_name = run_cli(module, cli).split()[0]
 
-    cli = clicopy
-    cli += ' vrouter-interface-show ip %s vlan %s ' % (ip_gateway, vlan_id)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
+def svi_configuration(module, switch, svi_rows):
+    """
+    Method to configure SVI interfaces in the switch.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of switch.
+    :param svi_rows: List of (ip gateway, vlan id) tuples to be configured.
+    """
+    vrouter_name = get_vrouter_name(module, switch)
+    existing_interfaces = get_existing_interfaces(module, vrouter_name)
 
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
+    for ip_gateway, vlan_id in svi_rows:
+        if (vlan_id, ip_gateway.split('/')[0]) in existing_interfaces:
+            continue
+
+        cli = pn_cli(module)
         cli += 'switch ' + switch
         cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
         cli += ' vlan ' + vlan_id
         cli += ' ip ' + ip_gateway
         run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        return 'Added vrouter interface with ip %s\n' % (ip_gateway)
-    else:
-        return ''
+        existing_interfaces.add((vlan_id, ip_gateway.split('/')[0]))
+        RESULTS.add(switch, 'vrouter-interface-add', ip_gateway,
+                    'Added vrouter interface with ip %s' % ip_gateway)
 
 
 def main():
@@ -163,10 +191,10 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
-    results = []
-    message = ''
+    exit_if_converged(module, module.params['pn_switch'], 'Configure SVI')
+
     switch = module.params['pn_switch']
+    svi_rows = []
 
     svi_data = module.params['pn_svi_data']
     svi_data = svi_data.strip()
@@ -181,25 +209,23 @@ def main():
                 elements = row.split(',')
                 ip_gateway = elements.pop(0).strip()
                 vlan_id = elements.pop(0).strip()
+                svi_rows.append((ip_gateway, vlan_id))
 
-    message += svi_configuration(module, ip_gateway, switch, vlan_id)
+    if svi_rows:
+        svi_configuration(module, switch, svi_rows)
 
-    for line in message.splitlines():
-        if line:
-            results.append({
-                'switch': module.params['pn_switch'],
-                'output': line
-            })
+    save_fingerprint(module)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         msg='SVI configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Configure SVI'
+        changed=RESULTS.changed,
+        task='Configure SVI',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -23,6 +23,8 @@ import time
 import os
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import set_deadline, time_left
+from ansible.module_utils.pn_nvos import run_command_timeout, timed_out
 
 DOCUMENTATION = """
 ---
@@ -50,6 +52,13 @@ options:
         - Specify ips of all hosts/switches separated by comma.
       required: True
       type: str
+    pn_timeout_budget:
+      description:
+        - Seconds the module may spend in total before pending commands
+          get killed and the remaining switches are reported unreachable.
+          No budget by default.
+      required: False
+      type: int
 """
 
 EXAMPLES = """
@@ -110,8 +119,11 @@ def main():
         pn_clipassword=dict(required=True, type='str', no_log=True),
         pn_host_list=dict(required=True, type='list'),
         pn_host_ips=dict(required=True, type='str'),
+        pn_timeout_budget=dict(required=False, type='int'),
     ))
 
+    set_deadline(module.params['pn_timeout_budget'])
+
     username = module.params['pn_cliusername']
     password = module.params['pn_clipassword']
     switch_list = module.params['pn_host_list']
@@ -124,6 +136,8 @@ def main():
     changed_flag, unreachable_flag, skipped_flag = [], [], []
     unreachable_switches = []
     ssh_prefix = "ssh -t -o StrictHostKeyChecking=no"
+    # Seconds after which an ssh login attempt is considered stuck.
+    ssh_timeout = 60
 
     for ip in switch_ips:
         if is_switch_reachable(ip) != 0:
@@ -138,7 +152,7 @@ def main():
             cli += '%s %s@%s ' % (ssh_prefix, username, ip)
             cli += 'role-modify name %s shell ' % username
             cli = shlex.split(cli)
-            rc, out, err = module.run_command(cli)
+            rc, out, err = run_command_timeout(cli, ssh_timeout)
             err = err.lower()
 
             if 'permission denied' in err:
@@ -153,10 +167,11 @@ def main():
             cli += '%s %s@%s ' % (ssh_prefix, username, ip)
 
             cli = shlex.split(cli)
-            rc, out, err = module.run_command(cli)
+            rc, out, err = run_command_timeout(cli, ssh_timeout)
             err = err.lower()
 
-            if 'no route to host' in err or 'connection timed out' in err:
+            if ('no route to host' in err or 'timed out' in err or
+                    timed_out(rc)):
                 unreachable_flag.append(True)
                 result.append({
                     'switch': switch_list[count],
@@ -170,7 +185,17 @@ def main():
                 cli += 'switch-config-reset'
 
                 cli = shlex.split(cli)
-                rc, out, err = module.run_command(cli)
+                rc, out, err = run_command_timeout(cli)
+                if timed_out(rc):
+                    unreachable_flag.append(True)
+                    unreachable_switches.append(ip)
+                    result.append({
+                        'switch': switch_list[count],
+                        'output': 'Switch reset timed out'
+                    })
+                    count += 1
+                    continue
+
                 changed_flag.append(True)
                 reset_ips.append(ip)
                 result.append({
@@ -182,17 +207,27 @@ def main():
 
     if reset_ips:
         # Wait 180 secs for nvOS to come up
-        time.sleep(180)
+        remaining = time_left()
+        time.sleep(180 if remaining is None else min(180, remaining))
 
         # Check until we are able to ssh into switches
         for ip in reset_ips:
             epocs = 0
             while epocs <= 6:
+                if time_left() == 0:
+                    unreachable_flag.append(True)
+                    unreachable_switches.append(ip)
+                    result.append({
+                        'switch': switch_list[switch_ips.index(ip)],
+                        'output': 'Switch did not come up within time budget'
+                    })
+                    break
+
                 cli = 'sshpass -p %s ' % password
                 cli += '%s %s@%s ' % (ssh_prefix, username, ip)
 
                 cli = shlex.split(cli)
-                rc, out, err = module.run_command(cli)
+                rc, out, err = run_command_timeout(cli, ssh_timeout)
 
                 if 'permission denied' in err.lower():
                     break
@@ -20,8 +20,13 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import TRUNK_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector, expand_ports
 
 DOCUMENTATION = """
 ---
@@ -55,7 +60,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -80,9 +85,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -94,7 +105,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -111,12 +122,61 @@ def run_cli(module, cli):
             summary=results,
             task='Create trunks',
             msg='Trunk creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
 
 
+def get_trunks(module, switch):
+    """
+    Method to read the trunks present on a switch.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of the switch.
+    :return: Dictionary of trunk name to the set of its ports.
+    """
+    cli = pn_cli(module)
+    cli += ' switch %s trunk-show format name,ports ' % switch
+    cli += ' parsable-delim ; '
+    output = run_cli(module, cli)
+
+    trunks = {}
+    if output is not None:
+        for line in output.splitlines():
+            fields = line.strip().split(';')
+            if len(fields) < 2:
+                continue
+            trunks[fields[-2]] = expand_ports(fields[-1])
+
+    return trunks
+
+
+def find_conflicts(switch, trunks, new_trunks):
+    """
+    Method to find the ports of new trunks which are in use by another trunk.
+    :param switch: Name of the switch.
+    :param trunks: Dictionary of existing trunk name to its ports.
+    :param new_trunks: List of (name, ports) tuples of the trunks to create.
+    :return: List of summary entries describing the conflicts.
+    """
+    conflicts = []
+    used_ports = dict(trunks)
+    for name, ports in new_trunks:
+        ports = expand_ports(ports)
+        for other, other_ports in used_ports.items():
+            overlap = sorted(str(port) for port in ports & other_ports)
+            if other != name and overlap:
+                conflicts.append({
+                    'switch': switch,
+                    'output': 'Ports %s of trunk %s are in use by trunk %s' % (
+                        ','.join(overlap), name, other)
+                })
+        used_ports[name] = ports
+
+    return conflicts
+
+
 def create_trunk(module, switch, name, ports):
     """
     Method to create a trunk on a switch.
@@ -124,28 +184,12 @@ def create_trunk(module, switch, name, ports):
     :param switch: Name of the switch on which to create a trunk
     :param name: The name of the trunk to create.
     :param ports: List of connected ports.
-    :return: String describing if trunk got created or not.
     """
-    output = ''
-    new_trunk = False
-
     cli = pn_cli(module)
-    cli += ' switch %s trunk-show format name no-show-headers ' % switch
-    trunk_list = run_cli(module, cli)
-    if trunk_list is not None:
-        trunk_list = trunk_list.split()
-        if name not in trunk_list:
-            new_trunk = True
-
-    if new_trunk or trunk_list is None:
-        cli = pn_cli(module)
-        cli += ' switch %s trunk-create name %s ports %s ' % (switch, name,
-                                                              ports)
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s: Created trunk %s\n' % (switch, name)
-
-    return output
+    cli += ' switch %s trunk-create name %s ports %s ' % (switch, name,
+                                                          ports)
+    run_cli(module, cli)
+    RESULTS.add(switch, 'trunk-create', name, 'Created trunk %s' % name)
 
 
 def main():
@@ -157,10 +201,11 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
-    results = []
-    message = ''
+    exit_if_converged(module, (module.params['pn_switch_list'] or [''])[0],
+                      'Create trunks', LOCAL_STATE)
+
     switch_list = module.params['pn_switch_list']
+    switch_trunks = OrderedDict()
 
     # Create trunk
     trunk_data = module.params['pn_trunk_data']
@@ -179,30 +224,48 @@ def main():
                 ports = ','.join(elements)
 
                 if switch_name in switch_list:
-                    message += create_trunk(module, switch_name, trunk_name,
-                                            ports)
-    else:
-        CHANGED_FLAG.append(False)
+                    switch_trunks.setdefault(switch_name, OrderedDict())
+                    switch_trunks[switch_name].setdefault(trunk_name, ports)
 
-    for switch in switch_list:
-        replace_string = switch + ': '
-        for line in message.splitlines():
-            if replace_string in line:
-                results.append({
-                    'switch': switch,
-                    'output': (line.replace(replace_string, '')).strip()
-                })
+    # Validate every switch before creating anything.
+    new_trunks = OrderedDict()
+    conflicts = []
+    for switch, trunks in switch_trunks.items():
+        existing_trunks = get_trunks(module, switch)
+        new_trunks[switch] = [(name, ports) for name, ports in trunks.items()
+                              if name not in existing_trunks]
+        conflicts += find_conflicts(switch, existing_trunks,
+                                    new_trunks[switch])
+
+    if conflicts:
+        module.exit_json(
+            unreachable=False,
+            failed=True,
+            exception='Port conflicts found, no trunk created',
+            summary=conflicts,
+            task='Create trunks',
+            msg='Trunk creation failed',
+            changed=False,
+            retries=cli_retries()
+        )
+
+    for switch, trunks in new_trunks.items():
+        for name, ports in trunks:
+            create_trunk(module, switch, name, ports)
+
+    save_fingerprint(module, LOCAL_STATE)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
-        msg='Trunk creation succeeded' if True in CHANGED_FLAG \
+        msg='Trunk creation succeeded' if RESULTS.changed \
              else "No trunk configuration done",
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Create trunks'
+        changed=RESULTS.changed,
+        task='Create trunks',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -20,8 +20,12 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import ResultCollector
 
 DOCUMENTATION = """
 ---
@@ -55,7 +59,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -80,9 +84,13 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
 
 
 def run_cli(module, cli):
@@ -94,7 +102,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -111,12 +119,70 @@ def run_cli(module, cli):
             summary=results,
             task='Create vlags',
             msg='vlag creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
 
 
+def get_vlags(module):
+    """
+    Method to read the vlags present in the fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :return: Dictionary of vlag name to a dictionary of its switch, port,
+    peer switch and peer port.
+    """
+    cli = pn_cli(module)
+    cli += ' vlag-show format name,switch,port,peer-switch,peer-port '
+    cli += ' parsable-delim , '
+    output = run_cli(module, cli)
+
+    vlags = {}
+    if output is not None:
+        for line in output.splitlines():
+            fields = line.strip().split(',')
+            if len(fields) < 5:
+                continue
+            name, switch, port, peer_switch, peer_port = fields[-5:]
+            vlags[name] = {
+                'switch': switch,
+                'port': port,
+                'peer-switch': peer_switch,
+                'peer-port': peer_port
+            }
+
+    return vlags
+
+
+def find_conflicts(vlags, new_vlags):
+    """
+    Method to find the ports of new vlags which are in use by another vlag.
+    :param vlags: Dictionary of existing vlag name to its endpoints.
+    :param new_vlags: Dictionary of new vlag name to its endpoints.
+    :return: List of summary entries describing the conflicts.
+    """
+    conflicts = []
+    used_ports = {}
+    for name, vlag in vlags.items():
+        used_ports[(vlag['switch'], vlag['port'])] = name
+        used_ports[(vlag['peer-switch'], vlag['peer-port'])] = name
+
+    for name, vlag in new_vlags.items():
+        for endpoint in ((vlag['switch'], vlag['port']),
+                         (vlag['peer-switch'], vlag['peer-port'])):
+            other = used_ports.get(endpoint)
+            if other is not None and other != name:
+                conflicts.append({
+                    'switch': endpoint[0],
+                    'output': 'Port %s of vLag %s is in use by vLag %s' % (
+                        endpoint[1], name, other)
+                })
+            used_ports[endpoint] = name
+
+    return conflicts
+
+
 def create_vlag(module, name, switch, port, peer_switch, peer_port):
     """
     Create virtual link aggregation groups.
@@ -126,30 +192,13 @@ def create_vlag(module, name, switch, port, peer_switch, peer_port):
     :param port: Name of the trunk on local switch.
     :param peer_switch: Name of the peer switch.
     :param peer_port: Name of the trunk on peer switch.
-    :return: String describing if vlag got created or not.
     """
-    output = ''
-    new_vlag = False
-
     cli = pn_cli(module)
-    cli += ' switch %s vlag-show format switch,peer-switch, ' % switch
-    cli += ' no-show-headers '
-    vlag_list = run_cli(module, cli)
-    if vlag_list is not None:
-        vlag_list = vlag_list.split()
-        if peer_switch not in vlag_list:
-            new_vlag = True
-
-    if new_vlag or vlag_list is None:
-        cli = pn_cli(module)
-        cli += ' switch %s vlag-create name %s port %s ' % (switch, name, port)
-        cli += ' peer-switch %s peer-port %s ' % (peer_switch, peer_port)
-        cli += ' mode active-active '
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s: Configured vLag %s\n' % (switch, name)
-
-    return output
+    cli += ' switch %s vlag-create name %s port %s ' % (switch, name, port)
+    cli += ' peer-switch %s peer-port %s ' % (peer_switch, peer_port)
+    cli += ' mode active-active '
+    run_cli(module, cli)
+    RESULTS.add(switch, 'vlag-create', name, 'Configured vLag %s' % name)
 
 
 def main():
@@ -161,9 +210,10 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
-    results = []
-    message = ''
+    exit_if_converged(module, (module.params['pn_switch_list'] or [''])[0],
+                      'Create vlags')
+
+    csv_vlags = OrderedDict()
 
     # Create vlag
     vlag_data = module.params['pn_vlag_data']
@@ -178,36 +228,49 @@ def main():
             else:
                 elements = row.split(',')
                 if len(elements) == 5:
-                    vlag_name = elements[0].strip()
-                    local_switch = elements[1].strip()
-                    local_ports = elements[2].strip()
-                    peer_switch = elements[3].strip()
-                    peer_ports = elements[4].strip()
-
-                    message += create_vlag(module, vlag_name, local_switch,
-                                           local_ports, peer_switch, peer_ports)
-    else:
-        CHANGED_FLAG.append(False)
-
-    for switch in module.params['pn_switch_list']:
-        replace_string = switch + ': '
-        for line in message.splitlines():
-            if replace_string in line:
-                results.append({
-                    'switch': switch,
-                    'output': (line.replace(replace_string, '')).strip()
-                })
+                    csv_vlags.setdefault(elements[0].strip(), {
+                        'switch': elements[1].strip(),
+                        'port': elements[2].strip(),
+                        'peer-switch': elements[3].strip(),
+                        'peer-port': elements[4].strip()
+                    })
+
+    if csv_vlags:
+        # Validate all vlags before creating anything.
+        vlags = get_vlags(module)
+        new_vlags = OrderedDict((name, vlag)
+                                for name, vlag in csv_vlags.items()
+                                if name not in vlags)
+        conflicts = find_conflicts(vlags, new_vlags)
+        if conflicts:
+            module.exit_json(
+                unreachable=False,
+                failed=True,
+                exception='Port conflicts found, no vlag created',
+                summary=conflicts,
+                task='Create vlags',
+                msg='vlag creation failed',
+                changed=False,
+                retries=cli_retries()
+            )
+
+        for name, vlag in new_vlags.items():
+            create_vlag(module, name, vlag['switch'], vlag['port'],
+                        vlag['peer-switch'], vlag['peer-port'])
+
+    save_fingerprint(module)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
-        msg='vlag creation succeeded' if True in CHANGED_FLAG \
+        msg='vlag creation succeeded' if RESULTS.changed \
              else "No vlag configuration done",
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Create vlags'
+        changed=RESULTS.changed,
+        task='Create vlags',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -20,8 +20,13 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import VLAN_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector
 
 DOCUMENTATION = """
 ---
@@ -54,7 +59,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -79,25 +84,50 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+avoided_creates:
+  description: Number of vlan-create commands avoided because the vlan was
+    present already or got created as part of a range.
+  returned: always
+  type: int
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+# Errors of switches whose vlan-create does not take a range of ids.
+RANGE_UNSUPPORTED_ERRORS = ('unrecognized argument: range',
+                            'unrecognized argument range',
+                            'unknown argument: range',
+                            'unknown argument range',
+                            'invalid argument: range')
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
-def run_cli(module, cli):
+def run_cli(module, cli, unsupported=()):
     """
     Execute the cli command on the target node(s) and returns the output.
     :param module: The Ansible module to fetch input parameters.
     :param cli: The complete cli string to be executed on the target node(s).
-    :return: Output or Error msg depending upon the response from cli else None.
+    :param unsupported: Errors of a syntax the switch does not support, which
+    are returned as False instead of failing the module.
+    :return: Output or Error msg depending upon the response from cli else None,
+    False on an unsupported syntax.
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
     if err:
+        error = err.lower().replace('"', '').replace("'", '')
+        for unsupported_error in unsupported:
+            if unsupported_error in error:
+                return False
+
         json_msg = {
             'switch': module.params['pn_switch'],
             'output': u'Operation Failed: {}'.format(' '.join(cli))
@@ -110,46 +140,164 @@ def run_cli(module, cli):
             summary=results,
             task='Create vlans',
             msg='vlan creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
 
 
+def parse_vlan_data(module, vlan_data):
+    """
+    Method to group the rows of the vlan csv data by switch. Rows repeating
+    a vlan of a switch have their untagged ports merged.
+    :param module: The Ansible module to fetch input parameters.
+    :param vlan_data: String containing vlan data parsed from csv file.
+    :return: Dictionary of switch name to a dictionary of vlan id to the
+    untagged ports of that vlan, switches in the order of the csv file.
+    """
+    switch_vlans = OrderedDict()
+    vlan_data = vlan_data.replace(' ', '')
+    for row in vlan_data.split('\n'):
+        row = row.strip()
+        if not row or row.startswith('#'):
+            continue
+
+        elements = row.split(',')
+        switch_name = elements.pop(0).strip()
+        vlan_id = elements.pop(0).strip() if elements else ''
+        if not vlan_id.isdigit():
+            module.exit_json(
+                unreachable=False,
+                failed=True,
+                exception='Invalid vlan id in row: %s' % row,
+                summary=[{
+                    'switch': switch_name,
+                    'output': 'Invalid vlan id in row: %s' % row
+                }],
+                task='Create vlans',
+                msg='vlan creation failed',
+                changed=False,
+                retries=cli_retries()
+            )
+        vlan_id = int(vlan_id)
+
+        vlans = switch_vlans.setdefault(switch_name, OrderedDict())
+        untagged_ports = (vlans.get(vlan_id) or '').split(',')
+        untagged_ports += [port for port in elements
+                           if port and port not in untagged_ports]
+        vlans[vlan_id] = ','.join(port for port in untagged_ports
+                                  if port) or None
+
+    return switch_vlans
+
+
+def get_existing_vlans(module, switch_name):
+    """
+    Method to read the vlans already present on a switch.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch_name: Name of the switch.
+    :return: Set of vlan ids present on the switch.
+    """
+    cli = pn_cli(module)
+    cli += ' switch %s vlan-show format id no-show-headers ' % switch_name
+    existing_vlans = run_cli(module, cli)
+    if existing_vlans is None:
+        return set()
+
+    return set(int(vlan) for vlan in existing_vlans.split() if vlan.isdigit())
+
+
+def vlan_ranges(vlans):
+    """
+    Method to coalesce vlans into runs of contiguous ids sharing the same
+    untagged ports.
+    :param vlans: Dictionary of vlan id to untagged ports.
+    :return: List of (first id, last id, untagged ports) tuples.
+    """
+    ranges = []
+    for vlan_id in sorted(vlans):
+        untagged_ports = vlans[vlan_id]
+        if ranges and ranges[-1][1] == vlan_id - 1 and \
+                ranges[-1][2] == untagged_ports:
+            ranges[-1] = (ranges[-1][0], vlan_id, untagged_ports)
+        else:
+            ranges.append((vlan_id, vlan_id, untagged_ports))
+
+    return ranges
+
+
 def create_vlan(module, switch_name, vlan_id, untagged_ports):
     """
     Method to create a vlan.
     :param module: The Ansible module to fetch input parameters.
+    :param switch_name: Name of the switch.
     :param vlan_id: vlan id to be created.
     :param untagged_ports: List of untagged ports.
-    :return: String describing if vlan got created or not.
     """
-    global CHANGED_FLAG
-    output = ''
-    new_vlan = False
+    cli = pn_cli(module)
+    cli += ' switch %s vlan-create id %s ' % (switch_name, vlan_id)
+    cli += ' scope local '
+
+    if untagged_ports is not None:
+        cli += ' untagged-ports %s ' % untagged_ports
+
+    run_cli(module, cli)
+    RESULTS.add(switch_name, 'vlan-create', vlan_id,
+                'Created vlan with id %s' % vlan_id)
+
+
+def create_vlan_range(module, switch_name, first, last, untagged_ports):
+    """
+    Method to create a range of vlans with a single command, falling back to
+    one command per vlan on switches whose vlan-create takes no range.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch_name: Name of the switch.
+    :param first: First vlan id of the range.
+    :param last: Last vlan id of the range.
+    :param untagged_ports: List of untagged ports.
+    :return: Number of vlan-create commands saved by the range create.
+    """
+    if first == last:
+        create_vlan(module, switch_name, first, untagged_ports)
+        return 0
 
     cli = pn_cli(module)
-    cli += ' switch %s vlan-show format id no-show-headers ' % switch_name
-    existing_vlans = run_cli(module, cli)
+    cli += ' switch %s vlan-create range %s-%s ' % (switch_name, first, last)
+    cli += ' scope local '
+
+    if untagged_ports is not None:
+        cli += ' untagged-ports %s ' % untagged_ports
 
-    if existing_vlans is not None:
-        existing_vlans = existing_vlans.split()
-        if vlan_id not in existing_vlans:
-            new_vlan = True
+    if run_cli(module, cli, RANGE_UNSUPPORTED_ERRORS) is False:
+        for vlan_id in range(first, last + 1):
+            create_vlan(module, switch_name, vlan_id, untagged_ports)
+        return 0
 
-    if new_vlan or existing_vlans is None:
-        cli = pn_cli(module)
-        cli += ' switch %s vlan-create id %s ' % (switch_name, vlan_id)
-        cli += ' scope local '
+    RESULTS.add(switch_name, 'vlan-create', '%s-%s' % (first, last),
+                'Created vlans with ids %s-%s' % (first, last))
+    return last - first
 
-        if untagged_ports is not None:
-            cli += ' untagged-ports %s ' % untagged_ports
 
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s:Created vlan with id %s\n' % (switch_name, vlan_id)
+def create_vlans(module, switch_name, vlans):
+    """
+    Method to create the vlans of a switch which are not present yet.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch_name: Name of the switch.
+    :param vlans: Dictionary of vlan id to untagged ports.
+    :return: Number of vlan-create commands avoided.
+    """
+    existing_vlans = get_existing_vlans(module, switch_name)
+    missing_vlans = dict((vlan_id, untagged_ports)
+                         for vlan_id, untagged_ports in vlans.items()
+                         if vlan_id not in existing_vlans)
 
-    return output
+    avoided = len(vlans) - len(missing_vlans)
+    for first, last, untagged_ports in vlan_ranges(missing_vlans):
+        avoided += create_vlan_range(module, switch_name, first, last,
+                                     untagged_ports)
+
+    return avoided
 
 
 def main():
@@ -161,57 +309,32 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
-    results = []
-    message = ''
+    exit_if_converged(module, module.params['pn_switch'], 'Create vlans',
+                      LOCAL_STATE)
+
+    avoided_creates = 0
 
     # Create vlans
-    vlan_data = module.params['pn_vlan_data']
-    vlan_data = vlan_data.strip()
+    vlan_data = module.params['pn_vlan_data'].strip()
     if vlan_data:
-        vlan_data = vlan_data.replace(' ', '')
-        vlan_data_list = vlan_data.split('\n')
-        for row in vlan_data_list:
-            row = row.strip()
-            if not row or row.startswith('#'):
-                continue
-            else:
-                elements = row.split(',')
-                elements = filter(None, elements)
-                switch_name = elements.pop(0).strip()
-                vlan_id = elements.pop(0).strip()
-                if len(elements) > 0:
-                    untagged_ports = ','.join(elements)
-                else:
-                    untagged_ports = None
-
-                message += create_vlan(module, switch_name, vlan_id, untagged_ports)
-    else:
-        CHANGED_FLAG.append(False)
-
-    for line in message.splitlines():
-        if line:
-            switch = module.params['pn_switch']
-            if ':' in line:
-                line = line.split(':')
-                switch = line[0]
-                line = line[1]
+        switch_vlans = parse_vlan_data(module, vlan_data)
+        for switch_name, vlans in switch_vlans.items():
+            avoided_creates += create_vlans(module, switch_name, vlans)
 
-            results.append({
-                'switch': switch,
-                'output': line
-            })
+    save_fingerprint(module, LOCAL_STATE)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
-        msg='vlan creation succeeded' if  True in CHANGED_FLAG \
+        msg='vlan creation succeeded' if RESULTS.changed \
              else "No Vlan Configuration Done",
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Create vlans'
+        changed=RESULTS.changed,
+        task='Create vlans',
+        avoided_creates=avoided_creates,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -21,7 +21,9 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import ResultCollector, VROUTERS
 
 DOCUMENTATION = """
 ---
@@ -61,7 +63,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -86,9 +88,13 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
 
 
 def run_cli(module, cli):
@@ -100,7 +106,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -117,123 +123,154 @@ def run_cli(module, cli):
             summary=results,
             task='Configure vrrp',
             msg='Vrrp configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
 
 
-def create_vlan(module, switch, vlan_id, untagged_ports=None):
+def get_existing_vlans(module):
+    """
+    Method to read the vlans present in the fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :return: Set of vlan ids.
+    """
+    cli = pn_cli(module)
+    cli += ' vlan-show format id no-show-headers '
+    existing_vlans = run_cli(module, cli)
+    if existing_vlans is None:
+        return set()
+
+    return set(existing_vlans.split())
+
+
+def get_switch_index(module, switch):
+    """
+    Method to snapshot the vrouter of a switch along with its interfaces.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of the switch.
+    :return: Dictionary holding the vrouter name and a dictionary of
+    (vlan id, ip address) to the nic and vrrp primary of that interface.
+    """
+    vrouter_name = VROUTERS.vrouter(module, run_cli, switch)
+
+    cli = pn_cli(module)
+    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
+    cli += ' format vlan,ip,nic,vrrp-primary parsable-delim , '
+    output = run_cli(module, cli)
+
+    interfaces = {}
+    if output is not None:
+        for line in output.splitlines():
+            fields = line.strip().split(',')
+            if len(fields) < 4:
+                continue
+            vlan_id, ip, nic, vrrp_primary = fields[-4:]
+            interfaces[(vlan_id, ip.split('/')[0])] = {
+                'nic': nic,
+                'vrrp-primary': vrrp_primary
+            }
+
+    return {
+        'vrouter': vrouter_name,
+        'interfaces': interfaces
+    }
+
+
+def create_vlan(module, switch, vlan_id, existing_vlans, untagged_ports=None):
     """
     Method to create a vlan.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the switch.
     :param vlan_id: vlan id to be created.
+    :param existing_vlans: Set of vlan ids present in the fabric.
     :param untagged_ports: List of untagged ports.
-    :return: String describing if vlan got created or not.
     """
-    global CHANGED_FLAG
-    output = ''
-    new_vlan = False
+    if vlan_id in existing_vlans:
+        return
 
     cli = pn_cli(module)
-    cli += ' vlan-show format id no-show-headers '
-    existing_vlans = run_cli(module, cli)
+    cli += ' vlan-create id %s scope fabric ' % vlan_id
 
-    if existing_vlans is not None:
-        existing_vlans = existing_vlans.split()
-        if vlan_id not in existing_vlans:
-            new_vlan = True
+    if untagged_ports is not None:
+        cli += ' untagged-ports %s ' % untagged_ports
 
-    if new_vlan or existing_vlans is None:
-        cli = pn_cli(module)
-        cli += ' vlan-create id %s scope fabric ' % vlan_id
+    run_cli(module, cli)
+    existing_vlans.add(vlan_id)
+    RESULTS.add(switch, 'vlan-create', vlan_id,
+                'Created vlan with id %s' % vlan_id)
 
-        if untagged_ports is not None:
-            cli += ' untagged-ports %s ' % untagged_ports
 
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s: Created vlan with id %s\n' % (switch, vlan_id)
-
-    return output
+def get_interface_nic(module, vrouter_name, ip, vlan_id):
+    """
+    Method to fetch the nic of a freshly added vrouter interface.
+    :param module: The Ansible module to fetch input parameters.
+    :param vrouter_name: Name of the vrouter.
+    :param ip: Address of the interface.
+    :param vlan_id: vlan id of the interface.
+    :return: Name of the nic.
+    """
+    cli = pn_cli(module)
+    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
+    cli += ' ip %s vlan %s ' % (ip, vlan_id)
+    cli += ' format nic no-show-headers '
+    eth_port = run_cli(module, cli).split()
+    eth_port.remove(vrouter_name)
+    return eth_port[0]
 
 
-def create_vrouter_interface(module, switch, vrrp_ip, gateway_ip, vlan_id,
-                             vrrp_priority):
+def create_vrouter_interface(module, switch, index, vrrp_ip, gateway_ip,
+                             vlan_id, vrrp_priority):
     """
     Add vrouter interface and assign IP along with vrrp_id and vrrp_priority.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the switch on which to add vrouter interface.
+    :param index: Snapshot of the vrouter and interfaces of the switch.
     :param vrrp_ip: Vrrp interface address to be assigned to vrouter interface.
     :param gateway_ip: Gateway interface to be assigned to vrouter.
     :param vlan_id: vlan_id to be assigned.
     :param vrrp_priority: Priority to be given(110 for active switch).
-    :return: String describing if vrouter interfaces got added or not.
     """
-    global CHANGED_FLAG
-    output = ''
-    new_gateway, new_vrrp_ip = False, False
     vrrp_id = module.params['pn_vrrp_id']
+    vrouter_name = index['vrouter']
+    interfaces = index['interfaces']
 
-    # Find vrouter name
-    cli = pn_cli(module)
-    cli += ' vrouter-show location %s ' % switch
-    cli += ' format name no-show-headers '
-    vrouter_name = run_cli(module, cli).split()[0]
-
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vlan %s ip %s ' % (vlan_id, vrrp_ip)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli)
-
-    if existing_vrouter is not None:
-        existing_vrouter = existing_vrouter.split()
-        if vrouter_name not in existing_vrouter:
-            new_vrrp_ip = True
-
-    if new_vrrp_ip or existing_vrouter is None:
+    vrrp_key = (vlan_id, vrrp_ip.split('/')[0])
+    if vrrp_key not in interfaces:
         cli = pn_cli(module)
         cli += ' switch %s ' % switch
         cli += ' vrouter-interface-add vrouter-name %s ' % vrouter_name
         cli += ' ip %s vlan %s if data ' % (vrrp_ip, vlan_id)
         run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s: Added vrouter interface with ip %s on %s\n' % (
-            switch, vrrp_ip, vrouter_name)
+        interfaces[vrrp_key] = {
+            'nic': get_interface_nic(module, vrouter_name, vrrp_ip, vlan_id),
+            'vrrp-primary': ''
+        }
+        RESULTS.add(switch, 'vrouter-interface-add', vrrp_ip,
+                    'Added vrouter interface with ip %s on %s' % (
+                        vrrp_ip, vrouter_name))
 
-    cli = clicopy
-    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
-    cli += ' ip %s vlan %s ' % (vrrp_ip, vlan_id)
-    cli += ' format nic no-show-headers '
-    eth_port = run_cli(module, cli).split()
-    eth_port.remove(vrouter_name)
+    eth_port = interfaces[vrrp_key]['nic']
 
-    cli = clicopy
-    cli += ' vrouter-interface-show vlan %s ' % vlan_id
-    cli += ' ip %s vrrp-primary %s ' % (gateway_ip, eth_port[0])
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli)
-    if existing_vrouter is not None:
-        existing_vrouter = existing_vrouter.split()
-        if vrouter_name not in existing_vrouter:
-            new_gateway = True
-
-    if new_gateway or existing_vrouter is None:
-        cli = clicopy
+    gateway_key = (vlan_id, gateway_ip.split('/')[0])
+    gateway = interfaces.get(gateway_key)
+    if gateway is None or gateway['vrrp-primary'] != eth_port:
+        cli = pn_cli(module)
         cli += ' switch %s ' % switch
         cli += ' vrouter-interface-add vrouter-name %s ' % vrouter_name
         cli += ' ip %s vlan %s if data vrrp-id %s ' % (gateway_ip, vlan_id,
                                                        vrrp_id)
-        cli += ' vrrp-primary %s vrrp-priority %s ' % (eth_port[0],
+        cli += ' vrrp-primary %s vrrp-priority %s ' % (eth_port,
                                                        vrrp_priority)
         run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += '%s: Added vrouter interface with ip %s on %s\n' % (
-            switch, gateway_ip, vrouter_name)
-
-    return output
+        interfaces[gateway_key] = {
+            'nic': '',
+            'vrrp-primary': eth_port
+        }
+        RESULTS.add(switch, 'vrouter-interface-add', gateway_ip,
+                    'Added vrouter interface with ip %s on %s' % (
+                        gateway_ip, vrouter_name))
 
 
 def main():
@@ -246,15 +283,19 @@ def main():
         )
     )
 
-    global CHANGED_FLAG
-    results = []
-    message = ''
+    exit_if_converged(module, (module.params['pn_switch_list'] or [''])[0],
+                      'Configure vrrp')
+
     switch_list = module.params['pn_switch_list']
 
     # Configure vrrp
     vrrp_data = module.params['pn_vrrp_data']
     vrrp_data = vrrp_data.strip()
     if vrrp_data:
+        existing_vlans = get_existing_vlans(module)
+        switch_index = dict((switch, get_switch_index(module, switch))
+                            for switch in switch_list)
+
         vrrp_data = vrrp_data.replace(' ', '')
         vrrp_data_list = vrrp_data.split('\n')
         for row in vrrp_data_list:
@@ -269,7 +310,7 @@ def main():
                 secondary_ip = elements.pop(0).strip()
                 active_switch = elements.pop(0).strip()
 
-                message += create_vlan(module, switch_list[0], vlan_id)
+                create_vlan(module, switch_list[0], vlan_id, existing_vlans)
 
                 for switch in switch_list:
                     if switch == active_switch:
@@ -279,28 +320,23 @@ def main():
                         vrrp_priority = '109'
                         vrrp_ip = secondary_ip
 
-                    message += create_vrouter_interface(module, switch, vrrp_ip,
-                                                        gateway_ip, vlan_id,
-                                                        vrrp_priority)
+                    create_vrouter_interface(module, switch,
+                                             switch_index[switch], vrrp_ip,
+                                             gateway_ip, vlan_id,
+                                             vrrp_priority)
 
-    for switch in switch_list:
-        replace_string = switch + ': '
-        for line in message.splitlines():
-            if replace_string in line:
-                results.append({
-                    'switch': switch,
-                    'output': (line.replace(replace_string, '')).strip()
-                })
+    save_fingerprint(module)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         msg='Vrrp configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False,
-        task='Configure vrrp'
+        changed=RESULTS.changed,
+        task='Configure vrrp',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -48,6 +48,12 @@ options:
         - Specify list of leaf hosts
       required: False
       type: list
+    pn_current_switch:
+      description:
+        - Name of the switch on which this task is currently getting executed.
+        - When given, only the bgp neighbors of its own vrouter get added.
+      required: False
+      type: str
     pn_cidr_ipv4:
       description:
         - Specify CIDR value to be used in configuring IPv4 address.
@@ -149,9 +155,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -163,7 +175,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -182,7 +194,8 @@ def run_cli(module, cli):
             task='Configure eBGP',
             stderr=err.strip(),
             msg='eBGP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -260,10 +273,7 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
         output += ' %s: Created vlan with id %s \n' % (switch_name, vlan_id)
         CHANGED_FLAG.append(True)
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s ' % interface_ip
@@ -416,164 +426,122 @@ def assign_ibgp_interface(module, dict_bgp_as):
     return output
 
 
-def add_bgp_neighbor(module, dict_bgp_as):
+def link_key(address):
     """
-    Method to add bgp_neighbor to the vrouters.
+    Method to compute the key of the link an interface address belongs to.
+    :param address: The ipv4 or ipv6 address along with its prefix length.
+    :return: Tuple of the address family, network and prefix length.
+    """
+    address, prefix = address.split('/')
+    prefix = int(prefix)
+    if ':' in address:
+        return 6, ipv6_to_int(address) >> (128 - prefix), prefix
+    return 4, ipv4_to_int(address) >> (32 - prefix), prefix
+
+
+def plan_bgp_neighbors(module, dict_bgp_as):
+    """
+    Method to plan the bgp neighbors of the spine to leaf links from the
+    interface and bgp tables of all vrouters.
     :param module: The Ansible module to fetch input parameters.
     :param dict_bgp_as: Dictionary containing bgp-as of all switches.
-    :return: String describing if bgp neighbors got added or not.
+    :return: List of (switch, vrouter, neighbor, remote-as, ipv6, clustered)
+    tuples of the neighbors which are not configured yet.
     """
-    global CHANGED_FLAG
-    output = ''
+    spine_list = module.params['pn_spine_list']
+    leaf_list = module.params['pn_leaf_list']
     cli = pn_cli(module)
-    addr_type = module.params['pn_addr_type']
     clicopy = cli
 
-    spine_dict = dict()
-    for spine in module.params['pn_spine_list']:
-        spine_dict[spine] = list()
-
-    for leaf in  module.params['pn_leaf_list']:
-        leaf_input = list()
-        cli = clicopy
-        cli += ' vrouter-show location %s' % leaf
-        cli += ' format name no-show-headers'
-        vrouter_leaf = run_cli(module, cli).split()[0]
-
-        cli = clicopy
-        cli += 'vrouter-interface-show vrouter-name %s ' % vrouter_leaf
-        cli += 'format l3-port,ip,'
-        if addr_type == 'ipv4_ipv6':
-            cli += 'ip2'
-        cli += ' parsable-delim ,'
-        vr_leaf_out = run_cli(module, cli).strip().split('\n')
-        for vr in vr_leaf_out:
-            vr = vr.strip().split(',')
-            if vr[1]:
-                leaf_input.append(vr)
-
-        count = 0
-        for spine in module.params['pn_spine_list']:
-            spine_dict[spine].append(leaf_input[count])
-            count += 1
-
-    for spine in module.params['pn_spine_list']:
-        for bgp_neighbor in spine_dict[spine]:
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + dict_bgp_as[bgp_neighbor[0][:-8]]
-            cli += ' neighbor %s format switch no-show-headers ' % bgp_neighbor[2]
-            already_added = run_cli(module, cli).split()
-
-            if spine+'-vrouter' in already_added:
-                output += ''
-            else:
-                cli = clicopy
-                cli += ' vrouter-bgp-add vrouter-name ' + spine + '-vrouter'
-                cli += ' neighbor %s remote-as %s ' % (bgp_neighbor[2],
-                                                       dict_bgp_as[bgp_neighbor[0][:-8]])
-                if module.params['pn_bfd']:
-                    cli += ' bfd '
-
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        spine, bgp_neighbor[1], spine+'vrouter'
-                    )
-                    CHANGED_FLAG.append(True)
-
-            if addr_type == 'ipv4_ipv6':
-                cli = clicopy
-                cli += ' vrouter-bgp-show remote-as ' + dict_bgp_as[bgp_neighbor[0][:-8]]
-                cli += ' neighbor %s format switch no-show-headers ' % bgp_neighbor[3]
-                already_added = run_cli(module, cli).split()
-
-                if spine+'-vrouter' in already_added:
-                    output += ''
-                else:
-                    cli = clicopy
-                    cli += ' vrouter-bgp-add vrouter-name ' + spine + '-vrouter'
-                    cli += ' neighbor %s remote-as %s ' % (bgp_neighbor[3],
-                                                           dict_bgp_as[bgp_neighbor[0][:-8]])
-                    cli += ' multi-protocol ipv6-unicast'
-                    if module.params['pn_bfd']:
-                        cli += ' bfd '
-
-                    if 'Success' in run_cli(module, cli):
-                        output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                            spine, bgp_neighbor[1], spine+'vrouter'
-                        )
-                        CHANGED_FLAG.append(True)
-
-    leaf_dict = dict()
-    for leaf in module.params['pn_leaf_list']:
-        leaf_dict[leaf] = list()
-
-    for spine in  module.params['pn_spine_list']:
-        spine_input = list()
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+    cli += ' vrouter-interface-show format vrouter-name,l3-port,ip,ip2 '
+    cli += ' parsable-delim , '
+    spine_interfaces = []
+    leaf_interfaces = {}
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 4:
+            continue
+        vrouter, l3_port, ip, ip2 = fields[-4:]
+        switch = VROUTERS.switch(module, run_cli, vrouter)
+        if not l3_port or '/' not in ip:
+            continue
+        if switch in spine_list:
+            spine_interfaces.append((switch, vrouter, ip, ip2))
+        elif switch in leaf_list:
+            leaf_interfaces[link_key(ip)] = (switch, vrouter, ip, ip2)
 
-        cli = clicopy
-        cli += 'vrouter-interface-show vrouter-name %s ' % vrouter_spine
-        cli += 'format l3-port,ip,ip2 parsable-delim ,'
-        vr_spine_out = run_cli(module, cli).strip().split('\n')
-
-        for vr in vr_spine_out:
-            vr = vr.strip().split(',')
-            if vr[1]:
-                spine_input.append(vr)
-
-        count = 0
-        for leaf in module.params['pn_leaf_list']:
-            leaf_dict[leaf].append(spine_input[count])
-            count += 1
-
-    for leaf in module.params['pn_leaf_list']:
-        for bgp_neighbor in leaf_dict[leaf]:
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + dict_bgp_as[bgp_neighbor[0][:-8]]
-            cli += ' neighbor %s format switch no-show-headers ' % bgp_neighbor[2]
-            already_added = run_cli(module, cli).split()
+    cli = clicopy
+    cli += ' vrouter-bgp-show format vrouter-name,neighbor,remote-as '
+    cli += ' parsable-delim , '
+    existing = set()
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 3:
+            continue
+        existing.add(tuple(fields[-3:]))
+
+    # Leafs of a cluster share their bgp-as.
+    leaf_as = [dict_bgp_as[leaf] for leaf in leaf_list]
+    clustered = set(leaf for leaf in leaf_list
+                    if leaf_as.count(dict_bgp_as[leaf]) > 1)
+
+    spine_side = []
+    leaf_side = []
+    for spine, vrouter_spine, ip_spine, ip2_spine in spine_interfaces:
+        link = leaf_interfaces.get(link_key(ip_spine))
+        if link is None:
+            continue
+
+        leaf, vrouter_leaf, ip_leaf, ip2_leaf = link
+        peers = [(ip_spine, ip_leaf, False)]
+        if module.params['pn_addr_type'] == 'ipv4_ipv6' and \
+                ip2_spine and ip2_leaf:
+            peers.append((ip2_spine, ip2_leaf, True))
+
+        for spine_address, leaf_address, ipv6 in peers:
+            spine_side.append((spine, vrouter_spine,
+                               leaf_address.split('/')[0],
+                               dict_bgp_as[leaf], ipv6, False))
+            leaf_side.append((leaf, vrouter_leaf,
+                              spine_address.split('/')[0],
+                              dict_bgp_as[spine], ipv6, leaf in clustered))
+
+    leaf_side.sort(key=lambda neighbor: leaf_list.index(neighbor[0]))
+    return [neighbor for neighbor in spine_side + leaf_side
+            if neighbor[1:4] not in existing]
 
-            if leaf+'-vrouter' in already_added:
-                output += ''
-            else:
-                cli = clicopy
-                cli += ' vrouter-bgp-add vrouter-name ' + leaf + '-vrouter'
-                cli += ' neighbor %s remote-as %s ' % (bgp_neighbor[2],
-                                                       dict_bgp_as[bgp_neighbor[0][:-8]])
-                if module.params['pn_bfd']:
-                    cli += ' bfd '
 
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        leaf, bgp_neighbor[1], leaf+'-vrouter'
-                    )
-                    CHANGED_FLAG.append(True)
-
-            if addr_type == 'ipv4_ipv6':
-                cli = clicopy
-                cli += ' vrouter-bgp-show remote-as ' + dict_bgp_as[bgp_neighbor[0][:-8]]
-                cli += ' neighbor %s format switch no-show-headers ' % bgp_neighbor[3]
-                already_added = run_cli(module, cli).split()
+def add_bgp_neighbor(module, dict_bgp_as):
+    """
+    Method to add bgp_neighbor to the vrouters.
+    :param module: The Ansible module to fetch input parameters.
+    :param dict_bgp_as: Dictionary containing bgp-as of all switches.
+    :return: String describing if bgp neighbors got added or not.
+    """
+    global CHANGED_FLAG
+    output = ''
+    current_switch = module.params['pn_current_switch']
+
+    for switch, vrouter, neighbor, remote_as, ipv6, clustered in \
+            plan_bgp_neighbors(module, dict_bgp_as):
+        if current_switch and switch != current_switch:
+            continue
+
+        cli = pn_cli(module)
+        cli += ' vrouter-bgp-add vrouter-name ' + vrouter
+        cli += ' neighbor %s remote-as %s ' % (neighbor, remote_as)
+        if ipv6:
+            cli += ' multi-protocol ipv6-unicast'
+        if module.params['pn_bfd']:
+            cli += ' bfd '
+        if clustered:
+            cli += ' weight 100 allowas-in '
 
-                if leaf+'-vrouter' in already_added:
-                    output += ''
-                else:
-                    cli = clicopy
-                    cli += ' vrouter-bgp-add vrouter-name ' + leaf + '-vrouter'
-                    cli += ' neighbor %s remote-as %s' % (bgp_neighbor[3],
-                                                          dict_bgp_as[bgp_neighbor[0][:-8]])
-                    cli += ' multi-protocol ipv6-unicast'
-                    if module.params['pn_bfd']:
-                        cli += ' bfd '
-
-                    if 'Success' in run_cli(module, cli):
-                        output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                            leaf, bgp_neighbor[1], leaf+'-vrouter'
-                        )
-                        CHANGED_FLAG.append(True)
+        if 'Success' in run_cli(module, cli):
+            output += ' %s: Added BGP Neighbor %s for %s \n' % (
+                switch, neighbor, vrouter
+            )
+            CHANGED_FLAG.append(True)
 
     return output
 
@@ -604,10 +572,7 @@ def assign_router_id(module, vrouter_names):
                     vrouter, loopback_ip[0])
 
                 if 'Success' in run_cli(module, cli):
-                    cli = clicopy
-                    cli += ' vrouter-show name ' + vrouter
-                    cli += ' format location no-show-headers '
-                    switch = run_cli(module, cli).split()[0]
+                    switch = VROUTERS.switch(module, run_cli, vrouter)
 
                     output += ' %s: Added router id %s to %s \n' % (
                         switch, loopback_ip[0], vrouter)
@@ -633,10 +598,7 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter
-        cli += ' format location no-show-headers '
-        switch = run_cli(module, cli).split()[0]
+        switch = VROUTERS.switch(module, run_cli, vrouter)
 
         cli = clicopy
         cli += ' vrouter-modify name %s ' % vrouter
@@ -652,25 +614,6 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     return output
 
 
-def find_non_clustered_leafs(module):
-    """
-    Method to find leafs which are not part of any cluster.
-    :param module: The Ansible module to fetch input parameters.
-    :return: List of non clustered leaf switches.
-    """
-    non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
-
-    for leaf in module.params['pn_leaf_list']:
-        if leaf not in clustered_nodes:
-            non_clustered_leafs.append(leaf)
-
-    return non_clustered_leafs
-
-
 def create_cluster(module, name, node1, node2):
     """
     Method to create a cluster between two switches.
@@ -703,47 +646,12 @@ def create_leaf_clusters(module):
     :return: Output of create_cluster() method.
     """
     output = ''
-    non_clustered_leafs = find_non_clustered_leafs(module)
-    non_clustered_leafs_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
+    _, new_pairs = plan_leaf_clusters(
+        module, run_cli, module.params['pn_leaf_list'])
 
-    while non_clustered_leafs_count == 0:
-        if len(non_clustered_leafs) == 0:
-            non_clustered_leafs_count += 1
-        else:
-            node1 = non_clustered_leafs[0]
-            non_clustered_leafs.remove(node1)
-
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
-                if node2 in non_clustered_leafs:
-                    # Cluster creation
-                    cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    output += create_cluster(module, cluster_name, node1, node2)
-
-                    non_clustered_leafs.remove(node2)
-                    terminate_flag += 1
-
-                node_count += 1
+    for node1, node2 in new_pairs:
+        cluster_name = node1 + '-to-' + node2 + '-cluster'
+        output += create_cluster(module, cluster_name, node1, node2)
 
     return output
 
@@ -752,6 +660,7 @@ def main():
     """ This section is for arguments parsing """
     module = AnsibleModule(
         argument_spec=dict(
+            pn_current_switch=dict(required=False, type='str'),
             pn_spine_list=dict(required=False, type='list'),
             pn_leaf_list=dict(required=False, type='list'),
             pn_addr_type=dict(required=True, type='str',
@@ -776,13 +685,13 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure eBGP', LOCAL_STATE)
+
     global CHANGED_FLAG
     routing_protocol = module.params['pn_routing_protocol']
 
     # Get the list of vrouter names.
-    cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    vrouter_names = VROUTERS.vrouters(module, run_cli)
 
 #    message = assign_router_id(module, vrouter_names)
     message = create_leaf_clusters(module)
@@ -809,6 +718,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -817,7 +728,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure eBGP'
+        task='Configure eBGP',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -129,9 +129,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -143,7 +149,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -162,7 +168,8 @@ def run_cli(module, cli):
             task='Configure eBGP',
             stderr=err.strip(),
             msg='eBGP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -240,10 +247,7 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip,
         output += ' %s: Created vlan with id %s \n' % (switch_name, vlan_id)
         CHANGED_FLAG.append(True)
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s ' % interface_ip
@@ -405,10 +409,7 @@ def add_bgp_neighbor(module, dict_bgp_as):
     for leaf in module.params['pn_leaf_list']:
         weight_allowas_flag = 0
 
-        cli = clicopy
-        cli += ' vrouter-show location %s ' % leaf
-        cli += ' format name no-show-headers '
-        vrouter = run_cli(module, cli).split()[0]
+        vrouter = VROUTERS.vrouter(module, run_cli, leaf)
 
         cli = clicopy
         cli += ' cluster-show format name no-show-headers'
@@ -542,10 +543,7 @@ def assign_router_id(module, vrouter_names):
                     vrouter, loopback_ip[0])
 
                 if 'Success' in run_cli(module, cli):
-                    cli = clicopy
-                    cli += ' vrouter-show name ' + vrouter
-                    cli += ' format location no-show-headers '
-                    switch = run_cli(module, cli).split()[0]
+                    switch = VROUTERS.switch(module, run_cli, vrouter)
 
                     output += ' %s: Added router id %s to %s \n' % (
                         switch, loopback_ip[0], vrouter)
@@ -571,10 +569,7 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter
-        cli += ' format location no-show-headers '
-        switch = run_cli(module, cli).split()[0]
+        switch = VROUTERS.switch(module, run_cli, vrouter)
 
         cli = clicopy
         cli += ' vrouter-modify name %s ' % vrouter
@@ -715,13 +710,13 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure eBGP', LOCAL_STATE)
+
     global CHANGED_FLAG
     routing_protocol = module.params['pn_routing_protocol']
 
     # Get the list of vrouter names.
-    cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    vrouter_names = VROUTERS.vrouters(module, run_cli)
 
 #    message = assign_router_id(module, vrouter_names)
     message = create_leaf_clusters(module)
@@ -748,6 +743,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -756,7 +753,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure eBGP'
+        task='Configure eBGP',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -20,8 +20,14 @@
 import shlex
 import time
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import set_deadline, run_command_timeout
+from ansible.module_utils.pn_nvos import timed_out
+from ansible.module_utils.pn_nvos import expand_ports, compress_ports
+from ansible.module_utils.pn_nvos import ipv6_to_int
 
 DOCUMENTATION = """
 ---
@@ -153,6 +159,12 @@ options:
         - Flag to enable/disable auto-neg for T2+ platforms.
       required: False
       type: bool
+    pn_timeout_budget:
+      description:
+        - Seconds the module may spend in total before pending cli commands
+          get killed and the task fails. No budget by default.
+      required: False
+      type: int
 """
 
 EXAMPLES = """
@@ -193,9 +205,17 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+# Fields of the switch setup brought to their desired values by the module.
+SETUP_FIELDS = ('switch-name', 'mgmt-ip', 'mgmt-ip6', 'in-band-ip',
+                'in-band-ip6', 'gateway-ip', 'dns-ip', 'dns-secondary-ip',
+                'domain-name', 'ntp-server')
 
 
 def run_cli(module, cli):
@@ -208,7 +228,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -225,67 +245,109 @@ def run_cli(module, cli):
             summary=results,
             task='Fabric creation',
             msg='Fabric creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def make_switch_setup_static(module):
+def get_switch_setup(module):
     """
-    Method to assign static values to different switch setup parameters.
+    Method to read the switch setup fields managed by the module with a
+    single switch-setup-show.
     :param module: The Ansible module to fetch input parameters.
+    :return: Dictionary of switch setup field to its value.
     """
-    mgmt_ip = module.params['pn_mgmt_ip']
-    mgmt_ip_subnet = module.params['pn_mgmt_ip_subnet']
-    gateway_ip = module.params['pn_gateway_ip']
-    dns_ip = module.params['pn_dns_ip']
-    dns_secondary_ip = module.params['pn_dns_secondary_ip']
-    domain_name = module.params['pn_domain_name']
-    ntp_server = module.params['pn_ntp_server']
+    setup = {}
     cli = pn_cli(module)
-    cli += ' switch-setup-modify '
+    cli += ' switch-local switch-setup-show format %s ' % ','.join(
+        SETUP_FIELDS)
+    for line in run_cli(module, cli).splitlines():
+        field, _, value = line.partition(':')
+        setup[field.strip()] = value.strip()
 
-    if mgmt_ip:
-        ip = mgmt_ip + '/' + mgmt_ip_subnet
-        cli += ' mgmt-ip ' + ip
+    return setup
 
-    if gateway_ip:
-        cli += ' gateway-ip ' + gateway_ip
 
-    if dns_ip:
-        cli += ' dns-ip ' + dns_ip
+def get_desired_setup(module):
+    """
+    Method to compute the switch setup the module run should end up with.
+    :param module: The Ansible module to fetch input parameters.
+    :return: OrderedDict of switch setup field to its desired value.
+    """
+    current_switch = module.params['pn_current_switch']
+    desired = OrderedDict()
+    # Update switch names to match host names from hosts file.
+    desired['switch-name'] = current_switch
 
-    if dns_secondary_ip:
-        cli += ' dns-secondary-ip ' + dns_secondary_ip
+    if module.params['pn_static_setup']:
+        if module.params['pn_mgmt_ip']:
+            desired['mgmt-ip'] = '%s/%s' % (module.params['pn_mgmt_ip'],
+                                            module.params['pn_mgmt_ip_subnet'])
+        for field in ('gateway-ip', 'dns-ip', 'dns-secondary-ip',
+                      'domain-name', 'ntp-server'):
+            value = module.params['pn_' + field.replace('-', '_')]
+            if value:
+                desired[field] = value
 
-    if domain_name:
-        cli += ' domain-name ' + domain_name
+    inband_ipv4 = get_inband_ipv4(module)
+    if inband_ipv4:
+        desired['in-band-ip'] = inband_ipv4
 
-    if ntp_server:
-        cli += ' ntp-server ' + ntp_server
+    if module.params['pn_inband_ipv6']:
+        desired['in-band-ip6'] = get_ipv6_address(
+            module, module.params['pn_inband_ipv6'], current_switch)
 
-    clicopy = cli
-    if clicopy.split('switch-setup-modify')[1] != ' ':
-        run_cli(module, cli)
+    if module.params['pn_mgmt_ipv6']:
+        desired['mgmt-ip6'] = get_ipv6_address(
+            module, module.params['pn_mgmt_ipv6'], current_switch)
+
+    return desired
 
 
-def update_switch_names(module, switch_name):
+def same_setup_value(field, current, desired):
+    """
+    Method to compare a switch setup value with its desired value.
+    :param field: Name of the switch setup field.
+    :param current: Value shown by switch-setup-show.
+    :param desired: Desired value of the field.
+    :return: True if the values match, False otherwise.
     """
-    Method to update switch names.
+    if field.endswith('ip6') and current:
+        current, _, current_prefix = current.partition('/')
+        desired, _, desired_prefix = desired.partition('/')
+        try:
+            return (ipv6_to_int(current) == ipv6_to_int(desired) and
+                    current_prefix == desired_prefix)
+        except ValueError:
+            return False
+
+    return current == desired
+
+
+def configure_switch_setup(module):
+    """
+    Method to bring the switch setup to its desired values with a single
+    switch-setup-modify of the fields which differ.
     :param module: The Ansible module to fetch input parameters.
-    :param switch_name: Name to assign to the switch.
-    :return: String describing switch name got modified or not.
+    :return: Tuple of the desired setup and the list of modified fields.
     """
-    cli = pn_cli(module)
-    cli += ' switch-setup-show format switch-name '
-    if switch_name == run_cli(module, cli).split()[1]:
-        return ' Switch name is same as hostname! '
-    else:
+    global CHANGED_FLAG
+    desired = get_desired_setup(module)
+    setup = get_switch_setup(module)
+    modified = [field for field, value in desired.items()
+                if not same_setup_value(field, setup.get(field, ''), value)]
+
+    if modified:
         cli = pn_cli(module)
-        cli += ' switch-setup-modify switch-name ' + switch_name
+        cli += ' switch-setup-modify '
+        for field in modified:
+            cli += ' %s %s ' % (field, desired[field])
         run_cli(module, cli)
-        return ' Updated switch name to match hostname! '
+        CHANGED_FLAG.append(True)
+
+    return desired, modified
 
 
 def modify_stp_local(module, modify_flag):
@@ -316,35 +378,47 @@ def ports_modify_jumbo(module, modify_flag):
     Method to enable/disable Jumbo flag on a switch ports.
     :param module: The Ansible module to fetch input parameters.
     :param modify_flag: Enable/disable flag to set.
-    :return: The output of run_cli() method.
+    :return: The output of run_cli() method or an empty string if no port
+    needed a change.
     """
     cli = pn_cli(module)
     clicopy = cli
-    trunk_ports = []
-    cli += ' switch-local port-show format port,trunk status trunk no-show-headers'
-    cli_out = run_cli(module, cli)
-    if cli_out == 'Success':
-        pass
-    else:
-        cli_out = cli_out.strip().split('\n')
-        for output in cli_out:
-            output = output.strip().split()
-            port, trunk_name = output[0], output[1]
-            trunk_ports.append(port)
+    jumbo = modify_flag == 'jumbo'
+    trunk_ports = set()
+    output = ''
+
+    # One row per trunk, along with its member ports and jumbo state.
+    cli += ' switch-local trunk-show format name,ports,jumbo parsable-delim ; '
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 3:
+            continue
+        trunk_name, ports, trunk_jumbo = fields[-3:]
+        trunk_ports.update(expand_ports(ports))
+        if (trunk_jumbo == 'on') != jumbo:
             cli = clicopy
-            cli += 'trunk-modify name %s jumbo ' % trunk_name
-            run_cli(module, cli)
+            cli += 'trunk-modify name %s %s ' % (trunk_name, modify_flag)
+            output = run_cli(module, cli)
 
     cli = clicopy
-    cli += ' switch-local port-config-show format port no-show-headers'
-    ports = run_cli(module, cli).split()
-    ports_to_modify = list(set(ports) - set(trunk_ports))
-    ports_to_modify = ','.join(ports_to_modify)
-    cli = clicopy
-    cli += ' switch-local port-config-modify port %s %s' \
-           % (ports_to_modify, modify_flag)
-    return run_cli(module, cli)
+    cli += ' switch-local port-config-show format port,jumbo '
+    cli += ' parsable-delim , '
+    ports_to_modify = set()
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2 or not fields[-2].isdigit():
+            continue
+        port, port_jumbo = int(fields[-2]), fields[-1]
+        if port not in trunk_ports and (port_jumbo == 'on') != jumbo:
+            ports_to_modify.add(port)
 
+    if ports_to_modify:
+        cli = clicopy
+        cli += ' switch-local port-config-modify port %s %s' \
+               % (compress_ports(ports_to_modify), modify_flag)
+        output = run_cli(module, cli)
+
+    return output
 
 def configure_control_network(module, network):
     """
@@ -436,7 +510,22 @@ def create_or_join_fabric(module, fabric_name, fabric_network):
         cli = clicopy
         cli += ' fabric-info format name no-show-headers'
         cli = shlex.split(cli)
-        rc, out, err = module.run_command(cli)
+        rc, out, err = run_command_timeout(cli)
+        # A hanging fabric-info says nothing about the fabric of the switch.
+        if timed_out(rc):
+            module.exit_json(
+                unreachable=False,
+                failed=True,
+                exception=err.strip(),
+                summary=[{
+                    'switch': module.params['pn_current_switch'],
+                    'output': u'Operation Failed: {}'.format(' '.join(cli))
+                }],
+                task='Fabric creation',
+                msg='Fabric creation failed',
+                changed=False,
+                retries=cli_retries()
+            )
 
         if err:
             cli = clicopy
@@ -465,7 +554,7 @@ def modify_auto_neg(module):
         cli = pn_cli(module)
         cli += ' switch-local bezel-portmap-show format port no-show-headers '
         cli = shlex.split(cli)
-        out = module.run_command(cli)[1]
+        out = run_command_timeout(cli)[1]
         all_ports = out.splitlines()
         all_ports = [port.strip() for port in all_ports]
         time.sleep(1)
@@ -473,7 +562,7 @@ def modify_auto_neg(module):
         cli = pn_cli(module)
         cli += ' switch-local lldp-show format local-port no-show-headers '
         cli = shlex.split(cli)
-        out = module.run_command(cli)[1]
+        out = run_command_timeout(cli)[1]
         lldp_ports = out.splitlines()
         lldp_ports = [port.strip() for port in lldp_ports]
         time.sleep(1)
@@ -482,13 +571,13 @@ def modify_auto_neg(module):
         cli = pn_cli(module)
         cli += ' switch-local port-config-modify port %s autoneg ' % ','.join(idle_ports)
         cli = shlex.split(cli)
-        module.run_command(cli)
+        run_command_timeout(cli)
         time.sleep(1)
 
         cli = pn_cli(module)
         cli += ' switch-local lldp-show format local-port no-show-headers '
         cli = shlex.split(cli)
-        out = module.run_command(cli)[1]
+        out = run_command_timeout(cli)[1]
         lldp_ports = out.splitlines()
         lldp_ports = [port.strip() for port in lldp_ports]
         time.sleep(1)
@@ -496,7 +585,8 @@ def modify_auto_neg(module):
         idle_ports = list(set(all_ports) ^ set(lldp_ports))
         cli = pn_cli(module)
         cli += ' switch-local port-config-modify port %s no-autoneg ' % ','.join(idle_ports)
-        module.run_command(cli)
+        cli = shlex.split(cli)
+        run_command_timeout(cli)
         time.sleep(1)
 
         return "Auto-neg Configured"
@@ -707,60 +797,44 @@ def toggle_ports(module, curr_switch):
     return output
 
 
-def assign_ipv6_address(module, ipv6_address, current_switch, ip_type):
+def get_ipv6_address(module, ipv6_address, current_switch):
     """
-    Add loopback interface and router id to vrouters.
+    Method to find the ipv6 address of the current switch, offset from the
+    start address by the position of the switch.
     :param module: The Ansible module to fetch input parameters.
-    :param ipv6_address: The loopback ip to be assigned.
+    :param ipv6_address: The start address with its prefix length.
     :param current_switch: The name of current running switch.
-    :param ip_type: ip type inband/mgmt.
-    :return: String describing if loopback ip/router id got assigned or not.
+    :return: The ipv6 address of the switch with its prefix length.
     """
-    global CHANGED_FLAG
-    output = ''
-
     leaf_list = module.params['pn_leaf_list']
     spine_list = module.params['pn_spine_list']
-    cli = pn_cli(module)
 
     if current_switch in spine_list:
         count = spine_list.index(current_switch)
     elif current_switch in leaf_list:
         count = leaf_list.index(current_switch) + 2
 
-    if ipv6_address:
-        ipv6 = ipv6_address.split('/')
-        subnet_ipv6 = ipv6[1]
-        ipv6 = ipv6[0]
-        ipv6 = ipv6.split(':')
-        if not ipv6[-1]:
-            ipv6[-1] = "0"
-        host_count_ipv6 = int(ipv6[-1], 16)
-        host_count_ipv6 += count
-        ipv6[-1] = str(hex(host_count_ipv6)[2:])
-        ipv6_ip = ':'.join(ipv6)
-
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch-local switch-setup-show format %s ' % ip_type
-    existing_ip = run_cli(module, cli).split()
+    ipv6 = ipv6_address.split('/')
+    subnet_ipv6 = ipv6[1]
+    ipv6 = ipv6[0]
+    ipv6 = ipv6.split(':')
+    if not ipv6[-1]:
+        ipv6[-1] = "0"
+    host_count_ipv6 = int(ipv6[-1], 16)
+    host_count_ipv6 += count
+    ipv6[-1] = str(hex(host_count_ipv6)[2:])
+    ipv6_ip = ':'.join(ipv6)
 
-    if ipv6_address not in existing_ip:
-        cli = clicopy
-        cli += ' switch %s switch-setup-modify ' % current_switch
-        cli += ' %s %s/%s ' % (ip_type, ipv6_ip, subnet_ipv6)
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output += 'Assigned %s ip ' % ipv6_ip
-    else:
-        output += 'ip %s already assigned ' % ipv6_ip
+    return '%s/%s' % (ipv6_ip, subnet_ipv6)
 
-    return output
 
-
-def assign_inband_ipv4(module):
-
-    global CHANGED_FLAG
+def get_inband_ipv4(module):
+    """
+    Method to find the in-band ipv4 address of the current switch, offset
+    from the start address by the position of the switch.
+    :param module: The Ansible module to fetch input parameters.
+    :return: The in-band ip of the switch with its prefix length or None.
+    """
     switches_list = []
     switch_ip = {}
     spines = module.params['pn_spine_list']
@@ -775,7 +849,7 @@ def assign_inband_ipv4(module):
         subnet = last_octet[1]
         count = int(last_octet[0])
     else:
-        return 'in-band ipv4 not specified '
+        return None
 
     if spines:
         switches_list += spines
@@ -783,25 +857,11 @@ def assign_inband_ipv4(module):
     if leafs:
         switches_list += leafs
 
-
     for sw in switches_list:
         switch_ip[sw] = static_part + str(count) + '/' + subnet
         count += 1
 
-    # Get existing in-band ip.
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch-local switch-setup-show format in-band-ip'
-    existing_inband_ip = run_cli(module, cli).split()
-
-    if switch_ip[switch] not in existing_inband_ip:
-        cli = clicopy
-        cli += ' switch %s switch-setup-modify ' % switch
-        cli += ' in-band-ip ' + switch_ip[switch]
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-
-    return 'Assigned in-band ip ' + switch_ip[switch]
+    return switch_ip[switch]
 
 
 def main():
@@ -833,10 +893,13 @@ def main():
             pn_stp=dict(required=False, type='bool', default=True),
             pn_autotrunk=dict(required=False, type='str',
                               choices=['enable', 'disable']),
-            pn_autoneg=dict(required=False, type='bool')
+            pn_autoneg=dict(required=False, type='bool'),
+            pn_timeout_budget=dict(required=False, type='int'),
         )
     )
 
+    set_deadline(module.params['pn_timeout_budget'])
+
     fabric_name = module.params['pn_fabric_name']
     fabric_network = module.params['pn_fabric_network']
     control_network = module.params['pn_fabric_control_network']
@@ -844,18 +907,11 @@ def main():
     current_switch = module.params['pn_current_switch']
     autotrunk = module.params['pn_autotrunk']
     autoneg = module.params['pn_autoneg']
-    mgmt_ipv6 = module.params['pn_mgmt_ipv6']
-    in_band_ipv6 = module.params['pn_inband_ipv6']
     results = []
     global CHANGED_FLAG
 
-    # Make switch setup static
-    if module.params['pn_static_setup']:
-        make_switch_setup_static(module)
-
-    # Update switch names to match host names from hosts file
-    if 'Updated' in update_switch_names(module, current_switch):
-        CHANGED_FLAG.append(True)
+    # Switch name, static setup and in-band/mgmt addresses in one go
+    setup, modified = configure_switch_setup(module)
 
     # Create/join fabric
     if 'created' in create_or_join_fabric(module, fabric_name,
@@ -933,20 +989,27 @@ def main():
             'output': out
         })
 
-    # Assign in-band ipv4.
-    out = assign_inband_ipv4(module)
+    # Report the in-band ipv4 and the ipv6 addresses of the switch setup.
+    if 'in-band-ip' in setup:
+        out = 'Assigned in-band ip ' + setup['in-band-ip']
+    else:
+        out = 'in-band ipv4 not specified '
     results.append({
         'switch': current_switch,
         'output': out
     })
 
-    # Assign mgmt ipv6.
-    if mgmt_ipv6:
-        out = assign_ipv6_address(module, mgmt_ipv6, current_switch, "mgmt-ip6")
-        results.append({
-            'switch': current_switch,
-            'output': out
-        })
+    for field in ('in-band-ip6', 'mgmt-ip6'):
+        if field in setup:
+            ipv6_ip = setup[field].split('/')[0]
+            if field in modified:
+                out = 'Assigned %s ip ' % ipv6_ip
+            else:
+                out = 'ip %s already assigned ' % ipv6_ip
+            results.append({
+                'switch': current_switch,
+                'output': out
+            })
 
 
     # Enable STP if flag is True
@@ -966,7 +1029,8 @@ def main():
         exception='',
         task='Fabric creation',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=True if True in CHANGED_FLAG else False,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
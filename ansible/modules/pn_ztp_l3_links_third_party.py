@@ -157,9 +157,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (TRUNK_STATE_CLI, STP_STATE_CLI)
 
 
 def run_cli(module, cli):
@@ -171,7 +177,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -189,7 +195,8 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L3 ZTP',
             msg='L3 ZTP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -261,8 +268,7 @@ def create_vrouter(module, switch, vnet_name):
     clicopy = cli
 
     # Check if vrouter already exists.
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli).split()
+    existing_vrouter_names = VROUTERS.vrouters(module, run_cli)
 
     # If vrouter doesn't exists then create it.
     if vrouter_name not in existing_vrouter_names:
@@ -289,8 +295,7 @@ def create_interface(module, switch, ip_ipv4, ip_ipv6, port, addr_type):
     global CHANGED_FLAG
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-show location %s format name no-show-headers ' % switch
-    vrouter_name = run_cli(module, cli).split()[0]
+    vrouter_name = VROUTERS.vrouter(module, run_cli, switch)
 
     if addr_type == 'ipv4':
         ip = ip_ipv4
@@ -359,46 +364,32 @@ def create_interface(module, switch, ip_ipv4, ip_ipv6, port, addr_type):
     return output
 
 
-def modify_auto_trunk_setting(module, switch, flag):
+def delete_trunks(module, switch, links, peers):
     """
-    Method to enable/disable auto trunk setting of a switch.
+    Method to delete the trunks of a switch which conflict with the l3 links
+    towards its peers, each trunk once.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the local switch.
-    :param flag: Enable/disable flag for the cli command.
-    :return: The output of run_cli() method.
+    :param links: The port links of the switch from get_port_links().
+    :param peers: Names of the peer switches of the l3 links.
+    :return: String describing the trunks which got deleted.
     """
-    cli = pn_cli(module)
-    if flag.lower() == 'enable':
-        cli += ' switch %s system-settings-modify auto-trunk ' % switch
-        return run_cli(module, cli)
-    elif flag.lower() == 'disable':
-        cli += ' switch %s system-settings-modify no-auto-trunk ' % switch
-        return run_cli(module, cli)
-
+    output = ''
+    trunks = []
+    for hostname, _, trunk in links.values():
+        if trunk and hostname in peers and trunk not in trunks:
+            trunks.append(trunk)
 
-def delete_trunk(module, switch, switch_port, peer_switch):
-    """
-    Method to delete a conflicting trunk on a switch.
-    :param module: The Ansible module to fetch input parameters.
-    :param switch: Name of the local switch.
-    :param switch_port: The l3-port which is part of conflicting trunk for l3.
-    :param peer_switch: Name of the peer switch.
-    :return: String describing if trunk got deleted or not.
-    """
     cli = pn_cli(module)
     clicopy = cli
-
-    cli += ' switch %s port-show port %s hostname %s ' % (switch, switch_port,
-                                                          peer_switch)
-    cli += ' format trunk no-show-headers '
-    trunk = run_cli(module, cli).split()
-    trunk = list(set(trunk))
-    if 'Success' not in trunk and len(trunk) > 0:
+    for trunk in trunks:
         cli = clicopy
-        cli += ' switch %s trunk-delete name %s ' % (switch, trunk[0])
+        cli += ' switch %s trunk-delete name %s ' % (switch, trunk)
         if 'Success' in run_cli(module, cli):
             CHANGED_FLAG.append(True)
-            return ' %s: Deleted %s trunk successfully \n' % (switch, trunk[0])
+            output += ' %s: Deleted %s trunk successfully \n' % (switch, trunk)
+
+    return output
 
 
 def assign_loopback_ip(module, loopback_address):
@@ -479,13 +470,7 @@ def auto_configure_link_ips(module):
     current_switch = module.params['pn_current_switch']
     output = ''
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     if current_switch in leaf_list:
-        # Disable auto trunk on all switches.
-        modify_auto_trunk_setting(module, current_switch, 'disable')
-
         # Get the list of available link ips to assign.
         count_output = finding_initial_ip(module, current_switch, leaf_list)
         if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
@@ -506,15 +491,14 @@ def auto_configure_link_ips(module):
             for i in range(count_output - (leaf_list.index(current_switch) * 2)):
                 available_ips_ipv6.next()
 
-        for spine in spine_list:
-            cli = clicopy
-            cli += ' switch %s port-show hostname %s ' % (current_switch, spine)
-            cli += ' format port no-show-headers '
-            leaf_port = run_cli(module, cli).split()
-            leaf_port = list(set(leaf_port))
+        # Read the links of the involved switches once and delete the trunks
+        # conflicting with the l3 links before creating any interface.
+        leaf_links = get_port_links(module, run_cli, current_switch)
+        output += delete_trunks(module, current_switch, leaf_links, spine_list)
 
-            if 'Success' in leaf_port:
-                continue
+        for spine in spine_list:
+            leaf_port = [port for port, link in leaf_links.items()
+                         if link[0] == spine]
 
             while len(leaf_port) > 0:
                 ip_ipv6 = ''
@@ -535,19 +519,13 @@ def auto_configure_link_ips(module):
                             summary=results,
                             task='L3 ZTP',
                             msg='L3 ZTP failed',
-                            changed=False
+                            changed=False,
+                            retries=cli_retries()
                         )
                     ip_ipv6 = (ip_list[0] if subnet_ipv6 == '127' else ip_list[1])
 
                 lport = leaf_port[0]
 
-                cli = clicopy
-                cli += ' switch %s port-show port %s ' % (current_switch, lport)
-                cli += ' format rport no-show-headers '
-                rport = run_cli(module, cli).split()
-                rport = list(set(rport))
-                rport = rport[0]
-
                 if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
                     ip_ipv4 = available_ips_ipv4[0]
                     available_ips_ipv4.remove(ip_ipv4)
@@ -567,12 +545,8 @@ def auto_configure_link_ips(module):
                             available_ips_ipv4.pop(0)
                             ip_count += 1
 
-                delete_trunk(module, current_switch, lport, spine)
                 output += create_interface(module, current_switch, ip_ipv4, ip_ipv6, lport, addr_type)
 
-        # Enable auto trunk on all switches.
-        modify_auto_trunk_setting(module, current_switch, 'enable')
-
     return output
 
 
@@ -605,6 +579,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure L3 ZTP', LOCAL_STATE)
+
     global CHANGED_FLAG
 
     # L3 setup (link ips)
@@ -632,6 +608,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -640,7 +618,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure L3 ZTP'
+        task='Configure L3 ZTP',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
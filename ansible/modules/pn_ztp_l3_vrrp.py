@@ -20,6 +20,8 @@
 
 import shlex
 
+from collections import OrderedDict
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.pn_nvos import *
 
@@ -45,6 +47,14 @@ options:
         - String containing vrrp data parsed from csv file.
       required: False
       type: str
+    pn_parallel_workers:
+      description:
+        - Number of cluster pairs or standalone leafs configured at a time.
+          When more than one, a single run configures the rows of all leafs,
+          so the task has to run with run_once.
+      required: False
+      type: int
+      default: 1
 """
 
 EXAMPLES = """
@@ -53,13 +63,23 @@ EXAMPLES = """
     pn_spine_list: "{{ groups['spine'] }}"
     pn_leaf_list: "{{ groups['leaf'] }}"
     pn_csv_data: "{{ lookup('file', '{{ csv_file }}') }}"
+    pn_current_switch: "{{ inventory_hostname }}"
+
+- name: Configure L3 VRRP from one leaf, four leafs at a time
+  pn_ztp_l3_vrrp:
+    pn_spine_list: "{{ groups['spine'] }}"
+    pn_leaf_list: "{{ groups['leaf'] }}"
+    pn_csv_data: "{{ lookup('file', '{{ csv_file }}') }}"
+    pn_current_switch: "{{ inventory_hostname }}"
+    pn_parallel_workers: 4
+  run_once: true
 """
 
 RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -84,9 +104,13 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
 
 
 def run_cli(module, cli):
@@ -98,7 +122,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -116,266 +140,292 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L3 vrrp',
             msg='L3 vrrp configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def create_vlan(module, vlan_id, switch):
+def get_switch_index(module, switch):
     """
-    Method to create vlans.
+    Method to snapshot the vrouter interfaces and ospf configuration of a
+    switch.
     :param module: The Ansible module to fetch input parameters.
-    :param vlan_id: vlan id to be created.
-    :param switch: Name of the switch on which vlan creation will be executed.
-    :return: String describing if vlan got created or if it already exists.
+    :param switch: Name of the switch.
+    :return: Dictionary holding the vrouter name, a dictionary of
+    (vlan id, address) to the nic and vrrp primary of that interface, the set
+    of ospf networks and the set of ospf6 nics.
     """
-    global CHANGED_FLAG
+    vrouter_name = switch + '-vrouter'
+    index = {
+        'vrouter': vrouter_name,
+        'interfaces': {},
+        'ospf_networks': set(),
+        'ospf6_nics': set()
+    }
+
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vlan-show format id no-show-headers '
-    existing_vlan_ids = run_cli(module, cli).split()
-    existing_vlan_ids = list(set(existing_vlan_ids))
+    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
+    cli += ' format vlan,ip,ip2,nic,vrrp-primary parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 5:
+            continue
+        vlan_id, ip, ip2, nic, vrrp_primary = fields[-5:]
+        for address in (ip, ip2):
+            if address:
+                index['interfaces'][(vlan_id, address.split('/')[0])] = {
+                    'nic': nic,
+                    'vrrp-primary': vrrp_primary
+                }
+
+    cli = clicopy
+    cli += ' vrouter-ospf-show vrouter-name %s ' % vrouter_name
+    cli += ' format network parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) > 1:
+            index['ospf_networks'].add(ipv4_network(fields[-1]))
+
+    cli = clicopy
+    cli += ' vrouter-ospf6-show vrouter-name %s ' % vrouter_name
+    cli += ' format nic parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) > 1:
+            index['ospf6_nics'].add(fields[-1])
+
+    return index
+
+
+def create_clusters(module, cluster_pairs):
+    """
+    Method to create the clusters between pairs of leaf switches.
+    :param module: The Ansible module to fetch input parameters.
+    :param cluster_pairs: List of (node1, node2) tuples.
+    """
+    cli = pn_cli(module)
+    clicopy = cli
+    cli += ' cluster-show format name no-show-headers '
+    cluster_list = set(run_cli(module, cli).split())
+
+    for node1, node2 in cluster_pairs:
+        name = node1 + '-to-' + node2 + '-cluster'
+        if name in cluster_list:
+            continue
 
-    if vlan_id not in existing_vlan_ids:
         cli = clicopy
-        cli += ' vlan-create id %s scope fabric ' % vlan_id
+        cli += ' switch %s cluster-create name %s ' % (node2, name)
+        cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
         run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        return ' %s: Created vlan id %s with scope fabric \n' % (switch,
-                                                                 vlan_id)
-    else:
-        return ''
+        cluster_list.add(name)
+        RESULTS.add(node2, 'cluster-create', name, 'Created %s' % name)
+
 
+def create_vlans(module, partitions):
+    """
+    Method to create the vlans of all rows with scope fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :param partitions: Dictionary of tuple of leaf switches to their rows.
+    """
+    cli = pn_cli(module)
+    clicopy = cli
+    cli += ' vlan-show format id no-show-headers '
+    existing_vlan_ids = set(run_cli(module, cli).split())
 
-def create_vrouter_interface(module, switch, vlan_id, vrrp_id,
+    for leaves, rows in partitions.items():
+        for row in rows:
+            vlan_id = row['vlan_id']
+            if vlan_id in existing_vlan_ids:
+                continue
+
+            cli = clicopy
+            cli += ' vlan-create id %s scope fabric ' % vlan_id
+            run_cli(module, cli)
+            existing_vlan_ids.add(vlan_id)
+            RESULTS.add(leaves[-1], 'vlan-create', vlan_id,
+                        'Created vlan id %s with scope fabric' % vlan_id)
+
+
+def get_interface_nic(module, vrouter_name, ip, vlan_id):
+    """
+    Method to fetch the nic of a freshly added vrouter interface.
+    :param module: The Ansible module to fetch input parameters.
+    :param vrouter_name: Name of the vrouter.
+    :param ip: Address of the interface.
+    :param vlan_id: vlan id of the interface.
+    :return: Name of the nic.
+    """
+    cli = pn_cli(module)
+    cli += ' vrouter-interface-show vrouter-name %s ip %s vlan %s ' % (
+        vrouter_name, ip, vlan_id
+    )
+    cli += ' format nic no-show-headers '
+    eth_port = run_cli(module, cli).split()
+    eth_port.remove(vrouter_name)
+    return eth_port[0]
+
+
+def create_vrouter_interface(module, switch, index, vlan_id, vrrp_id,
                              vrrp_priority, list_vips, list_ips):
     """
     Method to add vrouter interface and assign IP to it along with
     vrrp_id and vrrp_priority.
     :param module: The Ansible module to fetch input parameters.
     :param switch: The switch name on which interfaces will be created.
-    :param ip: IP address to be assigned to vrouter interface.
+    :param index: Snapshot of the vrouter configuration of the switch.
     :param vlan_id: vlan_id to be assigned.
     :param vrrp_id: vrrp_id to be assigned.
     :param vrrp_priority: priority to be given(110 for active switch).
-    :param ip_count: The value of fourth octet in the ip
-    :return: String describing if vrouter interface got added or not.
+    :param list_vips: List of virtual addresses of the vrrp group.
+    :param list_ips: List of addresses to be assigned to the interface.
     """
-    global CHANGED_FLAG
-    vrouter_name = switch + '-vrouter'
+    vrouter_name = index['vrouter']
+    interfaces = index['interfaces']
     ospf_area_id = module.params['pn_ospf_area_id']
     addr_type = module.params['pn_addr_type']
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vlan %s ip %s ' % (vlan_id, list_ips[0])
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
+    key = (vlan_id, list_ips[0].split('/')[0])
+    if key not in interfaces:
+        cli = pn_cli(module)
         cli += ' switch ' + switch
         cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
         cli += ' ip ' + list_ips[0]
         cli += ' vlan %s if data ' % vlan_id
-        if module.params['pn_addr_type'] == 'ipv4_ipv6':
+        if addr_type == 'ipv4_ipv6':
             cli += ' ip2 ' + list_ips[1]
         if module.params['pn_jumbo_frames'] == True:
             cli += ' mtu 9216'
         run_cli(module, cli)
-        output = ' %s: Added vrouter interface with ip %s' % (
-            switch, list_ips[0]
-        )
-        if module.params['pn_addr_type'] == 'ipv4_ipv6':
+
+        nic = get_interface_nic(module, vrouter_name, list_ips[0], vlan_id)
+        for ip in list_ips:
+            interfaces[(vlan_id, ip.split('/')[0])] = {
+                'nic': nic,
+                'vrrp-primary': ''
+            }
+
+        output = 'Added vrouter interface with ip %s' % list_ips[0]
+        if addr_type == 'ipv4_ipv6':
             output += ' ip2 %s' % list_ips[1]
-        output += ' to %s \n' % vrouter_name
-        CHANGED_FLAG.append(True)
-    else:
-        output = ''
+        output += ' to %s' % vrouter_name
+        RESULTS.add(switch, 'vrouter-interface-add', list_ips[0], output)
 
-    cli = clicopy
-    cli += ' vrouter-interface-show vrouter-name %s ip %s vlan %s ' % (
-        vrouter_name, list_ips[0], vlan_id
-    )
-    cli += ' format nic no-show-headers '
-    eth_port = run_cli(module, cli).split()
-    eth_port.remove(vrouter_name)
+    eth_port = interfaces[key]['nic']
 
     for ip_vip in list_vips:
-        cli = clicopy
-        cli += ' vrouter-interface-show vlan %s ip %s vrrp-primary %s ' % (
-            vlan_id, ip_vip, eth_port[0]
-        )
-        cli += ' format switch no-show-headers '
-        existing_vrouter = run_cli(module, cli).split()
-        existing_vrouter = list(set(existing_vrouter))
-
-        if vrouter_name not in existing_vrouter:
-            cli = clicopy
-            cli += ' switch ' + switch
-            cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-            cli += ' ip ' + ip_vip
-            cli += ' vlan %s if data vrrp-id %s ' % (vlan_id, vrrp_id)
-            cli += ' vrrp-primary %s vrrp-priority %s ' % (eth_port[0],
-                                                           vrrp_priority)
-            if module.params['pn_jumbo_frames'] == True:
-                cli += ' mtu 9216'
-            run_cli(module, cli)
-            CHANGED_FLAG.append(True)
-            output += ' %s: Added vrouter interface with ip %s to %s \n' % (
-                switch, ip_vip, vrouter_name
-            )
+        vip_key = (vlan_id, ip_vip.split('/')[0])
+        vip = interfaces.get(vip_key)
+        if vip is not None and vip['vrrp-primary'] == eth_port:
+            continue
 
+        cli = pn_cli(module)
+        cli += ' switch ' + switch
+        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
+        cli += ' ip ' + ip_vip
+        cli += ' vlan %s if data vrrp-id %s ' % (vlan_id, vrrp_id)
+        cli += ' vrrp-primary %s vrrp-priority %s ' % (eth_port,
+                                                       vrrp_priority)
+        if module.params['pn_jumbo_frames'] == True:
+            cli += ' mtu 9216'
+        run_cli(module, cli)
+        interfaces[vip_key] = {
+            'nic': '',
+            'vrrp-primary': eth_port
+        }
+        RESULTS.add(switch, 'vrouter-interface-add', ip_vip,
+                    'Added vrouter interface with ip %s to %s' % (
+                        ip_vip, vrouter_name))
 
     if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
         ipv4 = list_ips[0]
-        cli = clicopy
-        cli += ' vrouter-ospf-show'
-        cli += ' network %s format switch no-show-headers ' % ipv4
-        already_added = run_cli(module, cli).split()
-
-        if vrouter_name in already_added:
-            pass
-        else:
-            cli = clicopy
+        if ipv4_network(ipv4) not in index['ospf_networks']:
+            cli = pn_cli(module)
             cli += ' vrouter-ospf-add vrouter-name ' + vrouter_name
             cli += ' network %s ospf-area %s' % (ipv4,
                                                  ospf_area_id)
-
-            if 'Success' in run_cli(module, cli):
-                output += ' Added OSPF interface %s to %s \n' % (
-                    ipv4, vrouter_name
-                )
-                CHANGED_FLAG.append(True)
-
-    if addr_type == 'ipv4_ipv6':
-        ipv6 = list_ips[1]
-    elif addr_type == 'ipv6':
-        ipv6 = list_ips[0]
+            run_cli(module, cli)
+            index['ospf_networks'].add(ipv4_network(ipv4))
+            RESULTS.add(switch, 'vrouter-ospf-add', ipv4,
+                        'Added OSPF interface %s to %s' % (ipv4,
+                                                           vrouter_name))
 
     if addr_type == 'ipv4_ipv6' or addr_type == 'ipv6':
-        cli = clicopy
-        cli += 'vrouter-interface-show vrouter-name %s' % vrouter_name
-        if addr_type == 'ipv4_ipv6':
-            cli += ' ip2 %s format nic no-show-headers ' % ipv6
-        if addr_type == 'ipv6':
-            cli += ' ip %s format nic no-show-headers ' % ipv6
-        nic = run_cli(module, cli).split()
-        nic = list(set(nic))
-        nic.remove(vrouter_name)
-        nic = nic[0]
-
-        cli = clicopy
-        cli += 'vrouter-ospf6-show nic %s format switch no-show-headers ' % nic
-        ipv6_vrouter = run_cli(module, cli).split()
-
-        if vrouter_name not in ipv6_vrouter:
-            cli = clicopy
+        nic = eth_port
+        if nic not in index['ospf6_nics']:
+            cli = pn_cli(module)
             cli += ' vrouter-ospf6-add vrouter-name %s' % vrouter_name
             cli += ' nic %s ospf6-area 0.0.0.0 ' % nic
             run_cli(module, cli)
-            output += ' %s: Added OSPF6 nic %s to %s \n' % (
-                vrouter_name, nic, vrouter_name
-            )
-            CHANGED_FLAG.append(True)
-
-    return output
-
-
-def create_cluster(module, switch, name, node1, node2):
-    """
-    Method to create a cluster between two switches.
-    :param module: The Ansible module to fetch input parameters.
-    :param switch: Name of the local switch.
-    :param name: The name of the cluster to create.
-    :param node1: First node of the cluster.
-    :param node2: Second node of the cluster.
-    :return: The output of run_cli() method.
-    """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
-        cli += ' switch %s cluster-create name %s ' % (switch, name)
-        cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Created %s \n' % (switch, name)
-    else:
-        return ''
+            index['ospf6_nics'].add(nic)
+            RESULTS.add(switch, 'vrouter-ospf6-add', nic,
+                        'Added OSPF6 nic %s to %s' % (nic, vrouter_name))
 
 
-def configure_vrrp_for_non_cluster_leafs(module, ip, ip_v6, non_cluster_leaf, vlan_id):
+def configure_vrrp_for_non_cluster_leafs(module, index, row,
+                                         non_cluster_leaf):
     """
     Method to configure vrrp for non-cluster switches.
     :param module: The Ansible module to fetch input parameters.
-    :param ip: IP address for the default gateway
+    :param index: Snapshot of the vrouter configuration of the switch.
+    :param row: Dictionary holding the vlan id and addresses of the row.
     :param non_cluster_leaf: Name of non-cluster leaf switch.
-    :param vlan_id: The vlan id to be assigned.
-    :return: String describing whether interfaces got added or not.
     """
-    global CHANGED_FLAG
-    vrouter_name = non_cluster_leaf + '-vrouter'
+    vrouter_name = index['vrouter']
     addr_type = module.params['pn_addr_type']
+    vlan_id = row['vlan_id']
+    ip = row['ip']
+    ip_v6 = row['ipv6']
+
+    primary_ip = ip_v6 if addr_type == 'ipv6' else ip
+    key = (vlan_id, primary_ip.split('/')[0])
+    if key in index['interfaces']:
+        return
 
     cli = pn_cli(module)
-    clicopy = cli
     cli += 'switch ' + non_cluster_leaf
-    cli += ' vrouter-interface-show ip %s vlan %s ' % (ip, vlan_id)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
-        cli += 'switch ' + non_cluster_leaf
-        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-        cli += ' vlan ' + vlan_id
-        if addr_type == 'ipv4' or  addr_type == 'ipv4_ipv6':
-            cli += ' ip ' + ip
-        if module.params['pn_addr_type'] == 'ipv4_ipv6':
-            cli += ' ip2 ' + ip_v6
-        if addr_type == 'ipv6':
-            cli += ' ip ' + ip_v6
-        if module.params['pn_jumbo_frames'] == True:
-            cli += ' mtu 9216'
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        output = ' %s: Added vrouter interface with ip %s' % (
-            non_cluster_leaf, ip)
-        if module.params['pn_addr_type'] == 'ipv4_ipv6':
-            output += ' ip2 %s' % ip_v6
-        output += ' to %s \n' % vrouter_name
-        return output
-    else:
-        return ''
+    cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
+    cli += ' vlan ' + vlan_id
+    if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
+        cli += ' ip ' + ip
+    if addr_type == 'ipv4_ipv6':
+        cli += ' ip2 ' + ip_v6
+    if addr_type == 'ipv6':
+        cli += ' ip ' + ip_v6
+    if module.params['pn_jumbo_frames'] == True:
+        cli += ' mtu 9216'
+    run_cli(module, cli)
+    index['interfaces'][key] = {
+        'nic': '',
+        'vrrp-primary': ''
+    }
+
+    output = 'Added vrouter interface with ip %s' % primary_ip
+    if addr_type == 'ipv4_ipv6':
+        output += ' ip2 %s' % ip_v6
+    output += ' to %s' % vrouter_name
+    RESULTS.add(non_cluster_leaf, 'vrouter-interface-add', primary_ip, output)
 
 
-def configure_vrrp_for_clustered_switches(module, vrrp_id, vrrp_ip, vrrp_ipv6,
-                                          active_switch, vlan_id, switch_list):
+def configure_vrrp_for_clustered_switches(module, switch_index, row,
+                                          switch_list):
     """
     Method to configure vrrp interfaces for clustered leaf switches.
     :param module: The Ansible module to fetch input parameters.
-    :param vrrp_id: The vrrp_id to be assigned.
-    :param vrrp_ip: The vrrp_ip to be assigned.
-    :param active_switch: The name of the active switch.
-    :param vlan_id: vlan id to be assigned.
+    :param switch_index: Dictionary of switch name to its snapshot.
+    :param row: Dictionary holding the vlan id, addresses, vrrp id and active
+    switch of the row.
     :param switch_list: List of clustered switches.
-    :return: The output of the configuration.
     """
-    node1 = switch_list[0]
-    node2 = switch_list[1]
-    name = node1 + '-to-' + node2 + '-cluster'
     list_vips = []
     addr_type = module.params['pn_addr_type']
-
-    output = create_cluster(module, node2, name, node1, node2)
-    output += create_vlan(module, vlan_id, node2)
+    vlan_id = row['vlan_id']
+    vrrp_id = row['vrrp_id']
+    vrrp_ip = row['ip']
+    vrrp_ipv6 = row['ipv6']
+    active_switch = row['active_switch']
 
     if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
         list_vips.append(vrrp_ip)
@@ -408,75 +458,97 @@ def configure_vrrp_for_clustered_switches(module, vrrp_id, vrrp_ip, vrrp_ipv6,
             list_ips.append(vrrp_ipv6_ip)
 
         vrrp_priority = '110' if switch == active_switch else '100'
-        output += create_vrouter_interface(module, switch, vlan_id, vrrp_id,
-                                           vrrp_priority, list_vips, list_ips)
-
-    return output
+        create_vrouter_interface(module, switch, switch_index[switch],
+                                 vlan_id, vrrp_id, vrrp_priority, list_vips,
+                                 list_ips)
 
 
-def configure_vrrp_for_non_clustered_switches(module, vlan_id, ip, ip_v6,
-                                              non_cluster_leaf):
+def configure_partition(module, partition):
     """
-    Method to configure VRRP for non clustered leafs.
+    Method to configure the vrrp rows of one cluster pair or standalone leaf.
     :param module: The Ansible module to fetch input parameters.
-    :param vlan_id: vlan id to be assigned.
-    :param ip: Ip address to be assigned.
-    :param non_cluster_leaf: Name of non-clustered leaf switch.
-    :return: Output string of configuration.
+    :param partition: Tuple of the leaf switches and their rows.
     """
-    output = ''
-    output += create_vlan(module, vlan_id, non_cluster_leaf)
-    output += configure_vrrp_for_non_cluster_leafs(module, ip, ip_v6,
-                                                   non_cluster_leaf, vlan_id)
-    return output
+    leaves, rows = partition
+    switch_index = dict((leaf, get_switch_index(module, leaf))
+                        for leaf in leaves)
+
+    for row in rows:
+        if len(leaves) == 2:
+            configure_vrrp_for_clustered_switches(module, switch_index, row,
+                                                  list(leaves))
+        else:
+            configure_vrrp_for_non_cluster_leafs(module,
+                                                 switch_index[leaves[0]],
+                                                 row, leaves[0])
 
 
-def configure_vrrp(module, csv_data):
+def partition_vrrp_rows(module, csv_data):
     """
-    Method to configure VRRP L3.
+    Method to group the vrrp rows of the csv data by cluster pair or
+    standalone leaf.
     :param module: The Ansible module to fetch input parameters.
     :param csv_data: String containing vrrp data passed from csv file.
-    :return: Output string of configuration.
+    :return: Dictionary of tuple of leaf switches to the list of their rows,
+    in the order of the csv file.
     """
-    output = ''
-    vrrp_ipv6 = ''
-    vrrp_ip = ''
+    partitions = OrderedDict()
+    addr_type = module.params['pn_addr_type']
 
     csv_data = csv_data.strip()
     csv_data_list = csv_data.split('\n')
-    # Parse csv file data and configure VRRP.
     for row in csv_data_list:
         row = row.strip()
-        if row.startswith('#'):
+        if not row or row.startswith('#'):
             continue
-        else:
-            elements = row.split(',')
-            elements = filter(None, elements)
-            switch_list = []
-            vlan_id = elements.pop(0).strip()
-            if module.params['pn_addr_type'] == 'ipv4_ipv6' or module.params['pn_addr_type'] == 'ipv4':
-                vrrp_ip = elements.pop(0).strip()
-            if module.params['pn_addr_type'] == 'ipv4_ipv6' or module.params['pn_addr_type'] == 'ipv6':
-                vrrp_ipv6 = elements.pop(0).strip()
-            leaf_switch_1 = elements.pop(0).strip()
-            if module.params['pn_current_switch'] == leaf_switch_1:
-                if len(elements) > 2:
-                    leaf_switch_2 = elements.pop(0).strip()
-                    vrrp_id = elements.pop(0).strip()
-                    active_switch = elements.pop(0).strip()
-                    switch_list.append(leaf_switch_1)
-                    switch_list.append(leaf_switch_2)
-                    output += configure_vrrp_for_clustered_switches(module, vrrp_id,
-                                                                    vrrp_ip, vrrp_ipv6,
-                                                                    active_switch,
-                                                                    vlan_id,
-                                                                    switch_list)
-
-                else:
-                    output += configure_vrrp_for_non_clustered_switches(
-                        module, vlan_id, vrrp_ip, vrrp_ipv6, leaf_switch_1)
-
-    return output
+
+        elements = [element for element in row.split(',') if element]
+        vrrp_row = {
+            'vlan_id': elements.pop(0).strip(),
+            'ip': '',
+            'ipv6': '',
+            'vrrp_id': None,
+            'active_switch': None
+        }
+        if addr_type == 'ipv4_ipv6' or addr_type == 'ipv4':
+            vrrp_row['ip'] = elements.pop(0).strip()
+        if addr_type == 'ipv4_ipv6' or addr_type == 'ipv6':
+            vrrp_row['ipv6'] = elements.pop(0).strip()
+        leaves = [elements.pop(0).strip()]
+        if len(elements) > 2:
+            leaves.append(elements.pop(0).strip())
+            vrrp_row['vrrp_id'] = elements.pop(0).strip()
+            vrrp_row['active_switch'] = elements.pop(0).strip()
+
+        partitions.setdefault(tuple(leaves), []).append(vrrp_row)
+
+    return partitions
+
+
+def configure_vrrp(module, csv_data):
+    """
+    Method to configure VRRP L3.
+    :param module: The Ansible module to fetch input parameters.
+    :param csv_data: String containing vrrp data passed from csv file.
+    """
+    current_switch = module.params['pn_current_switch']
+    workers = module.params['pn_parallel_workers']
+    partitions = partition_vrrp_rows(module, csv_data)
+
+    if workers <= 1:
+        # Every leaf configures the rows it is the first leaf of, otherwise
+        # the single run of the task configures the rows of all leaves.
+        for leaves in list(partitions):
+            if leaves[0] != current_switch:
+                del partitions[leaves]
+
+    if not partitions:
+        return
+
+    create_clusters(module, [leaves for leaves in partitions
+                             if len(leaves) == 2])
+    create_vlans(module, partitions)
+    run_parallel(module, configure_partition, partitions.items(), workers)
 
 
 def main():
@@ -497,40 +569,29 @@ def main():
             pn_addr_type=dict(required=False, type='str',
                               choices=['ipv4', 'ipv6', 'ipv4_ipv6'],
                               default='ipv4'),
+            pn_parallel_workers=dict(required=False, type='int', default=1),
         )
     )
 
-    global CHANGED_FLAG
-    message = ''
+    exit_if_converged(module, '', 'Configure L3 vrrp')
+
     leaf_list = module.params['pn_leaf_list']
 
     if module.params['pn_current_switch'] in leaf_list:
-        message += configure_vrrp(module, module.params['pn_csv_data'])
+        configure_vrrp(module, module.params['pn_csv_data'])
 
-    # Exit the module and return the required JSON.
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + leaf_list
-    for switch in switch_list:
-        replace_string = switch + ': '
-
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {
-                    'switch': switch,
-                    'output': (line.replace(replace_string, '')).strip()
-                }
-                results.append(json_msg)
+    save_fingerprint(module)
 
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
         task='Configure L3 vrrp',
         msg='L3 vrrp configuration succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=RESULTS.changed,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -84,6 +84,10 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
@@ -98,7 +102,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -116,7 +120,8 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L3 vrrp',
             msg='L3 vrrp configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -486,6 +491,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure L3 vrrp')
+
     global CHANGED_FLAG
     message = ''
     leaf_list = module.params['pn_leaf_list']
@@ -508,6 +515,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -516,7 +525,8 @@ def main():
         summary=results,
         exception='',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=True if True in CHANGED_FLAG else False,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -139,9 +139,16 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+OSPF_BFD = OspfBfdConfig()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -153,7 +160,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -172,31 +179,13 @@ def run_cli(module, cli):
             task='Configure OSPF',
             stderr=err.strip(),
             msg='eBGP/OSPF configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
-def find_non_clustered_leafs(module):
-    """
-    Method to find leafs which are not part of any cluster.
-    :param module: The Ansible module to fetch input parameters.
-    :return: List of non clustered leaf switches.
-    """
-    non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
-
-    for leaf in module.params['pn_leaf_list']:
-        if leaf not in clustered_nodes:
-            non_clustered_leafs.append(leaf)
-
-    return non_clustered_leafs
-
-
 def create_cluster(module, name, node1, node2):
     """
     Method to create a cluster between two switches.
@@ -229,47 +218,12 @@ def create_leaf_clusters(module):
     :return: Output of create_cluster() method.
     """
     output = ''
-    non_clustered_leafs = find_non_clustered_leafs(module)
-    non_clustered_leafs_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
-
-    while non_clustered_leafs_count == 0:
-        if len(non_clustered_leafs) == 0:
-            non_clustered_leafs_count += 1
-        else:
-            node1 = non_clustered_leafs[0]
-            non_clustered_leafs.remove(node1)
-
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
-                if node2 in non_clustered_leafs:
-                    # Cluster creation
-                    cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    output += create_cluster(module, cluster_name, node1, node2)
-
-                    non_clustered_leafs.remove(node2)
-                    terminate_flag += 1
+    _, new_pairs = plan_leaf_clusters(
+        module, run_cli, module.params['pn_leaf_list'])
 
-                node_count += 1
+    for node1, node2 in new_pairs:
+        cluster_name = node1 + '-to-' + node2 + '-cluster'
+        output += create_cluster(module, cluster_name, node1, node2)
 
     return output
 
@@ -283,49 +237,112 @@ def configure_ospf_bfd(module, vrouter, ip):
     :return: String describing if OSPF BFD got added or if it already exists.
     """
     global CHANGED_FLAG
+    change = OSPF_BFD.enable(module, run_cli, vrouter, ip)
+    if change is None:
+        return ''
+
+    CHANGED_FLAG.append(True)
+    switch, command, nic = change
+    if command == 'vrouter-interface-config-add':
+        return ' %s: Added OSPF BFD config to %s \n' % (switch, vrouter)
+    return ' %s: Enabled OSPF BFD for %s \n' % (switch, vrouter)
+
+
+def ospf_redistribute_set(value):
+    """
+    Method to turn an ospf-redistribute value into the set of the route
+    types it redistributes, none and an empty value both meaning nothing.
+    :param value: Comma separated ospf-redistribute value.
+    :return: Set of the route types.
+    """
+    return set(value.split(',')) - set(['', 'none'])
+
+
+def get_ospf_snapshot(module, current_switch, vrouter):
+    """
+    Method to read the interfaces, loopbacks and the ospf/ospf6 configuration
+    of a vrouter.
+    :param module: The Ansible module to fetch input parameters.
+    :param current_switch: Name of the switch hosting the vrouter.
+    :param vrouter: Name of the vrouter.
+    :return: Dictionary holding the list of (l3-port, ip, ip2, nic, is-vip,
+    is-primary) interfaces, the list of (ip, router-if) loopbacks, the set of
+    ospf networks, the set of ospf6 nics, the ospf-passive-if flag of the
+    configured nics and the ospf-redistribute set of the vrouter.
+    """
     cli = pn_cli(module)
+    cli += ' switch %s ' % current_switch
     clicopy = cli
-    cli += ' vrouter-interface-show vrouter-name %s' % vrouter
-    cli += ' ip %s format nic no-show-headers ' % ip
-    nic_interface = run_cli(module, cli).split()
-    nic_interface = list(set(nic_interface))
-    nic_interface.remove(vrouter)
+    snapshot = {
+        'interfaces': [],
+        'loopbacks': [],
+        'networks': set(),
+        'ospf6_nics': set(),
+        'passive': {},
+        'redistribute': set()
+    }
+
+    cli += ' vrouter-show name %s ' % vrouter
+    cli += ' format name,ospf-redistribute parsable-delim ; '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 2:
+            continue
+        snapshot['redistribute'] = ospf_redistribute_set(fields[-1])
 
     cli = clicopy
-    cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface[0]
-    ospf_status = run_cli(module, cli).split()
-    ospf_status = list(set(ospf_status))
+    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter
+    cli += ' format l3-port,ip,ip2,nic,is-vip,is-primary parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 6:
+            continue
+        snapshot['interfaces'].append(tuple(fields[-6:]))
 
     cli = clicopy
-    cli += ' vrouter-show name ' + vrouter
-    cli += ' format location no-show-headers '
-    switch = run_cli(module, cli).split()[0]
+    cli += ' vrouter-loopback-interface-show vrouter-name %s ' % vrouter
+    cli += ' format ip,router-if parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        snapshot['loopbacks'].append(tuple(fields[-2:]))
 
-    if 'Success' in ospf_status:
-        cli = clicopy
-        cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Added OSPF BFD config to %s \n' % (switch, vrouter)
-    elif 'enable' not in ospf_status:
-        ospf_status.remove(vrouter)
-        cli = clicopy
-        cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Enabled OSPF BFD for %s \n' % (switch, vrouter)
-    else:
-        return ''
+    cli = clicopy
+    cli += ' vrouter-ospf-show vrouter-name %s ' % vrouter
+    cli += ' format network parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        network = line.strip().split(',')[-1]
+        if '/' in network:
+            snapshot['networks'].add(ipv4_network(network))
 
+    cli = clicopy
+    cli += ' vrouter-ospf6-show vrouter-name %s ' % vrouter
+    cli += ' format nic parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        snapshot['ospf6_nics'].add(fields[-1])
 
-def add_ospf_loopback(module, current_switch):
+    cli = clicopy
+    cli += ' vrouter-interface-config-show vrouter-name %s ' % vrouter
+    cli += ' format nic,ospf-passive-if parsable-delim , '
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        snapshot['passive'][fields[-2]] = fields[-1]
+
+    return snapshot
+
+
+def add_ospf_loopback(module, current_switch, snapshot):
     """
     Method to add loopback network to OSPF
     :param module: The Ansible module to fetch input parameters.
     :param current_switch: Switch to add network statements.
+    :param snapshot: Snapshot of the vrouter returned by get_ospf_snapshot().
     :return: String describing if loopback network got added to OSPF or not.
     """
     global CHANGED_FLAG
@@ -335,45 +352,46 @@ def add_ospf_loopback(module, current_switch):
     clicopy = cli
     vr_name = current_switch + '-vrouter'
 
-    cli += ' vrouter-loopback-interface-show vrouter-name %s' % vr_name
-    cli += ' format ip,router-if parsable-delim ,'
-    loopback_ip = run_cli(module, cli).strip().split('\n')
-    for addr in loopback_ip:
-        ip1 = addr.split(',')
-        ip = ip1[1]
-        if len(ip.split('.')) == 1:
-            nic = ip1[2]
+    for ip, nic in snapshot['loopbacks']:
+        ip = ip.split('/')[0]
+        if ':' in ip:
+            if nic in snapshot['ospf6_nics']:
+                continue
+
             cli = clicopy
-            cli += ' vrouter-ospf6-show vrouter-name %s' % vr_name
-            cli += ' nic %s no-show-headers ' % nic
-            already_added = run_cli(module, cli)
-            if 'Success' in already_added:
-                cli = clicopy
-                cli += ' vrouter-ospf6-add vrouter-name %s' % vr_name
-                cli += ' nic %s' % nic
-                cli += ' ospf6-area %s' % module.params['pn_ospf_v6_area_id']
-                output += run_cli(module, cli)
-        else:
-            l_ip = ip1[1]
+            cli += ' vrouter-ospf6-add vrouter-name %s' % vr_name
+            cli += ' nic %s' % nic
+            cli += ' ospf6-area %s' % module.params['pn_ospf_v6_area_id']
+            if 'Success' in run_cli(module, cli):
+                snapshot['ospf6_nics'].add(nic)
+                output += ' %s: Added OSPF6 nic %s to %s \n' % (
+                    current_switch, nic, vr_name
+                )
+                CHANGED_FLAG.append(True)
+        elif ip:
+            if ip + '/32' in snapshot['networks']:
+                continue
+
             cli = clicopy
-            cli += ' vrouter-ospf-show vrouter-name %s' % vr_name
-            cli += ' network %s no-show-headers ' % l_ip
-            already_added = run_cli(module, cli).split()
-            if 'Success' in already_added:
-                cli = clicopy
-                cli += ' vrouter-ospf-add vrouter-name %s' % vr_name
-                cli += ' network %s/32' % l_ip
-                cli += ' ospf-area %s' % module.params['pn_ospf_v4_area_id']
-                output += run_cli(module, cli)
+            cli += ' vrouter-ospf-add vrouter-name %s' % vr_name
+            cli += ' network %s/32' % ip
+            cli += ' ospf-area %s' % module.params['pn_ospf_v4_area_id']
+            if 'Success' in run_cli(module, cli):
+                snapshot['networks'].add(ip + '/32')
+                output += ' %s: Added OSPF loopback %s/32 to %s \n' % (
+                    current_switch, ip, vr_name
+                )
+                CHANGED_FLAG.append(True)
 
     return output
 
 
-def add_ospf_neighbor(module, current_switch):
+def add_ospf_neighbor(module, current_switch, snapshot):
     """
     Method to add ospf_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
-    :param dict_area_id: Dictionary containing area_id of leafs.
+    :param current_switch: Switch to add ospf neighbors.
+    :param snapshot: Snapshot of the vrouter returned by get_ospf_snapshot().
     :return: String describing if ospf neighbors got added or not.
     """
     global CHANGED_FLAG
@@ -385,145 +403,72 @@ def add_ospf_neighbor(module, current_switch):
 
     vrouter = current_switch + '-vrouter'
 
-    cli = clicopy
-    cli += ' vrouter-interface-show vrouter-name %s ' % vrouter
-    cli += ' format l3-port no-show-headers '
-    port_list = run_cli(module, cli).split()
-    port_list = list(set(port_list))
-    port_list.remove(vrouter)
-
     if module.params['pn_area_configure_flag'] == 'singlearea':
         ospf_area_id = module.params['pn_ospf_v4_area_id']
     else:
         ospf_area_id = str(int(module.params['pn_ospf_v4_area_id']) + 1)
 
-    if addr_type == 'ipv6':
-        ospf_area_id = module.params['pn_ospf_v6_area_id']
-
-    for port in port_list:
-        cli = clicopy
-        cli += ' vrouter-interface-show vrouter-name %s l3-port %s' % (
-            vrouter, port
-        )
-        cli += ' format ip no-show-headers'
-        ip = run_cli(module, cli).split()
-        ip = list(set(ip))
-        ip.remove(vrouter)
-        ip = ip[0]
-        ip_switch = ip
-
-        if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
-            ip = ip.split('.')
-            static_part = str(ip[0]) + '.' + str(ip[1]) + '.'
-            static_part += str(ip[2]) + '.'
-            last_octet = str(ip[3]).split('/')
-            netmask = last_octet[1]
-
-            last_octet_ip_mod = int(last_octet[0]) % (1 << (32 - int(netmask)))
-            ospf_last_octet = int(last_octet[0]) - last_octet_ip_mod
-            ospf_network = static_part + str(ospf_last_octet) + '/' + netmask
-        elif addr_type == 'ipv6':
-            ip = ip.split('/')
-            ip_spine = ip[0]
-            netmask = ip[1]
-            ip = ip[0]
-
-            ip = ip.split(':')
-            if not ip[-1]:
-                ip[-1] = '0'
-            #leaf_last_octet = hex(int(ip[-1], 16) + 1)[2:]
-            last_octet_ipv6 = int(ip[-1], 16)
-            last_octet_ipv6_mod = last_octet_ipv6 % (1 << (128 - int(netmask)))
-            ospf_last_octet = hex(last_octet_ipv6 - last_octet_ipv6_mod)[2:]
-            leaf_last_octet = hex(last_octet_ipv6 + 1)[2:]
-            ip[-1] = str(leaf_last_octet)
-            ip_leaf = ':'.join(ip)
-            ip[-1] = str(ospf_last_octet)
-            ospf_network = ':'.join(ip) + '/' + netmask
+    for port, ip, ip2, nic, is_vip, is_primary in snapshot['interfaces']:
+        if not port:
+            continue
 
         if addr_type == 'ipv4_ipv6' or addr_type == 'ipv6':
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name %s l3-port %s' % (
-                vrouter, port)
-            if addr_type == 'ipv4_ipv6':
-                cli += ' format ip2 no-show-headers'
-            elif addr_type == 'ipv6':
-                cli += ' format ip no-show-headers'
-            ip2 = run_cli(module, cli).split()
-            ip2 = list(set(ip2))
-            ip2.remove(vrouter)
-            ip_switch_ipv6 = ip2[0]
-
-            cli = clicopy
-            cli += 'vrouter-interface-show vrouter-name %s' % vrouter
-            if addr_type == 'ipv4_ipv6':
-                cli += ' ip2 %s ' % ip_switch_ipv6
-            elif addr_type == 'ipv6':
-                cli += ' ip %s ' % ip_switch_ipv6
-            cli += ' format nic no-show-headers '
-            nic = run_cli(module, cli).split()
-            nic = list(set(nic))
-            nic.remove(vrouter)
-            nic = nic[0]
-
-            cli = clicopy
-            cli += 'vrouter-ospf6-show nic %s format switch no-show-headers ' % nic
-            ipv6_vrouter = run_cli(module, cli).split()
-
-            if vrouter not in ipv6_vrouter:
+            ipv6 = ip2 if addr_type == 'ipv4_ipv6' else ip
+            if ipv6 and nic not in snapshot['ospf6_nics']:
                 cli = clicopy
                 cli += 'vrouter-ospf6-add vrouter-name %s nic %s ospf6-area %s ' % (
                     vrouter, nic, module.params['pn_ospf_v6_area_id'])
-                run_cli(module, cli)
-                output += ' %s: Added OSPF6 nic %s to %s \n' % (
-                    current_switch, nic, vrouter
-                )
+                if 'Success' in run_cli(module, cli):
+                    snapshot['ospf6_nics'].add(nic)
+                    output += ' %s: Added OSPF6 nic %s to %s \n' % (
+                        current_switch, nic, vrouter
+                    )
+                    CHANGED_FLAG.append(True)
 
-        if addr_type == 'ipv4' or addr_type == 'ipv4_ipv6':
-            cli = clicopy
-            cli += ' vrouter-ospf-show'
-            cli += ' network %s format switch no-show-headers ' % ospf_network
-            already_added = run_cli(module, cli).split()
+        if (addr_type == 'ipv4' or addr_type == 'ipv4_ipv6') and '/' in ip:
+            ospf_network = ipv4_network(ip)
+            if ospf_network in snapshot['networks']:
+                continue
 
-            if vrouter in already_added:
-                pass
-            else:
-                if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter,
-                                                 ip_switch)
+            if module.params['pn_bfd']:
+                output += configure_ospf_bfd(module, vrouter, ip)
 
-                cli = clicopy
-                cli += ' vrouter-ospf-add vrouter-name ' + vrouter
-                cli += ' network %s ospf-area %s' % (ospf_network,
-                                                     ospf_area_id)
+            cli = clicopy
+            cli += ' vrouter-ospf-add vrouter-name ' + vrouter
+            cli += ' network %s ospf-area %s' % (ospf_network, ospf_area_id)
 
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                        current_switch, ospf_network, vrouter
-                    )
-                    CHANGED_FLAG.append(True)
+            if 'Success' in run_cli(module, cli):
+                snapshot['networks'].add(ospf_network)
+                output += ' %s: Added OSPF neighbor %s to %s \n' % (
+                    current_switch, ospf_network, vrouter
+                )
+                CHANGED_FLAG.append(True)
 
     return output
 
 
-def add_ospf_redistribute(module, current_switch):
+def add_ospf_redistribute(module, current_switch, snapshot):
     """
     Method to add ospf_redistribute to the vrouters.
     :param module: The Ansible module to fetch input parameters.
-    :param vrouter_names: List of vrouter names.
+    :param current_switch: Switch hosting the vrouter.
+    :param snapshot: Snapshot of the vrouter returned by get_ospf_snapshot().
     :return: String describing if ospf-redistribute got added or not.
     """
     global CHANGED_FLAG
     output = ''
     pn_ospf_redistribute = module.params['pn_ospf_redistribute']
-    cli = pn_cli(module)
-    clicopy = cli
     vrouter = current_switch + '-vrouter'
 
-    cli = clicopy
+    redistribute = ospf_redistribute_set(pn_ospf_redistribute)
+    if redistribute == snapshot['redistribute']:
+        return output
+
+    cli = pn_cli(module)
     cli += ' vrouter-modify name %s' % vrouter
     cli += ' ospf-redistribute %s' % pn_ospf_redistribute
     if 'Success' in run_cli(module, cli):
+        snapshot['redistribute'] = redistribute
         output += ' %s: Added ospf_redistribute to %s \n' % (current_switch,
                                                              vrouter)
         CHANGED_FLAG.append(True)
@@ -549,9 +494,7 @@ def vrouter_iospf_interface_add(module, switch_name, ip_addr, ip2_addr, ospf_are
 
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s vlan %s' % (ip_addr, vlan_id)
@@ -585,18 +528,23 @@ def vrouter_iospf_interface_add(module, switch_name, ip_addr, ip2_addr, ospf_are
 
     cli = clicopy
     cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s no-show-headers ' % nic
-    config_exists = run_cli(module, cli).split()
+    cli += ' nic %s format ospf-cost,ospf-network-type' % nic
+    cli += ' parsable-delim , '
+    config = run_cli(module, cli).strip().split(',')
     cli = clicopy
-    if 'Success' in config_exists:
+    if len(config) < 2:
         cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-cost %s' % (nic, ospf_cost)
-    else:
+    elif config[-2] != str(ospf_cost) or \
+            (p2p and config[-1] != 'point-to-point'):
         cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
+    else:
+        cli = None
+    if cli:
         cli += ' nic %s ospf-cost %s' % (nic, ospf_cost)
-    if p2p:
-        cli += ' ospf-network-type point-to-point'
-    run_cli(module, cli)
+        if p2p:
+            cli += ' ospf-network-type point-to-point'
+        run_cli(module, cli)
+        CHANGED_FLAG.append(True)
 
     if ip_addr and (addr_type == 'ipv4' or addr_type == 'ipv4_ipv6'):
         cli = clicopy
@@ -634,6 +582,7 @@ def vrouter_iospf_interface_add(module, switch_name, ip_addr, ip2_addr, ospf_are
             output += ' %s: Added OSPF6 nic %s to %s \n' % (
                 switch_name, nic, vrouter
             )
+            CHANGED_FLAG.append(True)
 
     return output
 
@@ -650,8 +599,13 @@ def vrouter_iospf_vlan_ports_add(module, switch_name, cluster_ports):
 
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' switch %s vlan-show format id no-show-headers ' % switch_name
-    existing_vlans = run_cli(module, cli).split()
+    cli += ' switch %s vlan-show format id,ports parsable-delim ; ' % switch_name
+    existing_vlans = {}
+    for line in run_cli(module, cli).splitlines():
+        fields = line.strip().split(';')
+        if len(fields) < 2:
+            continue
+        existing_vlans[fields[-2]] = expand_ports(fields[-1])
 
     if vlan_id not in existing_vlans:
         cli = clicopy
@@ -660,11 +614,17 @@ def vrouter_iospf_vlan_ports_add(module, switch_name, cluster_ports):
         cli += ' ports none description iOSPF-cluster-vlan '
         run_cli(module, cli)
         output = ' %s: Created vlan with id %s \n' % (switch_name, vlan_id)
+        CHANGED_FLAG.append(True)
 
-    cli = clicopy
-    cli += ' switch %s vlan-port-add vlan-id %s ports %s' % (switch_name, vlan_id, cluster_ports)
-    run_cli(module, cli)
-    CHANGED_FLAG.append(True)
+    missing_ports = set(port for port in expand_ports(cluster_ports)
+                        if isinstance(port, int))
+    missing_ports -= existing_vlans.get(vlan_id, set())
+    if missing_ports:
+        cli = clicopy
+        cli += ' switch %s vlan-port-add vlan-id %s ports %s' % (
+            switch_name, vlan_id, compress_ports(missing_ports))
+        run_cli(module, cli)
+        CHANGED_FLAG.append(True)
 
     return output
 
@@ -748,51 +708,39 @@ def assign_leafcluster_ospf_interface(module):
     return output
 
 
-def make_interface_passive(module, current_switch):
+def make_interface_passive(module, current_switch, snapshot):
     """
     Method to make VRRP interfaces ospf passive.
     :param module: The Ansible module to fetch input parameters.
+    :param current_switch: Switch hosting the vrouter.
+    :param snapshot: Snapshot of the vrouter returned by get_ospf_snapshot().
     :return: String describing if ospf passive interfaces changed or not.
     """
+    global CHANGED_FLAG
     output = ''
     cli = pn_cli(module)
     clicopy = cli
-
     vrname = "%s-vrouter" % current_switch
-    cli = clicopy
-    cli += ' switch %s vrouter-interface-config-show vrouter-name ' % current_switch
-    cli += ' %s format nic,ospf-passive-if parsable-delim ,' % vrname
-    pass_intf = run_cli(module, cli).split()
-    passv_info = {}
-    for intf in pass_intf:
-        if not intf:
-            break
-        vrname, intf_index, passv = intf.split(',')
-        passv_info[intf_index] = passv
 
-    cli = clicopy
-    cli += ' switch %s vrouter-interface-show vrouter-name %s ' % (current_switch, vrname)
-    cli += ' format is-vip,is-primary,nic parsable-delim ,'
-    intf_info = run_cli(module, cli).split()
-    for intf in intf_info:
-        if not intf:
-            output += "No router interface exist"
-        vrname, is_vip, is_primary, intf_index = intf.split(',')
-        if is_vip == 'true' or is_primary == 'true':
-            if intf_index in passv_info:
-                if passv_info[intf_index] == "false":
-                    cli = clicopy
-                    cli += ' vrouter-interface-config-modify vrouter-name %s ' % vrname
-                    cli += ' nic %s ospf-passive-if ' % intf_index
-                    run_cli(module, cli)
-            else:
-                cli = clicopy
-                cli += ' vrouter-interface-config-add vrouter-name %s ' % vrname
-                cli += ' nic %s ospf-passive-if ' % intf_index
-                run_cli(module, cli)
-                output += '%s: Added OSPF nic %s to %s \n' % (
-                    vrname, intf_index, vrname
-                )
+    for port, ip, ip2, nic, is_vip, is_primary in snapshot['interfaces']:
+        if is_vip != 'true' and is_primary != 'true':
+            continue
+
+        passive = snapshot['passive'].get(nic)
+        if passive == 'true':
+            continue
+
+        cli = clicopy
+        if passive is None:
+            cli += ' vrouter-interface-config-add vrouter-name %s ' % vrname
+        else:
+            cli += ' vrouter-interface-config-modify vrouter-name %s ' % vrname
+        cli += ' nic %s ospf-passive-if ' % nic
+        if 'Success' in run_cli(module, cli):
+            snapshot['passive'][nic] = 'true'
+            output += ' %s: Made OSPF nic %s of %s passive \n' % (
+                current_switch, nic, vrname
+            )
             CHANGED_FLAG.append(True)
 
     return output
@@ -833,6 +781,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure OSPF', LOCAL_STATE)
+
     global CHANGED_FLAG
     routing_protocol = module.params['pn_routing_protocol']
     current_switch = module.params['pn_current_switch']
@@ -843,10 +793,12 @@ def main():
         message += create_leaf_clusters(module)
 
     if routing_protocol == 'ospf':
-        message += add_ospf_loopback(module, current_switch)
-        message += add_ospf_neighbor(module, current_switch)
-        message += add_ospf_redistribute(module, current_switch)
-        message += make_interface_passive(module, current_switch)
+        snapshot = get_ospf_snapshot(module, current_switch,
+                                     current_switch + '-vrouter')
+        message += add_ospf_loopback(module, current_switch, snapshot)
+        message += add_ospf_neighbor(module, current_switch, snapshot)
+        message += add_ospf_redistribute(module, current_switch, snapshot)
+        message += make_interface_passive(module, current_switch, snapshot)
     if current_switch in spine_list and spine_list.index(current_switch) == 0:
         message += assign_leafcluster_ospf_interface(module)
 
@@ -864,6 +816,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -872,7 +826,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure OSPF'
+        task='Configure OSPF',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
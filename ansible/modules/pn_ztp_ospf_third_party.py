@@ -139,9 +139,16 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
+OSPF_BFD = OspfBfdConfig()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (VLAN_STATE_CLI,)
 
 
 def run_cli(module, cli):
@@ -153,7 +160,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -172,7 +179,8 @@ def run_cli(module, cli):
             task='Configure OSPF',
             stderr=err.strip(),
             msg='OSPF configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -283,43 +291,16 @@ def configure_ospf_bfd(module, vrouter, ip):
     :return: String describing if OSPF BFD got added or if it already exists.
     """
     global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vrouter-name %s' % vrouter
-    cli += ' ip %s format nic no-show-headers ' % ip
-    nic_interface = run_cli(module, cli).split()
-    nic_interface = list(set(nic_interface))
-    nic_interface.remove(vrouter)
-
-    cli = clicopy
-    cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface[0]
-    ospf_status = run_cli(module, cli).split()
-    ospf_status = list(set(ospf_status))
-
-    cli = clicopy
-    cli += ' vrouter-show name ' + vrouter
-    cli += ' format location no-show-headers '
-    switch = run_cli(module, cli).split()[0]
-
-    if 'Success' in ospf_status:
-        cli = clicopy
-        cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Added OSPF BFD config to %s \n' % (switch, vrouter)
-    elif 'enable' not in ospf_status:
-        ospf_status.remove(vrouter)
-        cli = clicopy
-        cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Enabled OSPF BFD for %s \n' % (switch, vrouter)
-    else:
+    change = OSPF_BFD.enable(module, run_cli, vrouter, ip)
+    if change is None:
         return ''
 
+    CHANGED_FLAG.append(True)
+    switch, command, nic = change
+    if command == 'vrouter-interface-config-add':
+        return ' %s: Added OSPF BFD config to %s \n' % (switch, vrouter)
+    return ' %s: Enabled OSPF BFD for %s \n' % (switch, vrouter)
+
 
 def add_ospf_loopback(module, current_switch):
     """
@@ -552,9 +533,7 @@ def vrouter_iospf_interface_add(module, switch_name, ip_addr, ip2_addr, ospf_are
 
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = VROUTERS.vrouter(module, run_cli, switch_name)
 
     cli = clicopy
     cli += ' vrouter-interface-show ip %s vlan %s' % (ip_addr, vlan_id)
@@ -838,6 +817,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure OSPF', LOCAL_STATE)
+
     global CHANGED_FLAG
     routing_protocol = module.params['pn_routing_protocol']
     current_switch = module.params['pn_current_switch']
@@ -870,6 +851,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module, LOCAL_STATE)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -878,7 +861,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Configure OSPF'
+        task='Configure OSPF',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -16,8 +16,13 @@
 # limitations under the License.
 
 import shlex
+from collections import OrderedDict
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import PORT_STATE_CLI
+from ansible.module_utils.pn_nvos import ResultCollector, run_parallel
+from ansible.module_utils.pn_nvos import compress_ports
 
 
 EXAMPLES = """
@@ -31,7 +36,7 @@ RETURN = """
 summary:
   description: It contains output of each configuration along with switch name.
   returned: always
-  type: str
+  type: list
 changed:
   description: Indicates whether the CLI caused changes on the target.
   returned: always
@@ -56,9 +61,15 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
-CHANGED_FLAG = []
+RESULTS = ResultCollector()
+# Switch-local objects the module writes, see config_counter().
+LOCAL_STATE = (PORT_STATE_CLI,)
 
 def run_cli(module, cli):
     """
@@ -70,7 +81,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -87,44 +98,55 @@ def run_cli(module, cli):
             summary=results,
             task='Port modify',
             msg='Port modify failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
 
 
+def disable_ports(module, switch_ports):
+    """
+    Method to disable the foreign ports of a switch with a single command.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch_ports: Tuple of the switch name and a dictionary of its
+    ports to the name of the connected system.
+    """
+    switch, ports = switch_ports
+    cli = pn_cli(module)
+    cli += 'switch %s port-config-modify ' % switch
+    cli += 'port %s disable ' % compress_ports(ports)
+    run_cli(module, cli)
+    for port in sorted(ports, key=int):
+        RESULTS.add(switch, 'port-config-modify', port,
+                    'Port %s connected to %s disabled' % (port, ports[port]))
+
+
 def port_modify(module):
     """
     Method to disable the ports which doesnt belong to ztp fabric.
     :param module: The Ansible module to fetch input parameters.
-    :return: switches with disabled ports
     """
-    result = list()
     cli = pn_cli(module)
     clicopy = cli
 
     if module.params['pn_port_disable'] is True:
         cli += 'fabric-node-show format name parsable-delim ,'
-        switch_list = list(set(run_cli(module, cli).strip().split()))
+        fabric_nodes = set(run_cli(module, cli).strip().split())
 
         cli = clicopy
         cli += 'lldp-show format switch,local-port,sys-name parsable-delim ,'
         lldp_list = run_cli(module, cli).strip().split('\n')
+
+        foreign_ports = OrderedDict()
         for row in lldp_list:
             row = row.split(',')
-            if row[2] in switch_list:
+            if len(row) < 3 or row[2] in fabric_nodes:
                 continue
-            else:
-                cli = clicopy
-                cli += 'switch %s port-config-modify ' % row[0]
-                cli += 'port %s disable ' % row[1]
-                run_cli(module, cli)
-                CHANGED_FLAG.append(True)
-                result.append({
-                    'switch': row[0],
-                    'output': 'Port %s connected to %s disabled' % (row[1], row[2])
-                })
-    return result
+            foreign_ports.setdefault(row[0], {})[row[1]] = row[2]
+
+        run_parallel(module, disable_ports, foreign_ports.items(),
+                     module.params['pn_parallel_workers'])
 
 
 def main():
@@ -132,21 +154,27 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             pn_current_switch=dict(required=False, type='str'),
-            pn_port_disable=dict(required=False, type='bool', default=True)
+            pn_port_disable=dict(required=False, type='bool', default=True),
+            pn_parallel_workers=dict(required=False, type='int', default=4),
         )
     )
 
-    results = []
-    results = port_modify(module)
+    exit_if_converged(module, module.params['pn_current_switch'],
+                      'Ports modify', LOCAL_STATE)
+
+    port_modify(module)
+
+    save_fingerprint(module, LOCAL_STATE)
 
     module.exit_json(
         unreachable=False,
         msg='Ports modify succeeded',
-        summary=results,
+        summary=RESULTS.summary(),
         exception='',
         task='Ports modify',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=RESULTS.changed,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
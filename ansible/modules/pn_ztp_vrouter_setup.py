@@ -21,7 +21,9 @@
 import shlex
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pn_nvos import pn_cli
+from ansible.module_utils.pn_nvos import pn_cli, execute_cli, cli_retries
+from ansible.module_utils.pn_nvos import exit_if_converged, save_fingerprint
+from ansible.module_utils.pn_nvos import ipv6_to_int
 
 DOCUMENTATION = """
 ---
@@ -83,6 +85,10 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 CHANGED_FLAG = []
@@ -97,7 +103,7 @@ def run_cli(module, cli):
     """
     results = []
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
 
     if out:
         return out
@@ -114,88 +120,62 @@ def run_cli(module, cli):
             summary=results,
             task='Create vrouter',
             msg='Vrouter creation failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return None
 
 
-def create_vrouter(module, switch):
+def get_vrouter_config(module, vrouter):
     """
-    Create a hardware vrouter.
+    Read the router id and the loopback addresses of a vrouter.
     :param module: The Ansible module to fetch input parameters.
-    :param switch: The name of current running switch.
-    :return: String describing if vrouter got created or not.
+    :param vrouter: The name of the vrouter.
+    :return: Dictionary holding whether the vrouter exists, its router id and
+    the set of its loopback addresses.
     """
-    global CHANGED_FLAG
-    output = ''
-    vrrp_id = module.params['pn_vrrp_id']
-    pn_ospf_redistribute = module.params['pn_ospf_redistribute']
-    pn_pim_ssm = module.params['pn_pim_ssm']
-
-    cli = pn_cli(module)
-    cli += ' fabric-node-show format fab-name no-show-headers '
-    fabric_name = list(set(run_cli(module, cli).split()))[0]
-    vnet_name = fabric_name + '-global'
+    config = {'exists': False, 'router-id': '', 'loopbacks': set()}
 
     cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli)
-
-    if existing_vrouter_names is not None:
-        existing_vrouter_names = existing_vrouter_names.split()
+    cli += ' vrouter-show format name,router-id parsable-delim , '
+    for line in (run_cli(module, cli) or '').splitlines():
+        fields = line.strip().split(',')
+        if len(fields) >= 2 and fields[-2] == vrouter:
+            config['exists'] = True
+            config['router-id'] = fields[-1]
 
-    new_vrouter = False
-    vrouter_name = switch + '-vrouter'
-
-    if (existing_vrouter_names is not None and vrouter_name not in
-            existing_vrouter_names):
-        new_vrouter = True
-
-    if new_vrouter or existing_vrouter_names is None:
-        if pn_pim_ssm == True:
-            pim_ssm = 'pim-ssm'
-        else:
-            pim_ssm = 'none'
+    if not config['exists']:
+        return config
 
-        cli = pn_cli(module)
-        cli += ' switch %s ' % switch
-        cli += ' vrouter-create name %s vnet %s hw-vrrp-id %s enable ' % (
-            vrouter_name, vnet_name, vrrp_id)
-        cli += ' router-type hardware proto-multi %s ' % pim_ssm
-        if pn_ospf_redistribute:
-            cli += ' ospf-redistribute %s ' % pn_ospf_redistribute
-        if module.params['pn_bgp_as']:
-            cli += ' bgp-as %s' % module.params['pn_bgp_as']
-        if module.params['pn_bgp_redistribute']:
-            cli += ' bgp-redistribute %s' % module.params['pn_bgp_redistribute']
-        run_cli(module, cli)
-        output = ' %s: Created vrouter with name %s \n' % (switch, vrouter_name)
-        CHANGED_FLAG.append(True)
+    cli = pn_cli(module)
+    cli += ' vrouter-loopback-interface-show vrouter-name %s ' % vrouter
+    cli += ' format ip parsable-delim , '
+    for line in (run_cli(module, cli) or '').splitlines():
+        address = line.strip().split(',')[-1].split('/')[0]
+        if ':' in address:
+            config['loopbacks'].add(ipv6_to_int(address))
+        elif address:
+            config['loopbacks'].add(address)
 
-    return output
+    return config
 
 
-def assign_loopback_and_router_id(module, loopback_address, current_switch):
+def get_loopback_addresses(module, loopback_address, current_switch):
     """
-    Add loopback interface and router id to vrouters.
+    Compute the loopback addresses of the vrouter of a switch.
     :param module: The Ansible module to fetch input parameters.
-    :param loopback_address: The loopback ip to be assigned.
+    :param loopback_address: The first loopback ip of the fabric.
     :param current_switch: The name of current running switch.
-    :return: String describing if loopback ip/router id got assigned or not.
+    :return: Tuple of the ipv4 loopback ip, which is the router id as well,
+    and the ipv6 loopback ip or None.
     """
-    global CHANGED_FLAG
-    output = ''
-
     leaf_list = module.params['pn_leaf_list']
     spine_list = module.params['pn_spine_list']
     address = loopback_address.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
     vrouter_count = int(address[3].split('/')[0])
-    add_loopback = False
-    vrouter = current_switch + '-vrouter'
-    cli = pn_cli(module)
 
     switch_list = spine_list + leaf_list
 #    if current_switch in spine_list:
@@ -206,11 +186,10 @@ def assign_loopback_and_router_id(module, loopback_address, current_switch):
     if current_switch in switch_list:
         count = switch_list.index(current_switch)
 
+    loopback_ipv6_ip = None
     if module.params['pn_loopback_ip_v6']:
-        add_loopback_v6 = False
         loopback_ipv6 = module.params['pn_loopback_ip_v6']
         ipv6 = loopback_ipv6.split('/')
-        subnet_ipv6 = ipv6[1]
         ipv6 = ipv6[0]
         ipv6 = ipv6.split(':')
         if not ipv6[-1]:
@@ -220,55 +199,99 @@ def assign_loopback_and_router_id(module, loopback_address, current_switch):
         ipv6[-1] = str(hex(host_count_ipv6)[2:])
         loopback_ipv6_ip = ':'.join(ipv6)
 
-        # Check existing loopback ip v6
-        cli = pn_cli(module)
-        cli += ' vrouter-loopback-interface-show ip %s ' % loopback_ipv6_ip
-        cli += ' format switch no-show-headers '
-        existing_vrouter = run_cli(module, cli)
-    
-        if existing_vrouter is not None:
-            existing_vrouter = existing_vrouter.split()
-            if vrouter not in existing_vrouter:
-                add_loopback_v6 = True
-    
-        # Add loopback ip v6 if not already exists
-        if add_loopback_v6 or existing_vrouter is None:
-            cli = pn_cli(module)
-            cli += ' vrouter-loopback-interface-add '
-            cli += ' vrouter-name %s ip %s ' % (vrouter, loopback_ipv6_ip)
-            run_cli(module, cli)
-            CHANGED_FLAG.append(True)
-            output += '%s: Added loopback ip %s to %s\n' % (current_switch, loopback_ipv6_ip, vrouter)
-
     count += vrouter_count
     ip = static_part + str(count)
 
-    # Add router id
+    return ip, loopback_ipv6_ip
+
+
+def create_vrouter(module, switch, router_id):
+    """
+    Create a hardware vrouter.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: The name of current running switch.
+    :param router_id: The router id to be assigned.
+    :return: String describing if vrouter got created or not.
+    """
+    global CHANGED_FLAG
+    vrrp_id = module.params['pn_vrrp_id']
+    pn_ospf_redistribute = module.params['pn_ospf_redistribute']
+    pn_pim_ssm = module.params['pn_pim_ssm']
+    vrouter_name = switch + '-vrouter'
+
     cli = pn_cli(module)
-    cli += ' vrouter-modify name %s router-id %s ' % (vrouter, ip)
-    run_cli(module, cli)
-    output += '%s: Added router id %s to %s\n' % (current_switch, ip, vrouter)
+    cli += ' fabric-node-show format fab-name no-show-headers '
+    fabric_name = list(set(run_cli(module, cli).split()))[0]
+    vnet_name = fabric_name + '-global'
+
+    if pn_pim_ssm == True:
+        pim_ssm = 'pim-ssm'
+    else:
+        pim_ssm = 'none'
 
-    # Check existing loopback ip
     cli = pn_cli(module)
-    cli += ' vrouter-loopback-interface-show ip %s ' % ip
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli)
+    cli += ' switch %s ' % switch
+    cli += ' vrouter-create name %s vnet %s hw-vrrp-id %s enable ' % (
+        vrouter_name, vnet_name, vrrp_id)
+    cli += ' router-type hardware proto-multi %s ' % pim_ssm
+    cli += ' router-id %s ' % router_id
+    if pn_ospf_redistribute:
+        cli += ' ospf-redistribute %s ' % pn_ospf_redistribute
+    if module.params['pn_bgp_as']:
+        cli += ' bgp-as %s' % module.params['pn_bgp_as']
+    if module.params['pn_bgp_redistribute']:
+        cli += ' bgp-redistribute %s' % module.params['pn_bgp_redistribute']
+    run_cli(module, cli)
+    CHANGED_FLAG.append(True)
+
+    output = ' %s: Created vrouter with name %s \n' % (switch, vrouter_name)
+    output += '%s: Added router id %s to %s\n' % (switch, router_id,
+                                                  vrouter_name)
+    return output
 
-    if existing_vrouter is not None:
-        existing_vrouter = existing_vrouter.split()
-        if vrouter not in existing_vrouter:
-            add_loopback = True
+
+def assign_loopback_and_router_id(module, config, ip, ipv6, current_switch):
+    """
+    Add loopback interface and router id to vrouters.
+    :param module: The Ansible module to fetch input parameters.
+    :param config: The vrouter config returned by get_vrouter_config().
+    :param ip: The ipv4 loopback ip, which is the router id as well.
+    :param ipv6: The ipv6 loopback ip or None.
+    :param current_switch: The name of current running switch.
+    :return: String describing if loopback ip/router id got assigned or not.
+    """
+    global CHANGED_FLAG
+    output = ''
+    vrouter = current_switch + '-vrouter'
+
+    # Add loopback ip v6 if not already exists
+    if ipv6 and ipv6_to_int(ipv6) not in config['loopbacks']:
+        cli = pn_cli(module)
+        cli += ' vrouter-loopback-interface-add '
+        cli += ' vrouter-name %s ip %s ' % (vrouter, ipv6)
+        run_cli(module, cli)
+        CHANGED_FLAG.append(True)
+        output += '%s: Added loopback ip %s to %s\n' % (current_switch, ipv6,
+                                                        vrouter)
+
+    # Add router id if it differs
+    if config['router-id'] != ip:
+        cli = pn_cli(module)
+        cli += ' vrouter-modify name %s router-id %s ' % (vrouter, ip)
+        run_cli(module, cli)
+        CHANGED_FLAG.append(True)
+        output += '%s: Added router id %s to %s\n' % (current_switch, ip,
+                                                      vrouter)
 
     # Add loopback ip if not already exists
-    if add_loopback or existing_vrouter is None:
+    if ip not in config['loopbacks']:
         cli = pn_cli(module)
         cli += ' vrouter-loopback-interface-add '
         cli += ' vrouter-name %s ip %s ' % (vrouter, ip)
         run_cli(module, cli)
         CHANGED_FLAG.append(True)
-        output += '%s: Added loopback ip %s to %s\n' % (current_switch, ip, vrouter)
-
+        output += '%s: Added loopback ip %s to %s\n' % (current_switch, ip,
+                                                        vrouter)
 
     return output
 
@@ -296,17 +319,27 @@ def main():
         )
     )
 
+    exit_if_converged(module, module.params['pn_current_switch'],
+                      'Create vrouter')
+
     global CHANGED_FLAG
     results = []
     message = ''
     loopback_address = module.params['pn_loopback_ip']
     current_switch = module.params['pn_current_switch']
 
+    ip, ipv6 = get_loopback_addresses(module, loopback_address,
+                                      current_switch)
+    config = get_vrouter_config(module, current_switch + '-vrouter')
+
     # Create vrouters
-    message += create_vrouter(module, current_switch)
+    if not config['exists']:
+        message += create_vrouter(module, current_switch, ip)
+        config['router-id'] = ip
 
     # Assign loopback ip to vrouters
-    message += assign_loopback_and_router_id(module, loopback_address, current_switch)
+    message += assign_loopback_and_router_id(module, config, ip, ipv6,
+                                             current_switch)
 
     replace_string = current_switch + ': '
     for line in message.splitlines():
@@ -316,6 +349,8 @@ def main():
                 'output': (line.replace(replace_string, '')).strip()
             })
 
+    save_fingerprint(module)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -324,7 +359,8 @@ def main():
         exception='',
         failed=False,
         changed=True if True in CHANGED_FLAG else False,
-        task='Create vrouter'
+        task='Create vrouter',
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
@@ -104,6 +104,10 @@ msg:
   description: Indicates whether configuration made was successful or failed.
   returned: always
   type: str
+retries:
+  description: Number of cli commands retried after a transient error.
+  returned: always
+  type: int
 """
 
 
@@ -119,7 +123,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = execute_cli(module, cli)
     results = []
     if out:
         return out
@@ -137,7 +141,8 @@ def run_cli(module, cli):
             summary=results,
             task='Configure L2 VRRP',
             msg='L2 VRRP configuration failed',
-            changed=False
+            changed=False,
+            retries=cli_retries()
         )
     else:
         return 'Success'
@@ -176,10 +181,7 @@ def get_vrouter_name(module, switch_name):
     :param switch_name: Name of the switch for which to find the vrouter.
     :return: Vrouter name.
     """
-    cli = pn_cli(module)
-    cli += ' vrouter-show location ' + switch_name
-    cli += ' format name no-show-headers '
-    return run_cli(module, cli).split()[0]
+    return VROUTERS.vrouter(module, run_cli, switch_name)
 
 
 def create_vrouter(module, switch, vrrp_id, vnet_name):
@@ -199,8 +201,7 @@ def create_vrouter(module, switch, vrrp_id, vnet_name):
     clicopy = cli
 
     # Check if vrouter already exists
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli).split()
+    existing_vrouter_names = VROUTERS.vrouters(module, run_cli)
 
     # If vrouter doesn't exists then create it
     if vrouter_name not in existing_vrouter_names:
@@ -355,6 +356,8 @@ def main():
         )
     )
 
+    exit_if_converged(module, '', 'Configure L2 VRRP')
+
     global CHANGED_FLAG
 
     # Configure L2 VRRP
@@ -374,6 +377,8 @@ def main():
                 }
                 results.append(json_msg)
 
+    save_fingerprint(module)
+
     # Exit the module and return the required JSON.
     module.exit_json(
         unreachable=False,
@@ -382,7 +387,8 @@ def main():
         exception='',
         task='Configure L2 VRRP',
         failed=False,
-        changed=True if True in CHANGED_FLAG else False
+        changed=True if True in CHANGED_FLAG else False,
+        retries=cli_retries()
     )
 
 if __name__ == '__main__':
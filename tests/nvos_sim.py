@@ -0,0 +1,241 @@
+"""
+Simulator of the nvOS cli of a fabric, for running the modules off-switch.
+
+The fabric is held as a set of tables of rows. Show commands filter a table
+on the arguments they are given and print the switch column followed by the
+requested format columns, as the cli does with parsable-delim. Add and
+modify commands update the tables and are recorded, so a test can count the
+writes a module run issued.
+"""
+
+import importlib.util
+import os
+import shlex
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'ansible')
+
+# Columns identifying the row a modify command applies to, per table.
+KEYS = {
+    'vrouter': ('name',),
+    'vrouter-interface-config': ('vrouter-name', 'nic'),
+    'system-settings': ('switch',),
+}
+
+# Arguments given without a value, with the values stored for them and for
+# their no- form.
+FLAGS = {
+    'ospf-passive-if': ('true', 'false'),
+    'ospf-bfd': ('true', 'false'),
+    'auto-trunk': ('on', 'off'),
+    'no-show-headers': ('true', 'false'),
+}
+
+
+class ModuleExit(Exception):
+    """
+    Raised by FakeModule in place of exiting the process.
+    """
+
+    def __init__(self, result):
+        Exception.__init__(self, result.get('msg', ''))
+        self.result = result
+
+
+class FakeModule(object):
+    """
+    Stand-in of AnsibleModule filling in the defaults of the argument spec.
+    """
+
+    def __init__(self, params, argument_spec=None, **kwargs):
+        self.params = dict((name, spec.get('default'))
+                           for name, spec in (argument_spec or {}).items())
+        self.params.update(params)
+        self._name = 'pn_sim'
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleExit(kwargs)
+
+
+def load_source(name, path):
+    """
+    Method to load a python file as a module under the given name.
+    :param name: Name to register the module under.
+    :param path: Path of the python file.
+    :return: The loaded module.
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_pn_nvos():
+    """
+    Method to make ansible.module_utils.pn_nvos importable from the tree,
+    along with ansible.module_utils.basic when ansible is not installed.
+    :return: The pn_nvos module.
+    """
+    if 'ansible.module_utils.pn_nvos' in sys.modules:
+        return sys.modules['ansible.module_utils.pn_nvos']
+
+    try:
+        from ansible.module_utils import basic
+    except ImportError:
+        basic = None
+    if basic is None:
+        for name in ('ansible', 'ansible.module_utils'):
+            sys.modules[name] = types.ModuleType(name)
+            sys.modules[name].__path__ = []
+        basic = types.ModuleType('ansible.module_utils.basic')
+        basic.AnsibleModule = FakeModule
+        sys.modules['ansible.module_utils.basic'] = basic
+
+    return load_source('ansible.module_utils.pn_nvos',
+                       os.path.join(ROOT, 'module_utils', 'pn_nvos.py'))
+
+
+def load_module(name):
+    """
+    Method to load a fresh copy of a module, as every run of a module is a
+    process of its own.
+    :param name: Name of the module, e.g. pn_ztp_ospf.
+    :return: The loaded module.
+    """
+    load_pn_nvos()
+    return load_source(name, os.path.join(ROOT, 'modules', name + '.py'))
+
+
+class FabricSim(object):
+    """
+    The tables of a simulated fabric and the writes issued against it.
+    Commands named in errors fail with the error given for them.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.writes = []
+        self.errors = {}
+
+    def add(self, table, **row):
+        """
+        Method to add a row to a table of the fabric.
+        :param table: Name of the table, the command name without -show.
+        :param row: Columns of the row, using the cli argument names.
+        """
+        self.tables.setdefault(table, []).append(
+            dict((column.replace('_', '-'), value)
+                 for column, value in row.items()))
+
+    def rows(self, table, **match):
+        """
+        Method to read the rows of a table matching the given columns.
+        :param table: Name of the table.
+        :param match: Columns the rows must hold, using the cli names.
+        :return: List of the matching rows.
+        """
+        match = dict((column.replace('_', '-'), value)
+                     for column, value in match.items())
+        return [row for row in self.tables.get(table, [])
+                if all(row.get(column) == value
+                       for column, value in match.items())]
+
+    def run_command_timeout(self, cli, timeout=None):
+        """
+        Replacement of pn_nvos.run_command_timeout executing the cli against
+        the simulated fabric.
+        :param cli: The command split into a list of arguments.
+        :param timeout: Ignored.
+        :return: Tuple of return code, output and error of the command.
+        """
+        args = list(cli[1:])
+        while args and (args[0].startswith('-') or args[0] == 'switch-local'):
+            if args[0] == '--user':
+                del args[0]
+            del args[0]
+        switch = None
+        if args[:1] == ['switch']:
+            switch = args[1]
+            args = args[2:]
+        if not args:
+            return 1, '', 'No command'
+
+        command = args[0]
+        params = {}
+        words = args[1:]
+        while words:
+            word = words.pop(0)
+            if word in FLAGS:
+                params[word] = FLAGS[word][0]
+            elif word[len('no-'):] in FLAGS:
+                params[word[len('no-'):]] = FLAGS[word[len('no-'):]][1]
+            elif words:
+                params[word] = words.pop(0)
+            else:
+                return 1, '', 'Missing value for %s' % word
+
+        if command in self.errors:
+            return 1, '', self.errors[command]
+
+        if command.endswith('-show'):
+            return self.show(command[:-len('-show')], switch, params)
+
+        self.writes.append(' '.join(shlex.quote(arg) for arg in args))
+        for verb in ('-add', '-create', '-modify'):
+            if command.endswith(verb):
+                return self.write(command[:-len(verb)], verb, switch, params)
+
+        return 1, '', 'Unknown command %s' % command
+
+    def show(self, table, switch, params):
+        """
+        Method to print the rows of a table matching the show arguments.
+        :param table: Name of the table.
+        :param switch: Switch the command got issued on, whose rows only are
+        shown when the rows of the table carry a switch.
+        :param params: Arguments of the show command.
+        :return: Tuple of return code, output and error of the command.
+        """
+        columns = params.pop('format', '').split(',')
+        delim = params.pop('parsable-delim', ' ')
+        params.pop('no-show-headers', None)
+        lines = []
+        for row in self.rows(table, **params):
+            if switch and row.get('switch', switch) != switch:
+                continue
+            # The cli leads every row with the switch owning it.
+            lines.append(delim.join([row.get('switch', switch or '')] +
+                                    [row.get(column, '')
+                                     for column in columns]))
+        return 0, ''.join(line + '\n' for line in lines), ''
+
+    def write(self, table, verb, switch, params):
+        """
+        Method to apply an add or modify command to a table.
+        :param table: Name of the table.
+        :param verb: One of -add, -create or -modify.
+        :param switch: Switch the command got issued on.
+        :param params: Arguments of the command.
+        :return: Tuple of return code, output and error of the command.
+        """
+        if switch:
+            params.setdefault('switch', switch)
+        if verb != '-modify':
+            self.tables.setdefault(table, []).append(params)
+            return 0, '', ''
+
+        keys = KEYS.get(table, ())
+        match = dict((key, params[key]) for key in keys if key in params)
+        rows = self.rows(table, **match)
+        if len(match) != len(keys) or not rows:
+            return 1, '', '%s-modify: object not found' % table
+        for row in rows:
+            row.update(params)
+        return 0, '', ''
@@ -0,0 +1,104 @@
+"""
+Tests of holding auto-trunk off across the L3 link stages and of restoring
+it when a stage fails.
+"""
+
+import pytest
+
+from nvos_sim import FabricSim, FakeModule, ModuleExit, load_module
+from nvos_sim import load_pn_nvos
+
+OSPF_DATA = '\n'.join([
+    'leaf1, 49, 172.16.0.1/31, 0',
+    'leaf2, 49, 172.16.1.1/31, 0',
+])
+
+
+@pytest.fixture
+def fabric(monkeypatch, tmp_path):
+    """
+    Fabric of two leaves with auto-trunk on and a vrouter each.
+    """
+    pn_nvos = load_pn_nvos()
+    sim = FabricSim()
+    monkeypatch.setattr(pn_nvos, 'run_command_timeout',
+                        sim.run_command_timeout)
+    monkeypatch.setattr(pn_nvos, 'FINGERPRINT_DIR', str(tmp_path))
+    monkeypatch.setattr(pn_nvos, 'JOURNAL', False)
+    pn_nvos.VROUTERS.invalidate()
+
+    for switch in ('leaf1', 'leaf2'):
+        sim.add('system-settings', switch=switch, auto_trunk='on')
+        sim.add('vrouter', name=switch + '-vrouter', location=switch)
+    return sim
+
+
+def run(name, params):
+    """
+    Method to run a module as a fresh process would.
+    :param name: Name of the module.
+    :param params: The module parameters.
+    :return: The result the module exited with.
+    """
+    module = load_module(name)
+    module.AnsibleModule = lambda **kwargs: FakeModule(params, **kwargs)
+    with pytest.raises(ModuleExit) as exit_info:
+        module.main()
+    return exit_info.value.result
+
+
+def auto_trunk(fabric):
+    """
+    Method to read the auto-trunk setting of every switch.
+    :param fabric: The simulated fabric.
+    :return: Dictionary of switch to auto-trunk setting.
+    """
+    return dict((row['switch'], row['auto-trunk'])
+                for row in fabric.rows('system-settings'))
+
+
+def test_ospf_stage_restores_auto_trunk(fabric):
+    result = run('pn_ospf_configuration', {
+        'pn_switch_list': ['leaf1', 'leaf2'],
+        'pn_ospf_data': OSPF_DATA,
+    })
+    assert not result.get('failed')
+    assert auto_trunk(fabric) == {'leaf1': 'on', 'leaf2': 'on'}
+
+
+def test_failed_ospf_stage_restores_auto_trunk(fabric):
+    fabric.errors['vrouter-ospf-add'] = 'vrouter-ospf-add: internal error'
+    result = run('pn_ospf_configuration', {
+        'pn_switch_list': ['leaf1', 'leaf2'],
+        'pn_ospf_data': OSPF_DATA,
+    })
+    assert result['failed']
+    assert 'system-settings-modify no-auto-trunk' in fabric.writes
+    assert auto_trunk(fabric) == {'leaf1': 'on', 'leaf2': 'on'}
+
+
+def test_failed_hold_reports_held_switches(fabric, monkeypatch):
+    fabric.rows('system-settings', switch='leaf2')[0]['auto-trunk'] = 'off'
+    fabric.add('system-settings', switch='leaf3', auto_trunk='on')
+
+    def run_command_timeout(cli, timeout=None):
+        if cli[-3:] == ['leaf3', 'system-settings-modify', 'no-auto-trunk']:
+            return 1, '', 'system-settings-modify: internal error'
+        return fabric.run_command_timeout(cli, timeout)
+
+    pn_nvos = load_pn_nvos()
+    monkeypatch.setattr(pn_nvos, 'run_command_timeout', run_command_timeout)
+    result = run('pn_auto_trunk_bracket', {
+        'pn_action': 'hold',
+        'pn_switch_list': ['leaf1', 'leaf2', 'leaf3'],
+    })
+    assert result['failed']
+    assert result['held'] == ['leaf1']
+
+    result = run('pn_auto_trunk_bracket', {
+        'pn_action': 'release',
+        'pn_switch_list': result['held'],
+    })
+    assert not result.get('failed')
+    assert auto_trunk(fabric) == {'leaf1': 'on', 'leaf2': 'off',
+                                  'leaf3': 'on'}
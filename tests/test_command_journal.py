@@ -0,0 +1,123 @@
+"""
+Tests of the replay and truncation rules of the command journal.
+"""
+
+import json
+
+import pytest
+
+from nvos_sim import FakeModule, ModuleExit, load_pn_nvos
+
+COUNTER = '42 0123456789abcdef'
+
+# Commands of a run failing on its last write.
+RUN = [
+    ('vlan-show', False, 0, '10\n', ''),
+    ('vlan-create id 11', True, 0, '', ''),
+    ('vlan-create id 12', True, 0, '', ''),
+    ('trunk-show', False, 0, 'trunk1\n', ''),
+    ('vlan-create id 13', True, 1, '', 'vlan-create: internal error'),
+    ('vlan-show', False, 0, '10\n11\n12\n', ''),
+]
+
+
+@pytest.fixture
+def pn_nvos(monkeypatch):
+    """
+    The pn_nvos module with the fabric change counter pinned to COUNTER.
+    """
+    pn_nvos = load_pn_nvos()
+    monkeypatch.setattr(pn_nvos, 'config_counter',
+                        lambda module, local_state=(): COUNTER)
+    return pn_nvos
+
+
+def failed_run(pn_nvos, path, entries):
+    """
+    Method to leave the journal of a failed run behind.
+    :param pn_nvos: The pn_nvos module.
+    :param path: Path of the journal.
+    :param entries: List of (command, write, rc, out, err) tuples executed.
+    """
+    module = FakeModule({})
+    journal = pn_nvos.CommandJournal(str(path))
+    journal.watch(module)
+    for entry in entries:
+        journal.record(*entry)
+    with pytest.raises(ModuleExit):
+        module.exit_json(failed=True, msg='failed')
+    journal.close(module)
+
+
+def test_replay_stops_at_last_confirmed_write(pn_nvos, tmp_path):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+
+    journal = pn_nvos.CommandJournal(str(path), COUNTER)
+    for command, write, rc, out, err in RUN[:3]:
+        assert journal.lookup(command)['out'] == out
+    # The read after the last write which went through runs again, as do
+    # the failed write and everything after it.
+    assert journal.lookup('trunk-show') is None
+    assert journal.replayed == 3
+
+
+def test_journal_keeps_only_replayed_entries(pn_nvos, tmp_path):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+    pn_nvos.CommandJournal(str(path), COUNTER).handle.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [entry['cli'] for entry in lines] == [
+        'vlan-show', 'vlan-create id 11', 'vlan-create id 12']
+
+
+def test_diverging_run_stops_replay(pn_nvos, tmp_path):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+
+    journal = pn_nvos.CommandJournal(str(path), COUNTER)
+    assert journal.lookup('vlan-show') is not None
+    assert journal.lookup('vlan-create id 99') is None
+    assert journal.lookup('vlan-create id 12') is None
+
+
+@pytest.mark.parametrize('counter', [None, '43 0123456789abcdef'])
+def test_changed_fabric_replays_nothing(pn_nvos, tmp_path, counter):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+
+    journal = pn_nvos.CommandJournal(str(path), counter)
+    assert journal.lookup('vlan-show') is None
+
+
+def test_expired_journal_replays_nothing(pn_nvos, tmp_path, monkeypatch):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+
+    monkeypatch.setattr(pn_nvos, 'JOURNAL_TTL', -1)
+    journal = pn_nvos.CommandJournal(str(path), COUNTER)
+    assert journal.lookup('vlan-show') is None
+
+
+def test_unstamped_journal_replays_nothing(pn_nvos, tmp_path):
+    path = tmp_path / 'run.journal'
+    failed_run(pn_nvos, path, RUN)
+    # A run killed while writing leaves a truncated line and no stamp.
+    lines = path.read_text().splitlines()
+    path.write_text('\n'.join(lines[:2]) + '\n' + lines[2][:10])
+
+    journal = pn_nvos.CommandJournal(str(path), COUNTER)
+    assert journal.lookup('vlan-show') is None
+
+
+def test_successful_run_removes_journal(pn_nvos, tmp_path):
+    path = tmp_path / 'run.journal'
+    module = FakeModule({})
+    journal = pn_nvos.CommandJournal(str(path))
+    journal.watch(module)
+    journal.record(*RUN[1])
+    with pytest.raises(ModuleExit):
+        module.exit_json(failed=False, msg='done')
+    journal.close(module)
+    assert not path.exists()
@@ -0,0 +1,103 @@
+"""
+Tests of the retries and timeouts of execute_cli and run_command_timeout.
+"""
+
+import sys
+
+import pytest
+
+from nvos_sim import FakeModule, load_pn_nvos
+
+SHOW = ['/usr/bin/cli', '--quiet', 'vlan-show', 'format', 'id']
+CREATE = ['/usr/bin/cli', '--quiet', 'vlan-create', 'id', '10']
+
+
+@pytest.fixture
+def pn_nvos(monkeypatch):
+    """
+    The pn_nvos module with sleeping and the journal turned off.
+    """
+    pn_nvos = load_pn_nvos()
+    monkeypatch.setattr(pn_nvos, 'JOURNAL', False)
+    monkeypatch.setattr(pn_nvos.time, 'sleep', lambda seconds: None)
+    monkeypatch.setitem(pn_nvos.CLI_STATS, 'retries', 0)
+    monkeypatch.setitem(pn_nvos.DEADLINE, 'expires', None)
+    return pn_nvos
+
+
+def replay(pn_nvos, monkeypatch, *results):
+    """
+    Method to make run_command_timeout return the given results in turn.
+    :param pn_nvos: The pn_nvos module.
+    :param results: Tuples of return code, output and error.
+    :return: List the commands run get appended to.
+    """
+    results = list(results)
+    calls = []
+
+    def run_command_timeout(cli, timeout=None):
+        calls.append(cli)
+        return results.pop(0)
+
+    monkeypatch.setattr(pn_nvos, 'run_command_timeout', run_command_timeout)
+    return calls
+
+
+def test_show_is_retried_on_transient_error(pn_nvos, monkeypatch):
+    calls = replay(pn_nvos, monkeypatch, (1, '', 'vlan-show: switch is busy'),
+                   (0, '10\n', ''))
+    assert pn_nvos.execute_cli(FakeModule({}), SHOW) == (0, '10\n', '')
+    assert len(calls) == 2
+    assert pn_nvos.cli_retries() == 1
+
+
+def test_retries_are_bounded(pn_nvos, monkeypatch):
+    busy = (1, '', 'vlan-show: switch is busy')
+    calls = replay(pn_nvos, monkeypatch,
+                   *[busy] * (pn_nvos.CLI_RETRIES + 1))
+    assert pn_nvos.execute_cli(FakeModule({}), SHOW) == busy
+    assert len(calls) == pn_nvos.CLI_RETRIES + 1
+
+
+@pytest.mark.parametrize('err', [
+    'vlan-show: vlan 10 not found',
+    'vlan-show: switch is busy handling vlan 10',
+])
+def test_show_is_not_retried_on_other_errors(pn_nvos, monkeypatch, err):
+    calls = replay(pn_nvos, monkeypatch, (1, '', err))
+    pn_nvos.execute_cli(FakeModule({}), SHOW)
+    assert len(calls) == 1
+
+
+def test_write_is_retried_only_when_rejected(pn_nvos, monkeypatch):
+    calls = replay(pn_nvos, monkeypatch, (1, '', 'vlan-create: switch is busy'))
+    pn_nvos.execute_cli(FakeModule({}), CREATE)
+    assert len(calls) == 1
+
+    calls = replay(pn_nvos, monkeypatch,
+                   (1, '', 'vlan-create: transaction in progress'),
+                   (0, '', ''))
+    assert pn_nvos.execute_cli(FakeModule({}), CREATE) == (0, '', '')
+    assert len(calls) == 2
+
+
+def test_timed_out_command_is_not_retried(pn_nvos, monkeypatch):
+    calls = replay(pn_nvos, monkeypatch,
+                   (pn_nvos.TIMEOUT_RC, '', 'switch is busy'))
+    rc, out, err = pn_nvos.execute_cli(FakeModule({}), SHOW)
+    assert pn_nvos.timed_out(rc)
+    assert len(calls) == 1
+
+
+def test_hanging_command_gets_killed(pn_nvos):
+    cli = [sys.executable, '-c', 'import time; time.sleep(30)']
+    rc, out, err = pn_nvos.run_command_timeout(cli, timeout=0.2)
+    assert rc == pn_nvos.TIMEOUT_RC
+    assert pn_nvos.timed_out(rc)
+
+
+def test_exhausted_budget_runs_nothing(pn_nvos):
+    pn_nvos.set_deadline(1)
+    pn_nvos.DEADLINE['expires'] -= 2
+    rc, out, err = pn_nvos.run_command_timeout(['false'])
+    assert rc == pn_nvos.BUDGET_RC
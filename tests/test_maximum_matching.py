@@ -0,0 +1,104 @@
+"""
+Tests of the maximum matching used to pair leafs into clusters.
+"""
+
+import itertools
+import random
+
+import pytest
+
+from nvos_sim import load_pn_nvos
+
+
+def graph(edges):
+    """
+    Method to build the ordered nodes and neighbors of an undirected graph.
+    :param edges: List of (node, peer) tuples.
+    :return: Tuple of the list of nodes and the neighbors dictionary.
+    """
+    nodes = []
+    neighbors = {}
+    for node, peer in edges:
+        for one, other in ((node, peer), (peer, node)):
+            if one not in neighbors:
+                nodes.append(one)
+                neighbors[one] = []
+            neighbors[one].append(other)
+    return sorted(nodes), neighbors
+
+
+def check_matching(edges, matching):
+    """
+    Method to check that a matching only uses edges of the graph and no
+    node twice.
+    :param edges: List of (node, peer) tuples.
+    :param matching: List of matched (node, peer) tuples.
+    """
+    edges = set(edges) | set((peer, node) for node, peer in edges)
+    assert all(pair in edges for pair in matching)
+    matched = [node for pair in matching for node in pair]
+    assert len(matched) == len(set(matched))
+
+
+def brute_force_size(edges):
+    """
+    Method to find the size of a maximum matching by trying all edge sets.
+    :param edges: List of (node, peer) tuples.
+    :return: Number of pairs in a maximum matching.
+    """
+    for size in range(len(edges), 0, -1):
+        for chosen in itertools.combinations(edges, size):
+            matched = [node for pair in chosen for node in pair]
+            if len(matched) == len(set(matched)):
+                return size
+    return 0
+
+
+@pytest.mark.parametrize('edges', [
+    # A path, where greedy pairing of b with c leaves a and d alone.
+    [('b', 'c'), ('a', 'b'), ('c', 'd')],
+    # An odd cycle with a tail, which needs a blossom to be contracted.
+    [('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd'), ('d', 'e'),
+     ('e', 'f')],
+    # Two triangles joined by an edge.
+    [('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd'), ('d', 'e'),
+     ('e', 'f'), ('f', 'd')],
+    # A five cycle with pendant nodes on every vertex.
+    [('a', 'b'), ('b', 'c'), ('c', 'd'), ('d', 'e'), ('e', 'a'),
+     ('a', 'a1'), ('b', 'b1'), ('c', 'c1'), ('d', 'd1'), ('e', 'e1')],
+    # A star, of which only one edge can be used.
+    [('hub', 'a'), ('hub', 'b'), ('hub', 'c')],
+])
+def test_matching_is_maximum(edges):
+    nodes, neighbors = graph(edges)
+    matching = load_pn_nvos().maximum_matching(nodes, neighbors)
+    check_matching(edges, matching)
+    assert len(matching) == brute_force_size(edges)
+
+
+def test_random_graphs_match_brute_force():
+    generator = random.Random(7)
+    nodes = ['n%d' % index for index in range(8)]
+    pn_nvos = load_pn_nvos()
+    for _ in range(200):
+        edges = [pair for pair in itertools.combinations(nodes, 2)
+                 if generator.random() < 0.3]
+        graph_nodes, neighbors = graph(edges)
+        matching = pn_nvos.maximum_matching(graph_nodes, neighbors)
+        check_matching(edges, matching)
+        assert len(matching) == brute_force_size(edges)
+
+
+def test_matching_is_ordered_and_deterministic():
+    edges = [('leaf4', 'leaf3'), ('leaf2', 'leaf1'), ('leaf2', 'leaf3')]
+    nodes, neighbors = graph(edges)
+    pn_nvos = load_pn_nvos()
+    matching = pn_nvos.maximum_matching(nodes, neighbors)
+    assert matching == [('leaf1', 'leaf2'), ('leaf3', 'leaf4')]
+    assert pn_nvos.maximum_matching(nodes, neighbors) == matching
+
+
+def test_isolated_nodes_stay_unmatched():
+    pn_nvos = load_pn_nvos()
+    assert pn_nvos.maximum_matching(['leaf1', 'leaf2'], {}) == []
+    assert pn_nvos.maximum_matching([], {}) == []
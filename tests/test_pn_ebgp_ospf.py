@@ -0,0 +1,66 @@
+"""
+Tests of the bgp-as and ospf area ids pn_ebgp_ospf derives from the
+clusters of the fabric.
+"""
+
+import pytest
+
+from nvos_sim import FakeModule, load_module
+
+PARAMS = {
+    'pn_spine_list': ['spine1'],
+    'pn_leaf_list': ['leaf1', 'leaf2', 'leaf3', 'leaf4', 'leaf5'],
+    'pn_bgp_as_range': '65000',
+    'pn_ospf_area_id': '0',
+}
+
+CLUSTERS = [
+    ('leaf3-to-leaf4-cluster', 'leaf3', 'leaf4'),
+    ('spine-cluster', 'spine1', 'spine2'),
+    ('leaf1-to-leaf2-cluster', 'leaf2', 'leaf1'),
+]
+
+
+def cluster_index(module, clusters):
+    """
+    Method to build a cluster index adding the clusters in the given order.
+    :param module: The Ansible module to fetch input parameters.
+    :param clusters: List of (name, node1, node2) tuples.
+    :return: Tuple of the loaded pn_ebgp_ospf module and the cluster index.
+    """
+    ebgp_ospf = load_module('pn_ebgp_ospf')
+    index = {'clusters': ebgp_ospf.OrderedDict(), 'nodes': {}}
+    for cluster in clusters:
+        ebgp_ospf.add_cluster_to_index(module, index, *cluster)
+    return ebgp_ospf, index
+
+
+@pytest.mark.parametrize('clusters', [CLUSTERS, CLUSTERS[::-1]])
+def test_clusters_follow_leaf_order(clusters):
+    module = FakeModule(PARAMS)
+    ebgp_ospf, index = cluster_index(module, clusters)
+    assert list(index['clusters']) == [
+        'leaf1-to-leaf2-cluster', 'leaf3-to-leaf4-cluster', 'spine-cluster']
+    assert index['nodes']['leaf1'] == 'leaf1-to-leaf2-cluster'
+
+
+def test_ids_do_not_depend_on_cluster_creation_order():
+    module = FakeModule(PARAMS)
+    ebgp_ospf, index = cluster_index(module, CLUSTERS)
+    assert ebgp_ospf.find_bgp_as_dict(module, index) == {
+        'spine1': '65000',
+        'leaf1': '65001', 'leaf2': '65001',
+        'leaf3': '65002', 'leaf4': '65002',
+        'leaf5': '65003',
+    }
+    assert ebgp_ospf.find_area_id_leaf_switches(module, index) == {
+        'leaf1': '1', 'leaf2': '1',
+        'leaf3': '2', 'leaf4': '2',
+        'leaf5': '3',
+    }
+
+    # A cluster created during the run lands where a re-run reads it.
+    ebgp_ospf, created = cluster_index(module, CLUSTERS[:2])
+    ebgp_ospf.add_cluster_to_index(module, created, *CLUSTERS[2])
+    assert ebgp_ospf.find_bgp_as_dict(module, created) == \
+        ebgp_ospf.find_bgp_as_dict(module, index)
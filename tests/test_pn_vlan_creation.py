@@ -0,0 +1,50 @@
+"""
+Tests of the parsing of the vlan csv data of pn_vlan_creation.
+"""
+
+import pytest
+
+from nvos_sim import FakeModule, ModuleExit, load_module
+
+PARAMS = {'pn_switch': 'leaf1'}
+
+
+def parse(vlan_data):
+    """
+    Method to parse vlan csv data with pn_vlan_creation.
+    :param vlan_data: String of vlan csv data.
+    :return: Dictionary of switch name to vlan id to untagged ports.
+    """
+    module = load_module('pn_vlan_creation')
+    return module.parse_vlan_data(FakeModule(PARAMS), vlan_data)
+
+
+def test_rows_are_grouped_by_switch():
+    switch_vlans = parse('\n'.join([
+        '# switch, vlan id, untagged ports',
+        'leaf1, 10, 1, 2',
+        'leaf2, 10',
+        '',
+        'leaf1, 11',
+    ]))
+    assert list(switch_vlans) == ['leaf1', 'leaf2']
+    assert dict(switch_vlans['leaf1']) == {10: '1,2', 11: None}
+    assert dict(switch_vlans['leaf2']) == {10: None}
+
+
+def test_repeated_vlan_merges_untagged_ports():
+    switch_vlans = parse('\n'.join([
+        'leaf1, 10, 1, 2',
+        'leaf1, 10',
+        'leaf1, 10, 2, 3',
+    ]))
+    assert dict(switch_vlans['leaf1']) == {10: '1,2,3'}
+
+
+@pytest.mark.parametrize('row', ['leaf1, ten, 1', 'leaf1,, 1', 'leaf1'])
+def test_invalid_vlan_id_fails_naming_the_row(row):
+    with pytest.raises(ModuleExit) as exit_info:
+        parse('leaf1, 10\n' + row)
+    result = exit_info.value.result
+    assert result['failed']
+    assert row.replace(' ', '') in result['exception']
@@ -0,0 +1,109 @@
+"""
+Tests of the planning of the spine to leaf eBGP neighbors against a
+simulated fabric.
+"""
+
+import pytest
+
+from nvos_sim import FabricSim, FakeModule, load_module, load_pn_nvos
+
+PARAMS = {
+    'pn_spine_list': ['spine1', 'spine2'],
+    'pn_leaf_list': ['leaf1', 'leaf2', 'leaf3'],
+    'pn_addr_type': 'ipv4',
+}
+
+# leaf1 and leaf2 form a cluster sharing their bgp-as.
+BGP_AS = {
+    'spine1': '65000', 'spine2': '65000',
+    'leaf1': '65001', 'leaf2': '65001',
+    'leaf3': '65002',
+}
+
+# Links as (spine, spine ip, spine ip2, leaf, leaf ip, leaf ip2).
+LINKS = [
+    ('spine1', '172.16.0.0/31', '2001:db8::/127',
+     'leaf3', '172.16.0.1/31', '2001:db8::1/127'),
+    ('spine1', '172.16.0.2/31', '2001:db8::2/127',
+     'leaf1', '172.16.0.3/31', '2001:db8::3/127'),
+    ('spine2', '172.16.1.0/31', '2001:db8:1::/127',
+     'leaf2', '172.16.1.1/31', '2001:db8:1::1/127'),
+]
+
+
+@pytest.fixture
+def fabric(monkeypatch):
+    """
+    Fabric of two spines and three leafs, with an l3 link from a spine to
+    every leaf and an unrelated, unlinked interface on each spine.
+    """
+    pn_nvos = load_pn_nvos()
+    sim = FabricSim()
+    monkeypatch.setattr(pn_nvos, 'run_command_timeout',
+                        sim.run_command_timeout)
+    monkeypatch.setattr(pn_nvos, 'JOURNAL', False)
+    pn_nvos.VROUTERS.invalidate()
+
+    for switch in PARAMS['pn_spine_list'] + PARAMS['pn_leaf_list']:
+        sim.add('vrouter', name=switch + '-vrouter', location=switch)
+    for spine, spine_ip, spine_ip2, leaf, leaf_ip, leaf_ip2 in LINKS:
+        sim.add('vrouter-interface', vrouter_name=spine + '-vrouter',
+                l3_port='49', ip=spine_ip, ip2=spine_ip2)
+        sim.add('vrouter-interface', vrouter_name=leaf + '-vrouter',
+                l3_port='1', ip=leaf_ip, ip2=leaf_ip2)
+    for spine in PARAMS['pn_spine_list']:
+        sim.add('vrouter-interface', vrouter_name=spine + '-vrouter',
+                l3_port='', ip='10.9.9.1/24', ip2='')
+    return sim
+
+
+def plan(params):
+    """
+    Method to plan the bgp neighbors of the simulated fabric.
+    :param params: The module parameters.
+    :return: List of the planned neighbors.
+    """
+    module = load_module('pn_ztp_ebgp')
+    return module.plan_bgp_neighbors(FakeModule(params), BGP_AS)
+
+
+def test_links_pair_spine_and_leaf_addresses(fabric):
+    assert plan(PARAMS) == [
+        ('spine1', 'spine1-vrouter', '172.16.0.1', '65002', False, False),
+        ('spine1', 'spine1-vrouter', '172.16.0.3', '65001', False, False),
+        ('spine2', 'spine2-vrouter', '172.16.1.1', '65001', False, False),
+        ('leaf1', 'leaf1-vrouter', '172.16.0.2', '65000', False, True),
+        ('leaf2', 'leaf2-vrouter', '172.16.1.0', '65000', False, True),
+        ('leaf3', 'leaf3-vrouter', '172.16.0.0', '65000', False, False),
+    ]
+
+
+def test_dual_stack_links_add_ipv6_neighbors(fabric):
+    neighbors = plan(dict(PARAMS, pn_addr_type='ipv4_ipv6'))
+    assert [neighbor for neighbor in neighbors if neighbor[0] == 'leaf3'] == [
+        ('leaf3', 'leaf3-vrouter', '172.16.0.0', '65000', False, False),
+        ('leaf3', 'leaf3-vrouter', '2001:db8::', '65000', True, False),
+    ]
+    assert len(neighbors) == 12
+
+
+def test_configured_neighbors_are_skipped(fabric):
+    fabric.add('vrouter-bgp', vrouter_name='spine1-vrouter',
+               neighbor='172.16.0.1', remote_as='65002')
+    # A neighbor with a stale remote-as is planned again.
+    fabric.add('vrouter-bgp', vrouter_name='leaf3-vrouter',
+               neighbor='172.16.0.0', remote_as='64999')
+    neighbors = plan(PARAMS)
+    assert ('spine1', 'spine1-vrouter', '172.16.0.1', '65002', False,
+            False) not in neighbors
+    assert ('leaf3', 'leaf3-vrouter', '172.16.0.0', '65000', False,
+            False) in neighbors
+    assert len(neighbors) == 5
+
+
+def test_unmatched_interfaces_plan_nothing(fabric):
+    for row in fabric.rows('vrouter-interface', vrouter_name='leaf2-vrouter'):
+        row['ip'] = '172.16.9.1/31'
+    neighbors = plan(PARAMS)
+    assert not [neighbor for neighbor in neighbors
+                if 'spine2' in neighbor[:2] or neighbor[0] == 'leaf2']
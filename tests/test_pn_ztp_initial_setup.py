@@ -0,0 +1,50 @@
+"""
+Tests of the comparison of the switch setup values with their desired
+values.
+"""
+
+import pytest
+
+from nvos_sim import load_module
+
+
+@pytest.fixture
+def same_setup_value():
+    """
+    The same_setup_value method of pn_ztp_initial_setup.
+    """
+    return load_module('pn_ztp_initial_setup').same_setup_value
+
+
+@pytest.mark.parametrize('current, desired', [
+    ('2001:db8::1/64', '2001:db8::1/64'),
+    ('2001:db8::1/64', '2001:0db8:0000:0000:0000:0000:0000:0001/64'),
+    ('2001:DB8::A/64', '2001:db8::a/64'),
+    ('fe80::/10', 'fe80:0:0:0:0:0:0:0/10'),
+    ('2001:db8::1', '2001:db8:0::1'),
+])
+def test_equal_ipv6_spellings_match(same_setup_value, current, desired):
+    assert same_setup_value('mgmt-ip6', current, desired)
+    assert same_setup_value('in-band-ip6', current, desired)
+
+
+@pytest.mark.parametrize('current, desired', [
+    ('2001:db8::1/64', '2001:db8::2/64'),
+    ('2001:db8::1/64', '2001:db8::1/128'),
+    ('2001:db8::1/64', '2001:db8::1'),
+    ('1::/64', '0:10000::/64'),
+    ('2001:db8::1/64', 'not-an-address/64'),
+    ('bogus', '2001:db8::1/64'),
+])
+def test_different_ipv6_values_differ(same_setup_value, current, desired):
+    assert not same_setup_value('mgmt-ip6', current, desired)
+
+
+def test_unset_ipv6_differs(same_setup_value):
+    assert not same_setup_value('mgmt-ip6', '', '2001:db8::1/64')
+
+
+def test_other_fields_compare_as_strings(same_setup_value):
+    assert same_setup_value('mgmt-ip', '10.0.0.1/24', '10.0.0.1/24')
+    assert not same_setup_value('mgmt-ip', '10.0.0.1/24', '10.0.0.01/24')
+    assert not same_setup_value('switch-name', 'Leaf1', 'leaf1')
@@ -0,0 +1,113 @@
+"""
+Tests of the grouping of the L3 VRRP rows and of their parallel dispatch.
+"""
+
+import threading
+
+import pytest
+
+from nvos_sim import FakeModule, ModuleExit, load_module
+
+CSV_DATA = '\n'.join([
+    '# vlan, ip, leaf, leaf, vrrp id, active leaf',
+    '101, 10.1.1.1/24, leaf1, leaf2, 18, leaf1',
+    '102, 10.1.2.1/24, leaf3',
+    '',
+    '103, 10.1.3.1/24, leaf1, leaf2, 19, leaf2',
+])
+
+PARAMS = {
+    'pn_leaf_list': ['leaf1', 'leaf2', 'leaf3'],
+    'pn_csv_data': CSV_DATA,
+    'pn_addr_type': 'ipv4',
+}
+
+
+def test_rows_are_grouped_by_cluster_pair():
+    module = load_module('pn_ztp_l3_vrrp')
+    partitions = module.partition_vrrp_rows(FakeModule(PARAMS), CSV_DATA)
+    assert list(partitions) == [('leaf1', 'leaf2'), ('leaf3',)]
+    assert [row['vlan_id'] for row in partitions[('leaf1', 'leaf2')]] == [
+        '101', '103']
+    assert partitions[('leaf1', 'leaf2')][1] == {
+        'vlan_id': '103',
+        'ip': '10.1.3.1/24',
+        'ipv6': '',
+        'vrrp_id': '19',
+        'active_switch': 'leaf2',
+    }
+    assert partitions[('leaf3',)] == [{
+        'vlan_id': '102',
+        'ip': '10.1.2.1/24',
+        'ipv6': '',
+        'vrrp_id': None,
+        'active_switch': None,
+    }]
+
+
+def test_dual_stack_rows_carry_both_addresses():
+    module = load_module('pn_ztp_l3_vrrp')
+    params = dict(PARAMS, pn_addr_type='ipv4_ipv6')
+    partitions = module.partition_vrrp_rows(
+        FakeModule(params), '101, 10.1.1.1/24, 2001:db8::1/64, leaf3')
+    assert partitions[('leaf3',)][0]['ipv6'] == '2001:db8::1/64'
+
+
+@pytest.fixture
+def dispatch(monkeypatch):
+    """
+    The pn_ztp_l3_vrrp module with the fabric writes replaced by a record
+    of the partitions configured and the threads configuring them.
+    """
+    module = load_module('pn_ztp_l3_vrrp')
+    configured = []
+
+    def configure_partition(worker_module, partition):
+        configured.append((partition[0], threading.current_thread().name))
+
+    monkeypatch.setattr(module, 'create_clusters', lambda *args: None)
+    monkeypatch.setattr(module, 'create_vlans', lambda *args: None)
+    monkeypatch.setattr(module, 'configure_partition', configure_partition)
+    return module, configured
+
+
+@pytest.mark.parametrize('current_switch, expected', [
+    ('leaf1', [('leaf1', 'leaf2')]),
+    ('leaf2', []),
+    ('leaf3', [('leaf3',)]),
+])
+def test_single_worker_configures_own_rows(dispatch, current_switch,
+                                           expected):
+    module, configured = dispatch
+    params = dict(PARAMS, pn_current_switch=current_switch,
+                  pn_parallel_workers=1)
+    module.configure_vrrp(FakeModule(params), CSV_DATA)
+    assert [leaves for leaves, thread in configured] == expected
+
+
+@pytest.mark.parametrize('current_switch', ['leaf1', 'leaf2', 'leaf3'])
+def test_parallel_run_configures_all_rows(dispatch, current_switch):
+    module, configured = dispatch
+    params = dict(PARAMS, pn_current_switch=current_switch,
+                  pn_parallel_workers=4)
+    module.configure_vrrp(FakeModule(params), CSV_DATA)
+    assert sorted(leaves for leaves, thread in configured) == [
+        ('leaf1', 'leaf2'), ('leaf3',)]
+    assert threading.current_thread().name not in [
+        thread for leaves, thread in configured]
+
+
+def test_parallel_failure_exits_once(dispatch, monkeypatch):
+    module, configured = dispatch
+
+    def configure_partition(worker_module, partition):
+        if partition[0] == ('leaf3',):
+            worker_module.exit_json(failed=True, msg='leaf3 failed')
+        configured.append(partition[0])
+
+    monkeypatch.setattr(module, 'configure_partition', configure_partition)
+    params = dict(PARAMS, pn_current_switch='leaf1', pn_parallel_workers=4)
+    with pytest.raises(ModuleExit) as exit_info:
+        module.configure_vrrp(FakeModule(params), CSV_DATA)
+    assert exit_info.value.result == {'failed': True, 'msg': 'leaf3 failed'}
+    assert configured == [('leaf1', 'leaf2')]
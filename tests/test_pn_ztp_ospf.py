@@ -0,0 +1,119 @@
+"""
+Tests of the per-host OSPF stage against a simulated fabric.
+"""
+
+import pytest
+
+from nvos_sim import FabricSim, FakeModule, ModuleExit, load_module
+from nvos_sim import load_pn_nvos
+
+PARAMS = {
+    'pn_current_switch': 'leaf1',
+    'pn_spine_list': ['spine1', 'spine2'],
+    'pn_leaf_list': ['leaf1', 'leaf2'],
+    'pn_ospf_redistribute': 'none',
+}
+
+
+@pytest.fixture
+def fabric(monkeypatch, tmp_path):
+    """
+    Fabric with the vrouter of leaf1 holding a loopback, two l3 links to
+    the spines and a VRRP interface, none of them in OSPF yet.
+    """
+    pn_nvos = load_pn_nvos()
+    sim = FabricSim()
+    monkeypatch.setattr(pn_nvos, 'run_command_timeout',
+                        sim.run_command_timeout)
+    # The fabric counter stays unanswered so that every run diffs the
+    # configuration instead of taking the fingerprint fast path.
+    monkeypatch.setattr(pn_nvos, 'FINGERPRINT_DIR', str(tmp_path))
+    monkeypatch.setattr(pn_nvos, 'JOURNAL', False)
+
+    vrouter = 'leaf1-vrouter'
+    sim.add('vrouter', name=vrouter, ospf_redistribute='')
+    sim.add('vrouter-loopback-interface', vrouter_name=vrouter,
+            ip='10.0.0.1', router_if='eth0.1')
+    for port, ip, nic in (('49', '172.16.0.1/31', 'eth1.4092'),
+                          ('50', '172.16.0.3/31', 'eth2.4092')):
+        sim.add('vrouter-interface', vrouter_name=vrouter, l3_port=port,
+                ip=ip, ip2='', nic=nic, is_vip='false', is_primary='false')
+    sim.add('vrouter-interface', vrouter_name=vrouter, l3_port='',
+            ip='10.10.10.2/24', ip2='', nic='eth3.100', is_vip='false',
+            is_primary='true')
+    sim.add('vrouter-interface', vrouter_name=vrouter, l3_port='',
+            ip='10.10.10.1/24', ip2='', nic='eth4.100', is_vip='true',
+            is_primary='false')
+    return sim
+
+
+def run(params):
+    """
+    Method to run pn_ztp_ospf as a fresh process would.
+    :param params: The module parameters.
+    :return: The result the module exited with.
+    """
+    module = load_module('pn_ztp_ospf')
+    module.AnsibleModule = lambda **kwargs: FakeModule(params, **kwargs)
+    with pytest.raises(ModuleExit) as exit_info:
+        module.main()
+    return exit_info.value.result
+
+
+def test_second_run_issues_no_writes(fabric):
+    first = run(PARAMS)
+    assert not first.get('failed')
+    assert first['changed']
+    assert fabric.writes
+    assert sorted(row['network'] for row in fabric.rows(
+        'vrouter-ospf', vrouter_name='leaf1-vrouter')) == [
+            '10.0.0.1/32', '172.16.0.0/31', '172.16.0.2/31']
+    assert sorted(row['nic'] for row in fabric.rows(
+        'vrouter-interface-config', ospf_passive_if='true')) == [
+            'eth3.100', 'eth4.100']
+
+    del fabric.writes[:]
+    second = run(PARAMS)
+    assert not second.get('failed')
+    assert fabric.writes == []
+    assert second['changed'] is False
+
+
+@pytest.mark.parametrize('shown', ['', 'none'])
+def test_no_redistribute_is_converged(fabric, shown):
+    fabric.rows('vrouter', name='leaf1-vrouter')[0]['ospf-redistribute'] = \
+        shown
+    run(PARAMS)
+    assert not [write for write in fabric.writes
+                if write.startswith('vrouter-modify')]
+
+
+def test_redistribute_change_is_written_once(fabric):
+    params = dict(PARAMS, pn_ospf_redistribute='connected')
+    run(params)
+    assert [write for write in fabric.writes
+            if write.startswith('vrouter-modify')] == [
+                'vrouter-modify name leaf1-vrouter ospf-redistribute '
+                'connected']
+
+    del fabric.writes[:]
+    result = run(params)
+    assert fabric.writes == []
+    assert result['changed'] is False
+
+
+def test_dual_stack_neighbors_are_added_once(fabric):
+    for row in fabric.rows('vrouter-interface', ip='172.16.0.1/31'):
+        row['ip2'] = '2001:db8::1/127'
+    params = dict(PARAMS, pn_addr_type='ipv4_ipv6')
+    run(params)
+    assert sorted(row['nic'] for row in fabric.rows(
+        'vrouter-ospf6', vrouter_name='leaf1-vrouter')) == ['eth1.4092']
+    assert sorted(row['network'] for row in fabric.rows(
+        'vrouter-ospf', vrouter_name='leaf1-vrouter')) == [
+            '10.0.0.1/32', '172.16.0.0/31', '172.16.0.2/31']
+
+    del fabric.writes[:]
+    run(params)
+    assert not [write for write in fabric.writes
+                if write.startswith('vrouter-ospf')]
@@ -0,0 +1,37 @@
+"""
+Tests of the conversion between port lists and the range syntax of the cli.
+"""
+
+import pytest
+
+from nvos_sim import load_pn_nvos
+
+
+@pytest.mark.parametrize('ports, expected', [
+    ('', set()),
+    ('9', {9}),
+    ('1-4,9', {1, 2, 3, 4, 9}),
+    (' 1 , 3-4 ,', {1, 3, 4}),
+    ('4-4', {4}),
+    ('1,mgmt', {1, 'mgmt'}),
+])
+def test_expand_ports(ports, expected):
+    assert load_pn_nvos().expand_ports(ports) == expected
+
+
+@pytest.mark.parametrize('ports, expected', [
+    ([], ''),
+    ([9], '9'),
+    ([4, 1, 2, 3, 9], '1-4,9'),
+    (['2', '1', '2'], '1-2'),
+    ([1, 3, 5], '1,3,5'),
+    ([10, 11, 12, 14, 15], '10-12,14-15'),
+])
+def test_compress_ports(ports, expected):
+    assert load_pn_nvos().compress_ports(ports) == expected
+
+
+@pytest.mark.parametrize('ports', ['1-4,9', '1,3,5', '1-64', '7,9-10,12'])
+def test_compress_reverses_expand(ports):
+    pn_nvos = load_pn_nvos()
+    assert pn_nvos.compress_ports(pn_nvos.expand_ports(ports)) == ports
@@ -0,0 +1,75 @@
+"""
+Tests of the lookups of PrefixIndex.
+"""
+
+import pytest
+
+from nvos_sim import load_pn_nvos
+
+
+@pytest.fixture
+def index():
+    """
+    Index of a /16, two /24 inside it, a /31 and a host route.
+    """
+    index = load_pn_nvos().PrefixIndex()
+    index.add('10.1.0.0/16', 'aggregate')
+    index.add('10.1.1.0/24', 'area1')
+    index.add('10.1.2.7/24', 'area2')
+    index.add('172.16.0.0/31', 'link')
+    index.add('192.168.0.1/32', 'loopback')
+    return index
+
+
+def test_get_normalizes_the_network(index):
+    assert index.get('10.1.2.0/24') == 'area2'
+    assert index.get('10.1.2.200/24') == 'area2'
+    assert index.get('10.1.3.0/24') is None
+    assert index.get('10.1.3.0/24', 'none') == 'none'
+
+
+@pytest.mark.parametrize('network, expected', [
+    # Contained in the /16 and one /24.
+    ('10.1.1.128/25', ['10.1.0.0/16', '10.1.1.0/24']),
+    # Containing both /24, the /16 overlaps by containing it.
+    ('10.1.0.0/22', ['10.1.0.0/16', '10.1.1.0/24', '10.1.2.0/24']),
+    # Containing everything indexed under 10.0.0.0/8.
+    ('10.0.0.0/8', ['10.1.0.0/16', '10.1.1.0/24', '10.1.2.0/24']),
+    ('10.1.3.0/24', ['10.1.0.0/16']),
+    ('10.2.0.0/16', []),
+    ('172.16.0.1/31', ['172.16.0.0/31']),
+    ('172.16.0.2/31', []),
+    ('192.168.0.0/24', ['192.168.0.1/32']),
+    ('192.168.0.2/32', []),
+    ('0.0.0.0/0', ['10.1.0.0/16', '10.1.1.0/24', '10.1.2.0/24',
+                   '172.16.0.0/31', '192.168.0.1/32']),
+])
+def test_overlapping(index, network, expected):
+    assert [found for found, value in index.overlapping(network)] == expected
+
+
+def test_overlapping_returns_values(index):
+    assert index.overlapping('10.1.1.1/32') == [
+        ('10.1.0.0/16', 'aggregate'), ('10.1.1.0/24', 'area1')]
+
+
+def test_overlapping_matches_a_scan(index):
+    pn_nvos = load_pn_nvos()
+
+    def scan(network):
+        start, prefix = index.key(network)
+        end = start | (~pn_nvos.ipv4_prefix_mask(prefix) & 0xffffffff)
+        found = []
+        for key in sorted(index.values):
+            key_end = key[0] | (~pn_nvos.ipv4_prefix_mask(key[1]) &
+                                0xffffffff)
+            if key[0] <= end and start <= key_end:
+                found.append('%s/%s' % (pn_nvos.int_to_ipv4(key[0]),
+                                        key[1]))
+        return found
+
+    for third in range(0, 4):
+        for prefix in (8, 16, 23, 24, 25, 30, 32):
+            network = '10.1.%d.0/%d' % (third, prefix)
+            assert [found for found, value in
+                    index.overlapping(network)] == scan(network)